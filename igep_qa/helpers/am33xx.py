@@ -5,8 +5,9 @@ This provides various AM33XX/IGEP related helper functions.
 
 """
 
-from igep_qa.helpers.common import QMmap, QCpuinfo
-import commands
+from igep_qa.helpers.board import get_board
+from igep_qa.helpers.common import QMmap
+from igep_qa.helpers.mixer import apply_profile
 
 def am335x_get_mac_id0():
     """ The AM335x has a pair of unique MAC IDs.
@@ -46,11 +47,12 @@ def cpu_is_am33xx():
     """ Returns True if machine is AM33xx, otherwise returns False
 
     """
-    cpu = QCpuinfo()
-    if cpu["Hardware"] == "Generic AM33XX (Flattened Device Tree)":
-        return True
-    # otherwise
-    return False
+    return get_board().soc == "am33xx"
+
+# Mixer settings to playback/capture via headset, see QMixer
+IGEP0034_HEADSET = [
+    ("sset", "PCM,0", "127"),
+]
 
 def igep0034_set_headset_amixer_settings(headset):
     """ Set amixer settings to playback/capture via headset,
@@ -58,5 +60,7 @@ def igep0034_set_headset_amixer_settings(headset):
     Make sure that the following amixer settings are done for the corresponding
     card (check the card no. by running the command cat /proc/asound/cards).
 
+    Returns the list of settings that could not be set, empty on success.
+
     """
-    commands.getoutput("amixer -c %s sset 'PCM' 127" % headset)
+    return apply_profile(headset, "igep0034-headset", IGEP0034_HEADSET)
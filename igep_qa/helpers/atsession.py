@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+
+"""
+This provides an AT command session for modems.
+
+Every command is answered as soon as its final result code is received, the
+echo is removed, the unsolicited result codes are set apart and the
+information lines can be parsed into values.
+
+"""
+
+import re
+
+from collections import namedtuple
+
+from igep_qa.helpers.common import monotonic
+from igep_qa.helpers.serialport import QSerialPort
+
+# Final result codes in verbose format (ATV1)
+FINAL = ("OK", "ERROR", "NO CARRIER", "NO DIALTONE", "BUSY", "NO ANSWER")
+FINAL_PREFIXES = ("+CME ERROR:", "+CMS ERROR:", "CONNECT")
+
+# Unsolicited result codes, a line with one of these prefixes is not part
+# of the response unless the command asks for it (e.g. AT+CREG?)
+URCS = ("RING", "+CRING:", "+CREG:", "+CGREG:", "+CMTI:", "+CLIP:",
+        "+CUSD:", "#QSS:")
+
+def is_final(line):
+    """ Returns True if the line is a final result code.
+
+    """
+    return line in FINAL or line.startswith(FINAL_PREFIXES)
+
+def _value(field):
+    if len(field) > 1 and field.startswith('"') and field.endswith('"'):
+        return field[1:-1]
+    if re.match(r"^-?\d+$", field):
+        return int(field)
+    return field
+
+def parse_values(text):
+    """ Returns the list of values of a response, separated by commas. The
+    numbers are returned as int and the quoted strings without quotes, e.g.
+    '17,99,"IGEP"' is [17, 99, 'IGEP']
+
+    """
+    text = text.strip()
+    if not text:
+        return [ ]
+    fields, field, quoted = [ ], "", False
+    for c in text:
+        if c == '"':
+            quoted = not quoted
+        elif c == "," and not quoted:
+            fields.append(field)
+            field = ""
+            continue
+        field += c
+    fields.append(field)
+    return [_value(f.strip()) for f in fields]
+
+class QATResponse(namedtuple("QATResponse", "command result lines raw duration")):
+    """ Response to an AT command.
+
+    Attributes:
+        - command: The command sent, e.g. AT+CSQ
+        - result: The final result code, e.g. OK or +CME ERROR: 10, None if
+                  the modem did not answer before the timeout.
+        - lines: The information lines, without echo and unsolicited result
+                 codes.
+        - raw: Everything received, for error reports.
+        - duration: Time from the command sent to the final result code, in
+                    seconds.
+
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.result == "OK"
+
+    @property
+    def error(self):
+        """ Returns the code of a +CME ERROR or +CMS ERROR, None otherwise.
+
+        """
+        if self.result and self.result.startswith(("+CME ERROR:", "+CMS ERROR:")):
+            value = self.result.split(":", 1)[1].strip()
+            return int(value) if value.isdigit() else value
+        return None
+
+    def values(self, prefix=None):
+        """ Returns the parsed values of every information line.
+
+        Keyword arguments:
+            - prefix: Only the lines with this prefix, e.g. "+CSQ:", which
+                      is removed. By default the prefix of the command.
+
+        """
+        if prefix is None:
+            prefix = command_prefix(self.command)
+        retval = [ ]
+        for line in self.lines:
+            if prefix and line.startswith(prefix):
+                retval.append(parse_values(line[len(prefix):]))
+            elif not prefix:
+                retval.append(parse_values(line))
+        return retval
+
+    def value(self, prefix=None):
+        """ Returns the parsed values of the first information line, see
+        values(), or None.
+
+        """
+        values = self.values(prefix)
+        return values[0] if values else None
+
+def command_prefix(command):
+    """ Returns the prefix of the information lines of a command, e.g.
+    '+CSQ:' for AT+CSQ and '+CREG:' for AT+CREG?, or None for basic commands.
+
+    """
+    m = re.match(r"(?i)^AT([+#$%][A-Z0-9]+)", command.strip())
+    return m.group(1).upper() + ":" if m else None
+
+class QATSession:
+    """ AT command session on a serial port.
+
+    Keyword arguments:
+        - port: The serial device or a QSerialPort.
+        - baudrate: The baud rate.
+        - timeout: Default maximum time to wait for a final result code, in
+                   seconds.
+        - urcs: Prefixes of the unsolicited result codes.
+        - callback: Optional function called with every unsolicited result
+                    code received.
+
+    """
+    def __init__(self, port, baudrate=115200, timeout=5, urcs=URCS,
+                 callback=None):
+        if isinstance(port, QSerialPort):
+            self.port = port
+        else:
+            self.port = QSerialPort(port, baudrate)
+        self.timeout = timeout
+        self.urcs_prefixes = tuple(urcs)
+        self.callback = callback
+        # (timestamp, line) of every unsolicited result code received
+        self.urcs = [ ]
+
+    def close(self):
+        self.port.close()
+
+    def _urc(self, line):
+        self.urcs.append((monotonic(), line))
+        if self.callback is not None:
+            self.callback(line)
+
+    def _readline(self, deadline):
+        # Returns the next non empty lines and the data read, or None after
+        # the deadline
+        while True:
+            data = self.port.readline(deadline - monotonic())
+            if not data:
+                return None, ""
+            lines = [l.strip() for l in re.split(r"[\r\n]", data)]
+            lines = [l for l in lines if l]
+            if lines:
+                return lines, data
+
+    def poll(self, timeout=0):
+        """ Read the unsolicited result codes received while idle.
+
+        Returns the list of lines read.
+
+        """
+        retval = [ ]
+        deadline = monotonic() + timeout
+        while True:
+            lines, _ = self._readline(deadline)
+            if lines is None:
+                return retval
+            for line in lines:
+                self._urc(line)
+                retval.append(line)
+
+    def _response(self, command, start, deadline, echoes):
+        # echoes are the commands sent whose echo has not been received yet,
+        # the echo of a pipelined command may come before the final result
+        # code of the previous one
+        prefix = command_prefix(command)
+        lines, raw = [ ], ""
+        while True:
+            received, data = self._readline(deadline)
+            if received is None:
+                return QATResponse(command, None, lines, raw,
+                                   monotonic() - start)
+            raw += data
+            for line in received:
+                if line.upper() in echoes:
+                    echoes.remove(line.upper())
+                elif is_final(line):
+                    return QATResponse(command, line, lines, raw,
+                                       monotonic() - start)
+                elif (line.startswith(self.urcs_prefixes) and
+                      not (prefix and line.startswith(prefix))):
+                    self._urc(line)
+                else:
+                    lines.append(line)
+
+    def command(self, command, timeout=None):
+        """ Send an AT command and read its response up to the final result
+        code.
+
+        Returns a QATResponse.
+
+        Keyword arguments:
+            - command: The AT command without terminator, e.g. AT+CSQ
+            - timeout: Maximum time to wait for the final result code.
+
+        """
+        return self.script([command], timeout)[0]
+
+    def script(self, commands, timeout=None, window=1, stop_on_error=False):
+        """ Send several AT commands, each one is sent as soon as there is
+        room in the window, without waiting any fixed time.
+
+        Returns the list of QATResponse, one per command sent.
+
+        Keyword arguments:
+            - commands: List of AT commands without terminator.
+            - timeout: Maximum time to wait for every final result code.
+            - window: Maximum number of commands sent without final result
+                      code. Check the modem supports it before using more
+                      than one, many modems drop commands received while
+                      busy.
+            - stop_on_error: Do not send the next commands after a command
+                             that fails.
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+        # Unsolicited result codes received while idle
+        self.poll()
+        responses = [ ]
+        pending = [ ]
+        echoes = [ ]
+        index = 0
+        while index < len(commands) or pending:
+            while index < len(commands) and len(pending) < window:
+                command = commands[index]
+                self.port.write(command + "\r", timeout)
+                pending.append((command, monotonic()))
+                echoes.append(command.strip().upper())
+                index += 1
+            command, start = pending.pop(0)
+            response = self._response(command, start, start + timeout, echoes)
+            responses.append(response)
+            if response.result is None:
+                # no answer, the pipelined responses can't be matched
+                self.port.flush()
+                for command, start in pending:
+                    responses.append(QATResponse(command, None, [ ], "",
+                                                 monotonic() - start))
+                pending = [ ]
+            if not response.ok and stop_on_error:
+                index = len(commands)
+        return responses
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QATSession
+# -----------------------------------------------------------------------------
+import os
+import pty
+import select
+import threading
+import time
+import unittest
+
+class QFakeModem:
+    """ A modem on a pty master, the session uses the slave.
+
+    Keyword arguments:
+        - answers: Dictionary of command (upper case) to (lines, result).
+        - delay: Time to process every command, in seconds.
+
+    """
+    ANSWERS = {
+        "AT": ([ ], "OK"),
+        "AT+CPIN=5555": ([ ], "OK"),
+        "AT+CPIN?": ([ ], "+CME ERROR: 10"),
+        "AT+CSQ": (["+CSQ: 17,99"], "OK"),
+        "AT+CGMI": (["Telit"], "OK"),
+        "AT+CREG?": (["+CREG: 0,1"], "OK"),
+        "AT+COPS?": (['+COPS: 0,0,"IGEP Mobile"'], "OK"),
+    }
+
+    def __init__(self, answers=None, delay=0.001):
+        self.master, self.slave = pty.openpty()
+        self.path = os.ttyname(self.slave)
+        self.answers = answers or self.ANSWERS
+        self.delay = delay
+        self.echo = True
+        self.received = [ ]
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def urc(self, line):
+        os.write(self.master, "\r\n%s\r\n" % line)
+
+    def answer(self, command):
+        self.received.append(command)
+        if command.upper() in ("ATE0", "ATE1"):
+            self.echo = command.upper() == "ATE1"
+            lines, result = [ ], "OK"
+        else:
+            lines, result = self.answers.get(command.upper(), ([ ], "ERROR"))
+        time.sleep(self.delay)
+        for line in lines:
+            os.write(self.master, "\r\n%s\r\n" % line)
+            if command.upper() == "AT+CSQ":
+                # a network registration in the middle of a response
+                self.urc("+CREG: 1")
+        os.write(self.master, "\r\n%s\r\n" % result)
+
+    def run(self):
+        buf = ""
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.02)
+            if not ready:
+                continue
+            buf += os.read(self.master, 4096)
+            while "\r" in buf:
+                command, buf = buf.split("\r", 1)
+                if self.echo:
+                    os.write(self.master, command + "\r")
+                self.answer(command.strip())
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+class TestClassQATSession(unittest.TestCase):
+    """ Unittest for class QATSession
+
+    """
+    def setUp(self):
+        self.modem = QFakeModem()
+        self.session = QATSession(self.modem.path, timeout=1)
+
+    def tearDown(self):
+        self.session.close()
+        self.modem.close()
+
+    def test_command(self):
+        retval = self.session.command("AT")
+        self.failUnless(retval.ok and retval.lines == [ ] and
+                        retval.duration < 0.5,
+            "Error: Unexpected response %s" % repr(retval))
+
+    def test_parse(self):
+        retval = self.session.command("AT+CSQ")
+        self.failUnless(retval.value() == [17, 99],
+            "Error: Unexpected response %s" % repr(retval))
+        self.failUnless(self.session.urcs[-1][1] == "+CREG: 1",
+            "Error: Unexpected URCs %s" % repr(self.session.urcs))
+        retval = self.session.command("AT+COPS?")
+        self.failUnless(retval.value() == [0, 0, "IGEP Mobile"],
+            "Error: Unexpected response %s" % repr(retval))
+        # the prefix of an URC is part of the response when asked for
+        retval = self.session.command("AT+CREG?")
+        self.failUnless(retval.value() == [0, 1],
+            "Error: Unexpected response %s" % repr(retval))
+
+    def test_errors(self):
+        retval = self.session.command("AT+CPIN?")
+        self.failUnless(retval.error == 10 and not retval.ok,
+            "Error: Unexpected response %s" % repr(retval))
+        retval = self.session.command("AT+FOO")
+        self.failUnless(retval.result == "ERROR",
+            "Error: Unexpected response %s" % repr(retval))
+
+    def test_no_echo(self):
+        self.session.command("ATE0")
+        retval = self.session.command("AT+CGMI")
+        self.failUnless(retval.ok and retval.lines == ["Telit"],
+            "Error: Unexpected response %s" % repr(retval))
+
+    def test_idle_urc(self):
+        self.modem.urc("RING")
+        retval = self.session.command("AT")
+        self.failUnless(retval.ok and self.session.urcs[-1][1] == "RING",
+            "Error: Unexpected URCs %s" % repr(self.session.urcs))
+
+    def test_script(self):
+        commands = ["AT", "AT+CGMI", "AT+CSQ", "AT+CPIN?", "AT+CPIN=5555"]
+        retval = self.session.script(commands, window=3)
+        self.failUnless([r.command for r in retval] == commands and
+                        [r.ok for r in retval] == [True, True, True, False, True],
+            "Error: Unexpected responses %s" % repr(retval))
+        retval = self.session.script(commands, stop_on_error=True)
+        self.failUnless(len(retval) == 4,
+            "Error: Unexpected responses %s" % repr(retval))
+
+    def test_timeout(self):
+        self.modem.delay = 0.5
+        retval = self.session.command("AT", timeout=0.1)
+        self.failUnless(retval.result is None,
+            "Error: Unexpected response %s" % repr(retval))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+This provides helpers to play and capture audio at the same time.
+
+The capture is streamed from arecord through a pipe and analysed while it
+arrives, without temporary files.
+
+"""
+
+import math
+import os
+import select
+import threading
+
+from igep_qa.helpers.command import QProcess
+from igep_qa.helpers.common import monotonic
+from igep_qa.helpers.dtmf import QDtmfDetector, samples_from_pcm
+
+class QAudioLoopback:
+    """ Play a file and capture the audio input at the same time.
+
+    Keyword arguments:
+        - device: Optional PCM device name, passed to arecord (and aplay)
+                  with the -D option.
+        - rate: The capture sample rate, in Hz.
+        - play_device: If False aplay uses the default device.
+
+    """
+    def __init__(self, device='', rate=8000, play_device=True):
+        self.device = device
+        self.rate = rate
+        self.play_device = play_device
+
+    def _device_args(self):
+        return ["-D%s" % self.device] if self.device else [ ]
+
+    def recorder(self, duration, channels=1):
+        """ Start arecord writing S16_LE raw samples to its output.
+
+        """
+        return QProcess(["arecord"] + self._device_args() +
+                        ["-t", "raw", "-c", str(channels), "-r", str(self.rate),
+                         "-f", "S16_LE", "-d", str(int(math.ceil(duration))), "-q"],
+                        stderr=False)
+
+    def player(self, path):
+        """ Start aplay playing a WAV file, '-' is its standard input, see
+        stream().
+
+        """
+        args = self._device_args() if self.play_device else [ ]
+        return QProcess(["aplay"] + args + ["-t", "wav", "-q", path],
+                        stdin="" if path == "-" else None, output=False)
+
+    def _feed(self, player, data):
+        # Write the WAV data to aplay while it plays, it fails when aplay
+        # is killed before the end
+        try:
+            player.process.stdin.write(data)
+            player.process.stdin.close()
+        except (IOError, OSError, ValueError):
+            pass
+
+    def stream(self, path, consumer, duration=5, grace=1.0, chunk=0.1,
+               channels=1, data=None):
+        """ Play a file while the capture is fed to a consumer.
+
+        The capture stops when the consumer returns True, when the recording
+        time ends or 'grace' seconds after the file has been played (the
+        audio path and the capture buffer add some latency).
+
+        Returns the time spent, in seconds.
+
+        Keyword arguments:
+            - path: The WAV file to be played.
+            - consumer: Callable called with every chunk of S16_LE data,
+                        returns True to stop the capture.
+            - duration: Maximum recording time, in seconds.
+            - grace: Time to keep capturing after the file has been played.
+            - chunk: Size of the chunks, in seconds.
+            - channels: Number of channels captured.
+            - data: WAV data played instead of the file, it is streamed to
+                    aplay through a pipe, path is ignored.
+
+        """
+        start = monotonic()
+        recorder = self.recorder(duration, channels)
+        if recorder.process is None:
+            raise OSError("Can't execute arecord: %s" % recorder.result.output)
+        player = self.player(path if data is None else "-")
+        writer = None
+        if data is not None and player.process is not None:
+            writer = threading.Thread(target=self._feed, args=(player, data))
+            writer.daemon = True
+            writer.start()
+        fd = recorder.process.stdout.fileno()
+        size = int(self.rate * chunk) * 2 * channels
+        deadline = start + duration + grace
+        played = None
+        pending = ""
+        try:
+            while monotonic() < deadline:
+                if played is None and (player.process is None or
+                                       player.process.poll() is not None):
+                    played = monotonic()
+                if played is not None and monotonic() - played > grace:
+                    break
+                ready, _, _ = select.select([fd], [], [], chunk)
+                if not ready:
+                    continue
+                data = os.read(fd, size)
+                if not data:
+                    # arecord finished
+                    break
+                # keep the incomplete frame for the next chunk
+                data = pending + data
+                frames = len(data) - len(data) % (2 * channels)
+                data, pending = data[:frames], data[frames:]
+                if consumer(data):
+                    break
+        finally:
+            # aplay may hang (e.g. IGEP0046 kernel bug), kill both
+            player.kill()
+            recorder.kill()
+            if writer is not None:
+                writer.join(5)
+            player.wait(5)
+            recorder.wait(5)
+        return monotonic() - start
+
+    def detect_dtmf(self, path, expected, duration=5, grace=1.0):
+        """ Play a file with DTMF tones and detect them in the capture.
+
+        The capture stops as soon as the expected digits are detected.
+
+        Returns the list of QDtmfDigit detected.
+
+        Keyword arguments:
+            - path: The WAV file to be played.
+            - expected: The sequence of digits expected, e.g. "5"
+            - duration: Maximum recording time, in seconds.
+            - grace: Time to keep capturing after the file has been played.
+
+        """
+        detector = QDtmfDetector(self.rate)
+
+        def consumer(data):
+            detector.feed(samples_from_pcm(data))
+            return expected in detector.sequence()
+
+        self.stream(path, consumer, duration, grace)
+        detector.finish()
+        return detector.digits
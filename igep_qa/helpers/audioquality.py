@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+
+"""
+This provides an audio quality analyser for the audio loopback tests.
+
+A stimulus with a single tone segment and a multi-tone segment for every
+channel is played and the capture is analysed with FFTs to get the level,
+the THD+N, the frequency response and the crosstalk between channels.
+
+The analyser requires numpy.
+
+"""
+
+import StringIO
+import math
+import wave
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Multi-tone frequencies, the ones above 45% of the sample rate are dropped
+FREQS = (100, 200, 500, 1000, 2000, 5000, 10000, 15000)
+
+# Default limits, see check()
+LIMITS = {
+    'min_level': -30.0,
+    'max_level': -0.5,
+    'max_thdn': -40.0,
+    'max_ripple': 6.0,
+    'max_crosstalk': -40.0,
+}
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("Can't find numpy, required by the audio analyser")
+
+class QAudioStimulus:
+    """ Stimulus for the audio analyser.
+
+    The stimulus has these segments, separated by silence:
+        - 'tone': A single tone on all channels, for the level and THD+N.
+        - 'ch0', 'ch1', ...: A multi-tone on a channel and silence on the
+                             others, for the response and the crosstalk.
+
+    The frequencies are rounded to a multiple of rate / window, so every
+    window of the analysis holds a whole number of periods.
+
+    Keyword arguments:
+        - rate: The sample rate, in Hz.
+        - channels: Number of channels.
+        - tone: Frequency of the single tone, in Hz.
+        - freqs: Frequencies of the multi-tone, in Hz.
+        - amplitude: Peak amplitude, 1.0 is the full scale.
+        - segment: Duration of every segment, in seconds.
+        - gap: Duration of the silence between segments, in seconds.
+        - window: Duration of the analysis window, in seconds.
+
+    """
+    def __init__(self, rate=48000, channels=2, tone=1000, freqs=FREQS,
+                 amplitude=0.5, segment=0.3, gap=0.1, window=0.1):
+        _require_numpy()
+        self.rate = rate
+        self.channels = channels
+        self.window = int(rate * window)
+        resolution = float(rate) / self.window
+        self.tone = round(tone / resolution) * resolution
+        self.freqs = sorted(set(round(f / resolution) * resolution
+                                for f in freqs if f < 0.45 * rate))
+        self.amplitude = amplitude
+        self.segment = int(rate * segment)
+        self.gap = int(rate * gap)
+        names = ['tone'] + ['ch%d' % c for c in range(channels)]
+        self.segments = [(name, i * (self.segment + self.gap))
+                         for i, name in enumerate(names)]
+
+    @property
+    def duration(self):
+        """ Returns the duration of the stimulus, in seconds.
+
+        """
+        return float(len(self.segments) * (self.segment + self.gap)) / self.rate
+
+    def multitone(self):
+        n = numpy.arange(self.segment)
+        # Newman phases keep the crest factor low
+        k = numpy.arange(len(self.freqs))
+        phases = numpy.pi * k * k / len(self.freqs)
+        signal = numpy.sum(numpy.sin(2 * numpy.pi * numpy.outer(self.freqs, n) /
+                                     self.rate + phases[:, None]), axis=0)
+        return self.amplitude * signal / numpy.max(numpy.abs(signal))
+
+    def samples(self):
+        """ Returns the stimulus as an array of (frames, channels) in
+        [-1.0, 1.0]
+
+        """
+        total = len(self.segments) * (self.segment + self.gap)
+        data = numpy.zeros((total, self.channels))
+        n = numpy.arange(self.segment)
+        tone = self.amplitude * numpy.sin(2 * numpy.pi * self.tone * n / self.rate)
+        multitone = self.multitone()
+        for name, start in self.segments:
+            if name == 'tone':
+                data[start:start + self.segment, :] = tone[:, None]
+            else:
+                data[start:start + self.segment, int(name[2:])] = multitone
+        return data
+
+    def write(self, path):
+        """ Write the stimulus to a 16-bit WAV file.
+
+        """
+        write_wav(path, self.samples(), self.rate)
+
+    def wav(self):
+        """ Returns the stimulus as 16-bit WAV data, e.g. to be played from
+        the standard input of aplay without a temporary file.
+
+        """
+        data = StringIO.StringIO()
+        write_wav(data, self.samples(), self.rate)
+        return data.getvalue()
+
+def write_wav(path, samples, rate):
+    """ Write (frames, channels) samples in [-1.0, 1.0] to a 16-bit WAV file,
+    path can also be a file object.
+
+    """
+    _require_numpy()
+    samples = numpy.asarray(samples)
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    data = numpy.clip(numpy.round(samples * 32767), -32768, 32767)
+    fd = wave.open(path, "wb")
+    fd.setnchannels(samples.shape[1])
+    fd.setsampwidth(2)
+    fd.setframerate(rate)
+    frames = data.astype("<i2")
+    # tobytes() is not available in old numpy versions
+    fd.writeframes(frames.tobytes() if hasattr(frames, "tobytes")
+                   else frames.tostring())
+    fd.close()
+
+def samples_from_pcm(data, channels):
+    """ Returns S16_LE PCM data as (frames, channels) samples in [-1.0, 1.0]
+
+    """
+    _require_numpy()
+    data = data[:len(data) - len(data) % (2 * channels)]
+    samples = numpy.frombuffer(data, dtype="<i2").astype(numpy.float64) / 32768
+    return samples.reshape(-1, channels)
+
+def read_wav(path):
+    """ Returns the sample rate and the (frames, channels) samples of a
+    16-bit WAV file.
+
+    """
+    fd = wave.open(path, "rb")
+    try:
+        if fd.getsampwidth() != 2:
+            raise ValueError("%s: only 16-bit samples are supported" % path)
+        data = fd.readframes(fd.getnframes())
+        return fd.getframerate(), samples_from_pcm(data, fd.getnchannels())
+    finally:
+        fd.close()
+
+def _db(ratio):
+    return 10 * math.log10(max(ratio, 1e-20))
+
+class QAudioAnalysis:
+    """ Result of the analysis of a capture.
+
+    Attributes:
+        - level: Level of the tone in every channel, in dBFS.
+        - thdn: THD+N of the tone in every channel, in dB.
+        - response: Level of every frequency of the multi-tone relative to
+                    their mean, in dB, as a list (one per channel) of
+                    {frequency: dB} dictionaries.
+        - ripple: Difference between the highest and the lowest level of
+                  the response of every channel, in dB.
+        - crosstalk: Worst level of every channel in the other channels,
+                     relative to its own level, in dB.
+
+    """
+    def __init__(self, stimulus, capture):
+        _require_numpy()
+        self.stimulus = stimulus
+        capture = numpy.asarray(capture, dtype=numpy.float64)
+        if capture.ndim == 1:
+            capture = capture[:, None]
+        self.channels = min(capture.shape[1], stimulus.channels)
+        self.onset = self.find_onset(capture)
+        self.level = [ ]
+        self.thdn = [ ]
+        self.response = [ ]
+        self.ripple = [ ]
+        self.crosstalk = [ ]
+        spectra = dict((name, self.spectrum(capture, start))
+                       for name, start in stimulus.segments)
+        for c in range(self.channels):
+            self.level.append(self.tone_level(spectra['tone'], c))
+            self.thdn.append(self.tone_thdn(spectra['tone'], c))
+            own = self.powers(spectra['ch%d' % c], c)
+            mean = numpy.mean(own)
+            self.response.append(dict((f, round(_db(p / mean), 2))
+                                      for f, p in zip(stimulus.freqs, own)))
+            self.ripple.append(round(_db(max(own) / max(min(own), 1e-20)), 2))
+            if self.channels > 1:
+                other = [self.powers(spectra['ch%d' % c], o)
+                         for o in range(self.channels) if o != c]
+                self.crosstalk.append(round(max(_db(max(p / own)) for p in other), 2))
+
+    def find_onset(self, capture):
+        # the first sample above 10% of the peak, the capture may be
+        # delayed by the audio path and the start of the tools
+        peak = numpy.max(numpy.abs(capture))
+        if peak < 1e-4:
+            return 0
+        return int(numpy.argmax(numpy.max(numpy.abs(capture), axis=1) > 0.1 * peak))
+
+    def spectrum(self, capture, start):
+        # a window in the middle of the segment, away from the edges
+        size = self.stimulus.window
+        begin = self.onset + start + (self.stimulus.segment - size) // 2
+        block = capture[begin:begin + size, :self.channels]
+        if len(block) < size:
+            block = numpy.vstack((block, numpy.zeros((size - len(block),
+                                                      self.channels))))
+        # power of every bin, a full scale sine has a power of 1.0
+        return (numpy.abs(numpy.fft.rfft(block, axis=0)) * 2 / size) ** 2 / 2
+
+    def _bin(self, freq):
+        return int(round(freq * self.stimulus.window / float(self.stimulus.rate)))
+
+    def powers(self, spectrum, channel):
+        return numpy.array([spectrum[self._bin(f), channel] + 1e-20
+                            for f in self.stimulus.freqs])
+
+    def tone_level(self, spectrum, channel):
+        power = spectrum[self._bin(self.stimulus.tone), channel]
+        # dBFS, a full scale sine is 0 dBFS
+        return round(_db(power * 2), 2)
+
+    def tone_thdn(self, spectrum, channel):
+        fundamental = spectrum[self._bin(self.stimulus.tone), channel]
+        # everything but DC and the fundamental
+        total = numpy.sum(spectrum[1:, channel])
+        return round(_db((total - fundamental) / max(fundamental, 1e-20)), 2)
+
+    def check(self, limits=None):
+        """ Returns the list of failed checks, empty if all are within limits.
+
+        Keyword arguments:
+            - limits: Dictionary with some of the LIMITS keys, the rest are
+                      the defaults.
+
+        """
+        current = dict(LIMITS)
+        current.update(limits or { })
+        failures = [ ]
+        for c in range(self.channels):
+            if not current['min_level'] <= self.level[c] <= current['max_level']:
+                failures.append("channel %d level %.1f dBFS out of [%.1f, %.1f]"
+                                % (c, self.level[c], current['min_level'],
+                                   current['max_level']))
+            if self.thdn[c] > current['max_thdn']:
+                failures.append("channel %d THD+N %.1f dB above %.1f dB"
+                                % (c, self.thdn[c], current['max_thdn']))
+            if self.ripple[c] > current['max_ripple']:
+                failures.append("channel %d response ripple %.1f dB above %.1f dB"
+                                % (c, self.ripple[c], current['max_ripple']))
+            if self.crosstalk and self.crosstalk[c] > current['max_crosstalk']:
+                failures.append("channel %d crosstalk %.1f dB above %.1f dB"
+                                % (c, self.crosstalk[c], current['max_crosstalk']))
+        return failures
+
+    def __str__(self):
+        return "; ".join(
+            "channel %d: level %.1f dBFS, THD+N %.1f dB, ripple %.1f dB%s"
+            % (c, self.level[c], self.thdn[c], self.ripple[c],
+               ", crosstalk %.1f dB" % self.crosstalk[c] if self.crosstalk else "")
+            for c in range(self.channels))
+
+def analyse_wav(path, stimulus=None):
+    """ Analyse a captured WAV file, returns a QAudioAnalysis.
+
+    Keyword arguments:
+        - path: The WAV file.
+        - stimulus: The QAudioStimulus played, by default the default one
+                    at the rate and with the channels of the file.
+
+    """
+    rate, samples = read_wav(path)
+    if stimulus is None:
+        stimulus = QAudioStimulus(rate, samples.shape[1])
+    return QAudioAnalysis(stimulus, samples)
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QAudioAnalysis
+# -----------------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+class TestClassQAudioAnalysis(unittest.TestCase):
+    """ Unittest for class QAudioAnalysis
+
+    """
+    def setUp(self):
+        if numpy is None:
+            self.skipTest("numpy not available")
+        self.stimulus = QAudioStimulus()
+
+    def capture(self, gain=0.5, crosstalk=0.0, distortion=0.0, delay=1234):
+        # a synthetic capture of the loopback: attenuated, delayed, with
+        # crosstalk, a second harmonic and a bit of noise
+        random = numpy.random.RandomState(1)
+        x = self.stimulus.samples()
+        y = gain * (x + crosstalk * x[:, ::-1]) + distortion * x ** 2
+        y += random.normal(0, 1e-4, y.shape)
+        return numpy.vstack((numpy.zeros((delay, 2)), y, numpy.zeros((2000, 2))))
+
+    def test_clean(self):
+        result = QAudioAnalysis(self.stimulus, self.capture())
+        self.failUnless(abs(result.level[0] - 20 * math.log10(0.25)) < 0.1,
+            "Error: Unexpected level %s" % result)
+        self.failUnless(result.check() == [],
+            "Error: Unexpected failures %s" % result.check())
+
+    def test_faults(self):
+        result = QAudioAnalysis(self.stimulus,
+                                self.capture(crosstalk=0.1, distortion=0.05))
+        self.failUnless(abs(result.crosstalk[0] + 20) < 0.5,
+            "Error: Unexpected crosstalk %s" % result)
+        failures = result.check()
+        self.failUnless(len(failures) == 4,
+            "Error: Unexpected failures %s" % failures)
+
+    def test_wav(self):
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            write_wav(path, numpy.clip(self.capture(), -1, 1), self.stimulus.rate)
+            result = analyse_wav(path)
+            self.failUnless(result.check() == [],
+                "Error: Unexpected failures %s" % result.check())
+        finally:
+            os.remove(path)
+        data = self.stimulus.wav()
+        fd = wave.open(StringIO.StringIO(data), "rb")
+        self.failUnless(fd.getnchannels() == self.stimulus.channels and
+                        fd.getnframes() == len(self.stimulus.samples()),
+            "Error: Unexpected WAV data of %d bytes" % len(data))
+        fd.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""
+This provides an index of the block devices, their sysfs path, partitions
+and mountpoints.
+
+The index is built walking /sys/class/block once, instead of asking udevadm
+for every device node, and can be updated with a single device when a
+uevent arrives.
+
+"""
+
+import os
+import re
+import threading
+
+from collections import namedtuple
+
+class QBlockDevice(namedtuple("QBlockDevice", "name node devpath disk")):
+    """ A block device or partition.
+
+    Attributes:
+        - name: The kernel name, e.g. sda1
+        - node: The device node, e.g. /dev/sda1
+        - devpath: The sysfs path, as 'udevadm info -q path', e.g.
+                   /devices/platform/.../usb1/1-2/1-2.1/.../block/sda/sda1
+        - disk: The name of the disk of a partition, None for a disk.
+
+    """
+    __slots__ = ()
+
+def _unescape(value):
+    # /proc/mounts escapes spaces, tabs, newlines and backslashes in octal
+    return (value.replace("\\040", " ").replace("\\011", "\t")
+                 .replace("\\012", "\n").replace("\\134", "\\"))
+
+def match_port(devpath, port):
+    """ Returns True if the sysfs path is below the port, the port is any
+    part of the path as in the test suites, e.g. 'usb1/1-2/1-2.1',
+    '-1.1:1.0', '.sata/ata1' or 'ehci-omap'
+
+    """
+    return port in devpath
+
+# a USB port: a controller or root hub name, or a hub port as '1-2.1' or
+# '-1.1:1.0'
+_USB_PORT = re.compile(r"usb|[eoux]hci|(^|[-/.])\d*-\d+([.:/]|$)")
+
+def port_resource(port):
+    """ Returns the hardware resource of a port, see ParallelTestSuite.
+
+    All the USB ports are the resource 'usb', whatever their naming (e.g.
+    'musb-omap', 'usb1/1-2/1-2.1' or '-1.1:1.0'), as they share the
+    controllers and the pendrives plugged by the operator. Any other port
+    (e.g. '.sata/ata1') is a resource by itself.
+
+    """
+    if _USB_PORT.search(port):
+        return "usb"
+    return port
+
+class QBlockIndex:
+    """ Index of the block devices.
+
+    Keyword arguments:
+        - sysfs: The sysfs mountpoint.
+        - mounts: The mount table.
+        - dev: The device nodes directory.
+
+    """
+    def __init__(self, sysfs="/sys", mounts="/proc/mounts", dev="/dev"):
+        self.sysfs = sysfs
+        self.mounts_path = mounts
+        self.dev = dev
+        self.lock = threading.Lock()
+        # QBlockDevice indexed by name
+        self.devices = { }
+        # mountpoints indexed by device node
+        self.mounts = { }
+        self.refresh()
+
+    def _device(self, name, devpath):
+        disk = None
+        if os.path.exists(os.path.join(self.sysfs, devpath.lstrip("/"),
+                                       "partition")):
+            disk = os.path.basename(os.path.dirname(devpath))
+        return QBlockDevice(name, os.path.join(self.dev, name), devpath, disk)
+
+    def refresh(self):
+        """ Rebuild the index from sysfs and the mount table.
+
+        """
+        devices = { }
+        classdir = os.path.join(self.sysfs, "class", "block")
+        try:
+            names = os.listdir(classdir)
+        except OSError:
+            names = [ ]
+        for name in names:
+            path = os.path.realpath(os.path.join(classdir, name))
+            devpath = "/" + os.path.relpath(path, os.path.realpath(self.sysfs))
+            devices[name] = self._device(name, devpath)
+        with self.lock:
+            self.devices = devices
+        self.refresh_mounts()
+
+    def refresh_mounts(self):
+        """ Read the mount table again, e.g. after mounting a device.
+
+        """
+        mounts = { }
+        try:
+            fd = open(self.mounts_path, "r")
+            for line in fd:
+                fields = line.split()
+                if len(fields) > 1:
+                    node = _unescape(fields[0])
+                    mounts.setdefault(node, [ ]).append(_unescape(fields[1]))
+            fd.close()
+        except IOError:
+            pass
+        with self.lock:
+            self.mounts = mounts
+
+    def update(self, action, devpath):
+        """ Update one device from a uevent.
+
+        Keyword arguments:
+            - action: The uevent action, e.g. "add", "change" or "remove".
+            - devpath: The sysfs path of the uevent (DEVPATH).
+
+        """
+        name = os.path.basename(devpath)
+        with self.lock:
+            if action == "remove":
+                self.devices.pop(name, None)
+                # the partitions are removed with their disk
+                for key in [k for k, d in self.devices.items() if d.disk == name]:
+                    del self.devices[key]
+            else:
+                self.devices[name] = self._device(name, devpath)
+
+    def find(self, port):
+        """ Returns the list of QBlockDevice below a sysfs port, sorted by
+        name, the disks before their partitions.
+
+        """
+        with self.lock:
+            devices = [d for d in self.devices.values()
+                       if match_port(d.devpath, port)]
+        return sorted(devices, key=lambda d: (d.disk or d.name, d.name))
+
+    def mountpoints(self, device):
+        """ Returns the mountpoints of a QBlockDevice or device node.
+
+        """
+        node = device.node if isinstance(device, QBlockDevice) else device
+        with self.lock:
+            return list(self.mounts.get(node, [ ]))
+
+    def find_file(self, port, filename):
+        """ Returns the path of a file in any mounted device below a port, or
+        None if not found.
+
+        """
+        for device in self.find(port):
+            for mountpoint in self.mountpoints(device):
+                path = os.path.join(mountpoint, filename)
+                if os.path.isfile(path):
+                    return path
+        return None
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """ Returns the shared QBlockIndex, built the first time.
+
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = QBlockIndex()
+        return _index
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QBlockIndex
+# -----------------------------------------------------------------------------
+import shutil
+import tempfile
+import unittest
+
+class TestClassQBlockIndex(unittest.TestCase):
+    """ Unittest for class QBlockIndex
+
+    """
+    USB = ("devices/platform/68000000.ocp/ehci-omap.0/usb1/1-2/1-2.1/"
+           "1-2.1:1.0/host0/target0:0:0/0:0:0:0/block")
+    MMC = "devices/platform/68000000.ocp/4809c000.mmc/mmc_host/mmc0/mmc0:0001/block"
+
+    def add(self, parent, name, partition=False):
+        path = os.path.join(self.root, "sys", parent, name)
+        os.makedirs(path)
+        if partition:
+            open(os.path.join(path, "partition"), "w").close()
+        os.symlink(os.path.relpath(path, os.path.join(self.root, "sys/class/block")),
+                   os.path.join(self.root, "sys/class/block", name))
+        return "/" + os.path.join(parent, name)
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "sys/class/block"))
+        self.add(self.USB, "sda")
+        self.add(self.USB + "/sda", "sda1", True)
+        self.add(self.MMC, "mmcblk0")
+        self.add(self.MMC + "/mmcblk0", "mmcblk0p1", True)
+        self.media = os.path.join(self.root, "media", "usb disk")
+        os.makedirs(self.media)
+        open(os.path.join(self.media, "this_is_an_storage_device"), "w").close()
+        fd = open(os.path.join(self.root, "mounts"), "w")
+        fd.write("/dev/mmcblk0p1 / ext4 rw 0 0\n")
+        fd.write("/dev/sda1 %s vfat rw 0 0\n" % self.media.replace(" ", "\\040"))
+        fd.close()
+        self.index = QBlockIndex(os.path.join(self.root, "sys"),
+                                 os.path.join(self.root, "mounts"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_find(self):
+        retval = [d.name for d in self.index.find("usb1/1-2/1-2.1")]
+        self.failUnless(retval == ["sda", "sda1"],
+            "Error: Unexpected devices %s" % retval)
+        retval = [d.name for d in self.index.find("-2.1:1.0")]
+        self.failUnless(retval == ["sda", "sda1"],
+            "Error: Unexpected devices %s" % retval)
+        retval = self.index.find("ehci-omap")[1]
+        self.failUnless(retval.disk == "sda" and retval.node == "/dev/sda1",
+            "Error: Unexpected device %s" % repr(retval))
+        self.failUnless(self.index.find("usb1/1-2/1-2.2") == [ ] and
+                        self.index.find("usb2") == [ ] and
+                        self.index.find("usb1/1-2.1") == [ ],
+            "Error: Devices found in other ports")
+
+    def test_find_file(self):
+        retval = self.index.find_file("usb1/1-2", "this_is_an_storage_device")
+        self.failUnless(retval is not None and retval.startswith(self.media),
+            "Error: Unexpected file %s" % retval)
+        retval = self.index.find_file("mmc0", "this_is_an_storage_device")
+        self.failUnless(retval is None, "Error: Unexpected file %s" % retval)
+
+    def test_port_resource(self):
+        ports = ["musb-omap", "ehci-omap", "musb-hdrc", "usb1/1-2/1-2.1",
+                 "usb2/2-1/2-1", "-1.1:1.0", "-2.1:1.0"]
+        retval = set(port_resource(p) for p in ports)
+        self.failUnless(retval == set(["usb"]),
+            "Error: Unexpected USB resources %s" % retval)
+        for port in (".sata/ata1", "ata1/host0", "mmc0"):
+            self.failUnless(port_resource(port) == port,
+                "Error: Unexpected resource of %s" % port)
+
+    def test_update(self):
+        devpath = self.add(self.USB.replace("1-2.1", "1-2.3"), "sdb")
+        self.index.update("add", devpath)
+        retval = [d.name for d in self.index.find("usb1/1-2/1-2.3")]
+        self.failUnless(retval == ["sdb"], "Error: Unexpected devices %s" % retval)
+        self.index.update("remove", "/" + self.USB + "/sda")
+        retval = [d.name for d in self.index.find("usb1")]
+        self.failUnless(retval == ["sdb"], "Error: Unexpected devices %s" % retval)
+
+if __name__ == '__main__':
+    unittest.main()
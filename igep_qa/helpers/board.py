@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+This provides the identity of the board under test.
+
+The identity is detected once per process and shared by helpers, tests and
+runners, instead of parsing /proc/cpuinfo, /proc/cmdline or the device-tree
+on every check.
+
+"""
+
+import os
+
+from igep_qa.helpers.common import QCpuinfo, QCmdline
+
+# "Hardware" field of /proc/cpuinfo for non device-tree machines
+MACHINES = {
+    "IGEP0020 board": "igep0020",
+    "IGEP0030 COM": "igep0030",
+    "IGEP0032 COM": "igep0032",
+}
+
+class QBoard(object):
+    """ Identity of the board under test.
+
+    Every value is detected the first time it is requested and kept until
+    invalidate() is called.
+
+    Attributes:
+        - hardware: The "Hardware" field of /proc/cpuinfo.
+        - compatible: The list of device-tree compatible strings.
+        - model: The device-tree model, e.g. ISEE IGEP SMARC AM3354 Kit
+        - machine: The machine name (e.g. igep0020) for non device-tree
+                   machines, otherwise the device-tree model.
+        - soc: "omap3", "omap5", "am33xx", "imx6" or "" if unknown.
+        - buddy: The buddy board from the kernel command line, e.g. base0010
+        - dieid: The processor die identifier in hexadecimal format.
+
+    """
+    def __init__(self):
+        self._cache = { }
+
+    def invalidate(self):
+        """ Forget the detected values, they will be detected again.
+
+        """
+        self._cache.clear()
+
+    def _get(self, name, detect):
+        if name not in self._cache:
+            self._cache[name] = detect()
+        return self._cache[name]
+
+    def _read(self, path):
+        try:
+            fd = open(path, "r")
+            retval = fd.read()
+            fd.close()
+            return retval
+        except IOError:
+            return ""
+
+    @property
+    def hardware(self):
+        return self._get("hardware",
+                         lambda: QCpuinfo().data.get("Hardware", ""))
+
+    @property
+    def compatible(self):
+        return self._get("compatible",
+                         lambda: [c for c in self._read(
+                             "/proc/device-tree/compatible").split("\0") if c])
+
+    @property
+    def model(self):
+        return self._get("model",
+                         lambda: self._read("/proc/device-tree/model").rstrip("\0\n"))
+
+    @property
+    def machine(self):
+        return self._get("machine",
+                         lambda: MACHINES.get(self.hardware, self.model))
+
+    def is_compatible(self, prefix):
+        """ Returns True if any compatible string starts with prefix.
+
+        """
+        return any(c.startswith(prefix) for c in self.compatible)
+
+    def _detect_soc(self):
+        if self.hardware in MACHINES or self.is_compatible("ti,omap3"):
+            return "omap3"
+        if self.is_compatible("ti,omap5"):
+            return "omap5"
+        if (self.hardware == "Generic AM33XX (Flattened Device Tree)" or
+            self.is_compatible("ti,am33xx")):
+            return "am33xx"
+        if (self.hardware == "Freescale i.MX6 Quad/DualLite (Device Tree)" or
+            self.is_compatible("fsl,imx6")):
+            return "imx6"
+        return ""
+
+    @property
+    def soc(self):
+        return self._get("soc", self._detect_soc)
+
+    def _detect_buddy(self):
+        for opt in QCmdline().cmdline.split():
+            if opt.startswith("buddy="):
+                return opt[len("buddy="):]
+        return ""
+
+    @property
+    def buddy(self):
+        return self._get("buddy", self._detect_buddy)
+
+    def _detect_dieid(self):
+        # imported here, the SoC helpers also use the board identity
+        if self.soc == "omap3":
+            from igep_qa.helpers.omap import omap3_get_dieid
+            return omap3_get_dieid()
+        if self.soc == "omap5":
+            from igep_qa.helpers.omap import omap5_get_dieid
+            return omap5_get_dieid()
+        if self.soc == "am33xx":
+            from igep_qa.helpers.am33xx import am335x_get_mac_id0
+            return am335x_get_mac_id0()
+        if self.soc == "imx6":
+            from igep_qa.helpers.imx6 import imx6_get_unique_id
+            return imx6_get_unique_id()
+        return ""
+
+    @property
+    def dieid(self):
+        return self._get("dieid", self._detect_dieid)
+
+_board = QBoard()
+
+def get_board():
+    """ Returns the QBoard shared by the whole run.
+
+    """
+    return _board
+
+def invalidate_board():
+    """ Detect again the identity of the board on the next request.
+
+    """
+    _board.invalidate()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+"""
+This provides a helper to run external commands.
+
+The commands are run from an argument list, without a shell, with a timeout
+and capturing the exit status and the output. Independent commands can run at
+the same time with run_many().
+
+"""
+
+import os
+import signal
+import subprocess
+import threading
+
+from collections import namedtuple
+
+from igep_qa.helpers.common import monotonic
+
+# Timeout of a command if none is given, in seconds
+DEFAULT_TIMEOUT = 120
+
+class QCommandResult(namedtuple("QCommandResult",
+                                "argv returncode output duration timedout")):
+    """ Result of a command.
+
+    Attributes:
+        - argv: The argument list of the command.
+        - returncode: The exit status, negative if killed by a signal and
+                      127 if the command can't be executed.
+        - output: The standard output and error, without the trailing
+                  newline.
+        - duration: The wall time of the command, in seconds.
+        - timedout: True if the command was killed after the timeout.
+
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """ Returns True if the command exited with status 0.
+
+        """
+        return self.returncode == 0
+
+# wall time spent by every thread waiting for commands
+_stats = threading.local()
+
+def _account(duration, count=1):
+    _stats.count = getattr(_stats, "count", 0) + count
+    _stats.wall = getattr(_stats, "wall", 0.0) + duration
+
+def get_stats():
+    """ Returns the number of commands run by the current thread and the wall
+    time spent waiting for them, in seconds.
+
+    """
+    return getattr(_stats, "count", 0), getattr(_stats, "wall", 0.0)
+
+class QProcess:
+    """ A command running in background.
+
+    The command runs in its own process group, so the timeout kills the
+    command and all its children.
+
+    Keyword arguments:
+        - argv: The argument list, argv[0] is searched in the PATH.
+        - stdin: Optional data written to the standard input.
+        - output: If False the output is discarded instead of captured.
+        - stderr: If False the standard error is discarded instead of
+                  captured with the output.
+
+    The captured output can also be read while the command runs from
+    'process.stdout', e.g. to stream the data of a capture tool.
+
+    """
+    def __init__(self, argv, stdin=None, output=True, stderr=True):
+        self.argv = list(argv)
+        self.start = monotonic()
+        self.result = None
+        self._stdin = stdin
+        devnull = os.open(os.devnull, os.O_RDWR)
+        try:
+            self.process = subprocess.Popen(self.argv,
+                stdin=subprocess.PIPE if stdin is not None else devnull,
+                stdout=subprocess.PIPE if output else devnull,
+                stderr=subprocess.STDOUT if stderr else devnull, close_fds=True,
+                preexec_fn=os.setsid)
+        except OSError as e:
+            self.process = None
+            self.result = QCommandResult(self.argv, 127, str(e), 0.0, False)
+        finally:
+            os.close(devnull)
+
+    def kill(self):
+        """ Kill the command and its children.
+
+        """
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def wait(self, timeout=DEFAULT_TIMEOUT):
+        """ Wait for the command to finish and returns its QCommandResult.
+
+        Keyword arguments:
+            - timeout: Maximum time since the command was started, in
+                       seconds, it is killed after it. None to wait forever.
+
+        """
+        start = monotonic()
+        result = self._wait(timeout)
+        _account(monotonic() - start)
+        return result
+
+    def _wait(self, timeout):
+        if self.result is not None:
+            return self.result
+        expired = [ ]
+        def expire():
+            expired.append(True)
+            self.kill()
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(max(0, timeout - (monotonic() - self.start)),
+                                    expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            output, _ = self.process.communicate(self._stdin)
+        finally:
+            if timer is not None:
+                timer.cancel()
+                timer.join()
+        output = (output or "").rstrip("\n")
+        self.result = QCommandResult(self.argv, self.process.returncode,
+                                     output, monotonic() - self.start,
+                                     bool(expired))
+        return self.result
+
+def _run(argv, timeout, stdin):
+    return QProcess(argv, stdin)._wait(timeout)
+
+def run(argv, timeout=DEFAULT_TIMEOUT, stdin=None):
+    """ Run a command and returns its QCommandResult.
+
+    Keyword arguments:
+        - argv: The argument list, e.g. ["ping", "-c", "3", "192.168.5.1"]
+        - timeout: Maximum time for the command, in seconds, it is killed
+                   after it. None to wait forever.
+        - stdin: Optional data written to the standard input.
+
+    """
+    result = _run(argv, timeout, stdin)
+    _account(result.duration)
+    return result
+
+def run_many(argvs, timeout=DEFAULT_TIMEOUT, jobs=4):
+    """ Run independent commands at the same time.
+
+    Returns the list of QCommandResult in the same order as argvs.
+
+    Keyword arguments:
+        - argvs: List of argument lists.
+        - timeout: Maximum time for every command, in seconds.
+        - jobs: Maximum number of commands running at the same time.
+
+    """
+    argvs = list(argvs)
+    results = [None] * len(argvs)
+    pending = list(enumerate(argvs))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                index, argv = pending.pop(0)
+            results[index] = _run(argv, timeout, None)
+
+    start = monotonic()
+    threads = [threading.Thread(target=worker)
+               for _ in range(min(jobs, len(argvs)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    _account(monotonic() - start, len(argvs))
+    return results
+
+def getstatusoutput(argv, timeout=DEFAULT_TIMEOUT):
+    """ Run a command and returns (returncode, output).
+
+    Like commands.getstatusoutput but from an argument list.
+
+    """
+    result = run(argv, timeout)
+    return result.returncode, result.output
+
+def getoutput(argv, timeout=DEFAULT_TIMEOUT):
+    """ Run a command and returns its output.
+
+    Like commands.getoutput but from an argument list.
+
+    """
+    return run(argv, timeout).output
+
+# -----------------------------------------------------------------------------
+# Test Cases for the command helpers
+# -----------------------------------------------------------------------------
+import unittest
+
+class TestClassCommand(unittest.TestCase):
+    """ Unittest for the command helpers
+
+    """
+    def test_run(self):
+        result = run(["sh", "-c", "echo hello; exit 3"])
+        self.failUnless(result.returncode == 3 and result.output == "hello",
+            "Error: Unexpected result %s" % repr(result))
+
+    def test_not_found(self):
+        result = run(["/nonexistent/command"])
+        self.failUnless(result.returncode == 127 and not result.ok,
+            "Error: Unexpected result %s" % repr(result))
+
+    def test_timeout(self):
+        result = run(["sleep", "10"], timeout=0.2)
+        self.failUnless(result.timedout and result.duration < 5,
+            "Error: Command not killed %s" % repr(result))
+
+    def test_run_many(self):
+        start = monotonic()
+        results = run_many([["sleep", "0.3"], ["echo", "a"], ["sleep", "0.3"]])
+        self.failUnless([r.returncode for r in results] == [0, 0, 0],
+            "Error: Unexpected results %s" % repr(results))
+        self.failUnless(results[1].output == "a" and monotonic() - start < 0.55,
+            "Error: Commands not run at the same time")
+
+if __name__ == '__main__':
+    unittest.main()
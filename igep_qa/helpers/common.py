@@ -5,12 +5,43 @@ This provides various generic helper functions and classes
 
 """
 
+import ctypes
 import fcntl
 import mmap
 import os
 import struct
 import socket
-import commands
+import time
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+# clock_gettime lives in librt for glibc older than 2.17
+try:
+    _clock_gettime = ctypes.CDLL("librt.so.1", use_errno=True).clock_gettime
+except OSError:
+    try:
+        _clock_gettime = ctypes.CDLL("libc.so.6", use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        _clock_gettime = None
+
+CLOCK_MONOTONIC = 1
+
+def monotonic():
+    """ Return the value (in fractional seconds) of a monotonic clock.
+
+    The clock cannot go backwards and is not affected by system time updates
+    (e.g. ntpdate or rdate during the test), so use it to measure timeouts
+    and elapsed times. Falls back to time.time() if clock_gettime is not
+    available.
+
+    """
+    if _clock_gettime is None:
+        return time.time()
+    t = _timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+        return time.time()
+    return t.tv_sec + t.tv_nsec * 1e-9
 
 def is_in_path(name):
     """ Return True if name refers to an existing file in path, otherwise 
@@ -135,12 +166,59 @@ class QDeviceTree:
 class QMmap:
     """ Simple helper class to read/write from/to any location in memory
 
+    /dev/mem is opened once and every mapped page is kept until close(), so
+    several registers of the same page cost a single mmap.
+
     References:
         http://www.lartmaker.nl/lartware/port/devmem2.c
 
     """
     MAP_MASK = mmap.PAGESIZE - 1
     WORD = 4
+    def __init__(self):
+        self.fd = None
+        self.pages = { }
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """ Unmap all the pages and close /dev/mem
+
+        """
+        for mm in self.pages.values():
+            mm.close()
+        self.pages.clear()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _page(self, addr):
+        """ Returns the mapping of the page where addr is, mapping it if needed.
+
+        """
+        base = addr & ~self.MAP_MASK
+        if base not in self.pages:
+            if self.fd is None:
+                self.fd = os.open("/dev/mem", os.O_RDWR | os.O_SYNC)
+            # Map one page
+            self.pages[base] = mmap.mmap(self.fd, mmap.PAGESIZE,
+                                         mmap.MAP_SHARED,
+                                         mmap.PROT_WRITE | mmap.PROT_READ,
+                                         offset=base)
+        return self.pages[base]
+
+    def read32(self, addr):
+        """ Read a 32-bit word from any location in memory
+
+        Returns the readed value as integer
+
+        Keyword arguments:
+            - addr: The memory address to be readed.
+
+        """
+        return struct.unpack_from('I', self._page(addr), addr & self.MAP_MASK)[0]
+
     def read(self, addr):
         """ Read from any location in memory
 
@@ -150,19 +228,87 @@ class QMmap:
             - addr: The memory address to be readed.
 
         """
-        fd = os.open("/dev/mem", os.O_RDWR | os.O_SYNC)
-        # Map one page
-        mm = mmap.mmap(fd, mmap.PAGESIZE, mmap.MAP_SHARED, mmap.PROT_WRITE
-                       | mmap.PROT_READ, offset=addr & ~self.MAP_MASK)
-        mm.seek(addr & self.MAP_MASK)
-        retval = struct.unpack('I', mm.read(self.WORD))
-        mm.close()
-        os.close(fd)
-        return "%08X" % retval[0]
+        return "%08X" % self.read32(addr)
+
+    def read_words(self, addrs):
+        """ Read several 32-bit words from any location in memory
+
+        Returns a list with the readed values as integers
+
+        Keyword arguments:
+            - addrs: List of memory addresses to be readed.
+
+        """
+        return [self.read32(addr) for addr in addrs]
+
+    def read_block(self, addr, count):
+        """ Read consecutive 32-bit words from any location in memory
+
+        Returns a list with the readed values as integers
+
+        Keyword arguments:
+            - addr: The memory address of the first word, word aligned,
+                    ValueError is raised otherwise.
+            - count: The number of words to be readed.
+
+        """
+        if addr % self.WORD:
+            # a word would straddle two pages
+            raise ValueError("Unaligned address 0x%08X" % addr)
+        retval = [ ]
+        while count > 0:
+            offset = addr & self.MAP_MASK
+            n = min(count, (mmap.PAGESIZE - offset) // self.WORD)
+            retval.extend(struct.unpack_from('%dI' % n, self._page(addr), offset))
+            addr += n * self.WORD
+            count -= n
+        return retval
+
+    def unpack(self, addr, fmt):
+        """ Read a structure from any location in memory
+
+        Returns a tuple with the values as described by fmt
+
+        Keyword arguments:
+            - addr: The memory address of the structure.
+            - fmt: The struct module format, e.g. '<IIHH'. The structure must
+                   be within one page.
+
+        """
+        return struct.unpack_from(fmt, self._page(addr), addr & self.MAP_MASK)
+
+    def write(self, addr, value):
+        """ Write a 32-bit word to any location in memory
+
+        Keyword arguments:
+            - addr: The memory address to be written.
+            - value: The value to be written.
+
+        """
+        offset = addr & self.MAP_MASK
+        self._page(addr)[offset:offset + self.WORD] = struct.pack('I', value & 0xFFFFFFFF)
+
+    def modify(self, addr, mask, value):
+        """ Read-modify-write the bits of a 32-bit word in memory
+
+        Returns the written value
+
+        Keyword arguments:
+            - addr: The memory address to be modified.
+            - mask: The bits to be modified.
+            - value: The new value of the masked bits.
+
+        """
+        retval = (self.read32(addr) & ~mask) | (value & mask)
+        self.write(addr, retval)
+        return retval
 
 class set_WiLink_bluetooth:
     """ Simple helper class to enable WiLink bluetooth
 
     """
-    commands.getoutput("modprobe btwilink")
-    commands.getoutput("hciconfig hci0 up")
\ No newline at end of file
+    def __init__(self):
+        # imported here, the command helper uses monotonic() of this module
+        from igep_qa.helpers.command import run
+        run(["modprobe", "btwilink"], 30)
+        run(["hciconfig", "hci0", "up"], 10)
\ No newline at end of file
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+
+"""
+This provides a DTMF detector for the audio tests.
+
+The digits are detected with the Goertzel algorithm on blocks of samples,
+vectorized with numpy when it is available.
+
+"""
+
+import array
+import math
+import sys
+import wave
+
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LOW = (697, 770, 852, 941)
+HIGH = (1209, 1336, 1477, 1633)
+KEYS = ("123A", "456B", "789C", "*0#D")
+
+class QDtmfDigit(namedtuple("QDtmfDigit", "digit start duration snr")):
+    """ A detected DTMF digit.
+
+    Attributes:
+        - digit: The digit, one of 0-9, A-D, * or #
+        - start: Start time of the digit, in seconds.
+        - duration: Duration of the digit, in seconds.
+        - snr: Median signal to noise ratio of the blocks of the digit, in
+               dB. The signal is the pair of tones and the noise everything
+               else.
+
+    """
+    __slots__ = ()
+
+def samples_from_pcm(data, channels=1):
+    """ Returns the samples of the first channel of S16_LE PCM data.
+
+    """
+    data = data[:len(data) - len(data) % (2 * channels)]
+    if numpy is not None:
+        return numpy.frombuffer(data, dtype="<i2")[::channels].astype(numpy.float64)
+    samples = array.array("h", data)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return [float(s) for s in samples[::channels]]
+
+def read_wav(path):
+    """ Returns the sample rate and the samples of the first channel of a
+    16-bit WAV file.
+
+    """
+    fd = wave.open(path, "rb")
+    try:
+        if fd.getsampwidth() != 2:
+            raise ValueError("%s: only 16-bit samples are supported" % path)
+        data = fd.readframes(fd.getnframes())
+        return fd.getframerate(), samples_from_pcm(data, fd.getnchannels())
+    finally:
+        fd.close()
+
+def _dot(a, b):
+    if numpy is not None:
+        return float(numpy.dot(a, b))
+    return sum(x * y for x, y in zip(a, b))
+
+def _solve(a, b):
+    # Gaussian elimination with partial pivoting of a small system
+    n = len(b)
+    m = [list(row) + [y] for row, y in zip(a, b)]
+    for i in range(n):
+        pivot = max(range(i, n), key=lambda r: abs(m[r][i]))
+        m[i], m[pivot] = m[pivot], m[i]
+        if m[i][i] == 0:
+            return [0.0] * n
+        for r in range(i + 1, n):
+            f = m[r][i] / m[i][i]
+            for k in range(i, n + 1):
+                m[r][k] -= f * m[i][k]
+    x = [0.0] * n
+    for i in reversed(range(n)):
+        x[i] = (m[i][n] - sum(m[i][k] * x[k] for k in range(i + 1, n))) / m[i][i]
+    return x
+
+class QDtmfDetector:
+    """ Streaming DTMF detector.
+
+    The samples are fed as they are captured and the digits are returned as
+    soon as they end. A digit needs a pair of tones, one of every group, in
+    at least 'min_blocks' consecutive blocks of about 25 ms.
+
+    Keyword arguments:
+        - rate: The sample rate, in Hz.
+        - min_snr: Minimum signal to noise ratio of a digit, in dB.
+        - twist: Maximum level difference between the tones, in dB.
+        - min_blocks: Minimum number of blocks of a digit.
+
+    """
+    def __init__(self, rate=8000, min_snr=10.0, twist=8.0, min_blocks=2):
+        self.rate = rate
+        self.min_snr = min_snr
+        self.twist = twist
+        self.min_blocks = min_blocks
+        # 205 samples at 8 kHz, the classic block size for DTMF
+        self.size = int(round(205 * rate / 8000.0))
+        self.freqs = LOW + HIGH
+        self._coeffs = [2 * math.cos(2 * math.pi * f / rate) for f in self.freqs]
+        if numpy is not None:
+            n = numpy.arange(self.size)
+            self._kernel = numpy.exp(-2j * numpy.pi *
+                                     numpy.outer(self.freqs, n) / rate)
+            self._pending = numpy.zeros(0)
+        else:
+            self._pending = [ ]
+        self._bases = { }
+        self._block = 0
+        self._current = None
+        self._count = 0
+        self._snrs = [ ]
+        self.digits = [ ]
+
+    def _powers(self, blocks):
+        # Energy of every frequency in every block and of every block,
+        # a sinusoid of amplitude A has a tone energy of A^2 * size / 2
+        if numpy is not None:
+            spectrum = numpy.abs(numpy.dot(blocks, self._kernel.T)) ** 2
+            return 2 * spectrum / self.size, numpy.sum(blocks ** 2, axis=1)
+        powers, energies = [ ], [ ]
+        for block in blocks:
+            row = [ ]
+            for coeff in self._coeffs:
+                s1 = s2 = 0.0
+                for x in block:
+                    s1, s2 = x + coeff * s1 - s2, s1
+                row.append(2 * (s1 * s1 + s2 * s2 - coeff * s1 * s2) / self.size)
+            powers.append(row)
+            energies.append(sum(x * x for x in block))
+        return powers, energies
+
+    def _basis(self, low, high):
+        if (low, high) not in self._bases:
+            vectors = [ ]
+            for f in (LOW[low], HIGH[high]):
+                w = 2 * math.pi * f / self.rate
+                vectors.append([math.cos(w * n) for n in range(self.size)])
+                vectors.append([math.sin(w * n) for n in range(self.size)])
+            if numpy is not None:
+                vectors = [numpy.array(v) for v in vectors]
+            gram = [[_dot(a, b) for b in vectors] for a in vectors]
+            self._bases[(low, high)] = (vectors, gram)
+        return self._bases[(low, high)]
+
+    def _snr(self, block, energy, low, high):
+        # Least squares fit of the pair of tones, the noise is the residual.
+        # The Goertzel powers are not used, the tones leak into each other.
+        vectors, gram = self._basis(low, high)
+        b = [_dot(v, block) for v in vectors]
+        c = _solve(gram, b)
+        signal = sum(x * y for x, y in zip(c, b))
+        noise = max(energy - signal, energy * 1e-6, 1e-9)
+        return 10 * math.log10(max(signal, 1e-9) / noise)
+
+    def _classify(self, block, powers, energy):
+        powers = list(powers)
+        low = max(range(4), key=lambda i: powers[i])
+        high = max(range(4), key=lambda i: powers[4 + i])
+        lp, hp = powers[low], powers[4 + high]
+        if lp <= 0 or hp <= 0 or energy <= 0:
+            return None, None
+        if abs(10 * math.log10(hp / lp)) > self.twist:
+            return None, None
+        snr = self._snr(block, energy, low, high)
+        if snr < self.min_snr:
+            return None, None
+        return KEYS[low][high], snr
+
+    def _end_digit(self):
+        if self._current is not None and self._count >= self.min_blocks:
+            block_time = float(self.size) / self.rate
+            start = (self._block - self._count) * block_time
+            # the first and last blocks are partially filled by the digit
+            snrs = sorted(self._snrs)
+            digit = QDtmfDigit(self._current, start, self._count * block_time,
+                               round(snrs[len(snrs) // 2], 1))
+            self.digits.append(digit)
+            self._new.append(digit)
+        self._current = None
+        self._count = 0
+        self._snrs = [ ]
+
+    def feed(self, samples):
+        """ Feed samples to the detector.
+
+        Returns the list of QDtmfDigit ended with these samples.
+
+        Keyword arguments:
+            - samples: The samples, a list of numbers or a numpy array.
+
+        """
+        self._new = [ ]
+        if numpy is not None:
+            data = numpy.concatenate((self._pending,
+                                      numpy.asarray(samples, dtype=numpy.float64)))
+            count = len(data) // self.size
+            blocks = data[:count * self.size].reshape(count, self.size)
+        else:
+            data = self._pending + list(samples)
+            count = len(data) // self.size
+            blocks = [data[i * self.size:(i + 1) * self.size] for i in range(count)]
+        self._pending = data[count * self.size:]
+        if count:
+            powers, energies = self._powers(blocks)
+            for block, row, energy in zip(blocks, powers, energies):
+                digit, snr = self._classify(block, row, float(energy))
+                if digit != self._current:
+                    self._end_digit()
+                    self._current = digit
+                if digit is not None:
+                    self._count += 1
+                    self._snrs.append(snr)
+                self._block += 1
+        return self._new
+
+    def finish(self):
+        """ End the detection, returns the list of QDtmfDigit ended.
+
+        """
+        self._new = [ ]
+        self._end_digit()
+        return self._new
+
+    def sequence(self):
+        """ Returns the digits detected so far as a string.
+
+        """
+        return "".join(d.digit for d in self.digits)
+
+def detect(samples, rate=8000, min_snr=10.0):
+    """ Returns the list of QDtmfDigit in the samples.
+
+    Keyword arguments:
+        - samples: The samples, a list of numbers or a numpy array.
+        - rate: The sample rate, in Hz.
+        - min_snr: Minimum signal to noise ratio of a digit, in dB.
+
+    """
+    detector = QDtmfDetector(rate, min_snr)
+    detector.feed(samples)
+    detector.finish()
+    return detector.digits
+
+def detect_wav(path, min_snr=10.0):
+    """ Returns the list of QDtmfDigit in a WAV file.
+
+    """
+    rate, samples = read_wav(path)
+    return detect(samples, rate, min_snr)
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QDtmfDetector
+# -----------------------------------------------------------------------------
+import os
+import random
+import unittest
+
+class TestClassQDtmfDetector(unittest.TestCase):
+    """ Unittest for class QDtmfDetector
+
+    """
+    def tone(self, digit, seconds, rate=8000):
+        row = [i for i, keys in enumerate(KEYS) if digit in keys][0]
+        low, high = LOW[row], HIGH[KEYS[row].index(digit)]
+        return [8000 * math.sin(2 * math.pi * low * n / rate) +
+                8000 * math.sin(2 * math.pi * high * n / rate)
+                for n in range(int(seconds * rate))]
+
+    def test_sequence(self):
+        random.seed(1)
+        samples = [ ]
+        for digit in "159#":
+            samples += self.tone(digit, 0.1) + [0.0] * 400
+        samples = [s + random.gauss(0, 300) for s in samples]
+        detector = QDtmfDetector()
+        # feed in chunks, as captured
+        for i in range(0, len(samples), 1000):
+            detector.feed(samples[i:i + 1000])
+        detector.finish()
+        self.failUnless(detector.sequence() == "159#",
+            "Error: Unexpected digits %s" % repr(detector.digits))
+        self.failUnless(all(d.snr > 20 for d in detector.digits),
+            "Error: Unexpected SNR %s" % repr(detector.digits))
+
+    def test_noise(self):
+        random.seed(2)
+        samples = [random.gauss(0, 3000) for _ in range(8000)]
+        self.failUnless(detect(samples) == [], "Error: Digits found in noise")
+
+    def test_contrib_wav(self):
+        path = os.path.join(os.path.dirname(__file__), "..", "..", "contrib",
+                            "dtmf.wav")
+        if not os.path.isfile(path):
+            return
+        digits = detect_wav(path)
+        self.failUnless("5" in "".join(d.digit for d in digits),
+            "Error: Unexpected digits %s" % repr(digits))
+
+if __name__ == '__main__':
+    unittest.main()
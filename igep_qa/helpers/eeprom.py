@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+"""
+This provides access to the I2C EEPROMs (24Cxx) and to the board identity
+stored in them.
+
+The EEPROM is read in block transfers and written in pages, every page is
+verified and the end of the write cycle is detected by acknowledge polling
+instead of a fixed delay.
+
+"""
+
+import binascii
+import struct
+
+from collections import namedtuple
+
+from igep_qa.helpers.common import monotonic
+from igep_qa.helpers.i2c import get_bus, to_int
+
+# Board identity at the beginning of the EEPROM, little endian:
+#   magic "IGEP", layout version, board revision, serial number (16 bytes),
+#   OF number (16 bytes), MAC address (6 bytes) and the CRC32 of all of it.
+IDENTITY_MAGIC = "IGEP"
+IDENTITY_VERSION = 1
+IDENTITY = struct.Struct("<4sBB16s16s6s")
+IDENTITY_SIZE = IDENTITY.size + 4
+
+class QEeprom:
+    """ An I2C EEPROM (24Cxx)
+
+    Keyword arguments:
+        - bus: The I2C bus number or a QI2CBus.
+        - address: The device address.
+        - size: The size of the EEPROM, in bytes.
+        - page: The page size, in bytes, see the datasheet (e.g. 8 for a
+                24C02, 32 for a 24C32)
+        - block: Maximum bytes read in one transfer.
+        - write_time: Maximum time of a write cycle, in seconds.
+
+    """
+    def __init__(self, bus, address=0x50, size=256, page=8, block=256,
+                 write_time=0.02):
+        if isinstance(bus, (int, long, basestring)):
+            bus = get_bus(bus)
+        self.bus = bus
+        self.address = to_int(address)
+        self.size = size
+        self.page = page
+        self.block = block
+        self.write_time = write_time
+        # 24C01 to 24C16 use one byte of offset, the bigger ones two
+        self.offset_bytes = 1 if size <= 2048 else 2
+
+    def _target(self, offset):
+        # Returns the device address and the offset bytes of an offset, the
+        # 24C04 to 24C16 use the low address bits as the high offset bits
+        if self.offset_bytes == 2:
+            return self.address, struct.pack(">H", offset)
+        return self.address + (offset >> 8), chr(offset & 0xff)
+
+    def read(self, offset=0, length=None):
+        """ Read the EEPROM, by default all of it.
+
+        Returns a string, raises IOError on failure.
+
+        """
+        if length is None:
+            length = self.size - offset
+        data = [ ]
+        end = offset + length
+        while offset < end:
+            count = min(self.block, end - offset)
+            if self.offset_bytes == 1:
+                # a transfer can't cross a 256 bytes boundary of the small
+                # EEPROMs, the device address changes
+                count = min(count, 256 - (offset & 0xff))
+            address, prefix = self._target(offset)
+            data.append(self.bus.transfer(address, prefix, count))
+            offset += count
+        return "".join(data)
+
+    def _wait_write(self, address, prefix):
+        # Acknowledge polling, the EEPROM does not answer while writing
+        deadline = monotonic() + self.write_time
+        while True:
+            try:
+                self.bus.transfer(address, prefix)
+                return
+            except IOError:
+                if monotonic() > deadline:
+                    raise
+
+    def write(self, offset, data, verify=True):
+        """ Write data in pages, verifying every page.
+
+        Raises IOError on failure or if the data read back is different.
+
+        """
+        end = offset + len(data)
+        position = 0
+        while offset < end:
+            # a page write wraps at the end of the page
+            count = min(self.page - offset % self.page, end - offset)
+            chunk = data[position:position + count]
+            address, prefix = self._target(offset)
+            self.bus.transfer(address, prefix + chunk)
+            self._wait_write(address, prefix)
+            if verify and self.read(offset, count) != chunk:
+                raise IOError("EEPROM verify failed at offset %d" % offset)
+            offset += count
+            position += count
+
+    def update(self, offset, data):
+        """ Write only the pages that are different.
+
+        Returns the number of bytes written.
+
+        """
+        current = self.read(offset, len(data))
+        written = 0
+        position = 0
+        while position < len(data):
+            count = min(self.page - (offset + position) % self.page,
+                        len(data) - position)
+            chunk = data[position:position + count]
+            if current[position:position + count] != chunk:
+                self.write(offset + position, chunk)
+                written += count
+            position += count
+        return written
+
+class QBoardIdentity(namedtuple("QBoardIdentity", "revision serial of mac")):
+    """ Board identity stored in the EEPROM.
+
+    Attributes:
+        - revision: The board revision, a number.
+        - serial: The serial number, up to 16 characters.
+        - of: The OF (fabrication order) number, up to 16 characters.
+        - mac: The MAC address, e.g. 00:11:22:33:44:55, or '' if none.
+
+    """
+    __slots__ = ()
+
+    def pack(self):
+        """ Returns the identity as stored in the EEPROM.
+
+        The numbers can be of any type (e.g. unicode or int, as returned by
+        the database), raises ValueError if they don't fit.
+
+        """
+        # struct would truncate a long number silently
+        serial, of = str(self.serial), str(self.of)
+        for name, value in (("serial", serial), ("OF", of)):
+            if len(value) > 16:
+                raise ValueError("The %s number %s is longer than 16 "
+                                 "characters" % (name, value))
+        mac = binascii.unhexlify(self.mac.replace(":", "")) if self.mac else ""
+        data = IDENTITY.pack(IDENTITY_MAGIC, IDENTITY_VERSION, self.revision,
+                             serial, of, mac.ljust(6, "\0"))
+        return data + struct.pack("<I", binascii.crc32(data) & 0xffffffff)
+
+    @classmethod
+    def unpack(cls, data):
+        """ Returns the identity stored in the data.
+
+        Raises ValueError if there is no valid identity.
+
+        """
+        if len(data) < IDENTITY_SIZE:
+            raise ValueError("Identity too short")
+        data = data[:IDENTITY_SIZE]
+        if data == "\xff" * IDENTITY_SIZE:
+            raise ValueError("Blank EEPROM")
+        magic, version, revision, serial, of, mac = IDENTITY.unpack(data[:-4])
+        if magic != IDENTITY_MAGIC:
+            raise ValueError("Bad identity magic %s" % repr(magic))
+        crc = struct.unpack("<I", data[-4:])[0]
+        if crc != binascii.crc32(data[:-4]) & 0xffffffff:
+            raise ValueError("Bad identity checksum")
+        if version != IDENTITY_VERSION:
+            raise ValueError("Unknown identity version %d" % version)
+        if mac == "\0" * 6:
+            mac = ""
+        else:
+            mac = ":".join("%02x" % ord(c) for c in mac)
+        return cls(revision, serial.rstrip("\0"), of.rstrip("\0"), mac)
+
+def read_identity(eeprom):
+    """ Returns the QBoardIdentity of an EEPROM.
+
+    Raises ValueError if there is no valid identity and IOError if the
+    EEPROM can't be read.
+
+    """
+    return QBoardIdentity.unpack(eeprom.read(0, IDENTITY_SIZE))
+
+def write_identity(eeprom, identity):
+    """ Write a QBoardIdentity to an EEPROM, only the pages that change.
+
+    Returns the number of bytes written.
+
+    """
+    return eeprom.update(0, identity.pack())
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QEeprom
+# -----------------------------------------------------------------------------
+import unittest
+
+class QFakeEepromBus:
+    """ A bus with a 24Cxx EEPROM, busy for some transfers after a write.
+
+    """
+    def __init__(self, size=256, page=8, address=0x50, busy=3):
+        self.memory = ["\xff"] * size
+        self.page = page
+        self.address = address
+        self.busy = busy
+        self.pending = 0
+        self.writes = 0
+
+    def transfer(self, address, data="", read=0):
+        if self.pending:
+            self.pending -= 1
+            raise IOError(6, "No such device or address")
+        two = len(self.memory) > 2048
+        if two:
+            offset = struct.unpack(">H", data[:2])[0]
+            data = data[2:]
+        else:
+            offset = ((address - self.address) << 8) + ord(data[0])
+            data = data[1:]
+        if data:
+            base = offset - offset % self.page
+            for i, c in enumerate(data):
+                self.memory[base + (offset - base + i) % self.page] = c
+            self.pending = self.busy
+            self.writes += 1
+        return "".join(self.memory[offset:offset + read])
+
+class TestClassQEeprom(unittest.TestCase):
+    """ Unittest for class QEeprom
+
+    """
+    def test_identity(self):
+        identity = QBoardIdentity(3, "SN-0001", "OF-2024-17", "00:11:22:aa:bb:cc")
+        data = identity.pack()
+        self.failUnless(QBoardIdentity.unpack(data) == identity,
+            "Error: Unexpected identity %s" % repr(QBoardIdentity.unpack(data)))
+        corrupt = data[:10] + chr(ord(data[10]) ^ 1) + data[11:]
+        self.assertRaises(ValueError, QBoardIdentity.unpack, corrupt)
+        self.assertRaises(ValueError, QBoardIdentity.unpack, "\xff" * 64)
+        # numbers as returned by the database
+        retval = QBoardIdentity.unpack(QBoardIdentity(1, 1234, u"OF-1", "").pack())
+        self.failUnless(retval == (1, "1234", "OF-1", ""),
+            "Error: Unexpected identity %s" % repr(retval))
+        self.assertRaises(ValueError, QBoardIdentity(1, "S" * 17, "", "").pack)
+
+    def test_write_read(self):
+        for size, page in ((256, 8), (2048, 16), (4096, 32)):
+            bus = QFakeEepromBus(size, page)
+            eeprom = QEeprom(bus, size=size, page=page, block=64)
+            data = "".join(chr(i & 0xff) for i in range(size - 10))
+            eeprom.write(5, data)
+            self.failUnless(eeprom.read(5, len(data)) == data,
+                "Error: Unexpected data of a %d bytes EEPROM" % size)
+            self.failUnless(len(eeprom.read()) == size,
+                "Error: Unexpected size of a %d bytes EEPROM" % size)
+
+    def test_update_identity(self):
+        bus = QFakeEepromBus()
+        eeprom = QEeprom(bus)
+        identity = QBoardIdentity(1, "SN-0001", "OF-1", "")
+        write_identity(eeprom, identity)
+        writes = bus.writes
+        self.failUnless(read_identity(eeprom) == identity,
+            "Error: Unexpected identity %s" % repr(read_identity(eeprom)))
+        self.failUnless(write_identity(eeprom, identity) == 0 and
+                        bus.writes == writes,
+            "Error: Unchanged identity written again")
+        write_identity(eeprom, identity._replace(of="OF-2"))
+        self.failUnless(bus.writes - writes == 2,
+            "Error: Unexpected page writes %d" % (bus.writes - writes))
+
+if __name__ == '__main__':
+    unittest.main()
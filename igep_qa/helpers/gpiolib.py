@@ -7,11 +7,25 @@ See: Documentation/gpio.txt from kernel sources
 
 """
 
+import collections
+import errno
+import fcntl
 import os
+import Queue
+import select
+import struct
+import threading
+import time
+
+from igep_qa.helpers.common import monotonic
 
 class QGpio:
     """ GPIOLIB interface to access the GPIO pins from the User Space.
 
+    The value attribute is opened once and kept open, every access only
+    rewinds and reads/writes it. The direction is cached, so set_value only
+    writes the direction attribute when the GPIO was not already an output.
+
     """
     def __init__(self, gpio):
         """ Export a GPIO to userspace through sysfs
@@ -24,19 +38,27 @@ class QGpio:
         self.already_exported = True
         self.gpio = str(gpio)
         self.sysfs = '/sys/class/gpio/gpio%s' % gpio
-        if os.path.exists(self.sysfs):
+        # Last direction written or read, None if unknown
+        self.direction = None
+        try:
+            self.fd = os.open('%s/value' % self.sysfs, os.O_RDWR)
             if self.debug == True:
                 print "GPIO %s already exists, skipping exporting" % self.gpio
-            self.already_exported = True
-        else:
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
             fd = open('/sys/class/gpio/export', 'w')
             fd.write(self.gpio)
             fd.close()
+            self.fd = os.open('%s/value' % self.sysfs, os.O_RDWR)
 
     def __del__(self):
         """ Reverse gpio_export from User Space.
 
         """
+        if getattr(self, 'fd', None) is not None:
+            os.close(self.fd)
+            self.fd = None
         if not self.already_exported:
             fd = open('/sys/class/gpio/unexport', 'w')
             fd.write(self.gpio)
@@ -52,6 +74,7 @@ class QGpio:
             fd = open("%s/direction" % self.sysfs, "r")
             retval = fd.read()
             fd.close()
+            self.direction = retval.strip()
             return retval
         except IOError:
             if self.debug == True:
@@ -73,6 +96,10 @@ class QGpio:
             fd = open('%s/direction' % self.sysfs, 'w')
             fd.write(direction)
             fd.close()
+        # "high" and "low" configure the GPIO as output with an initial value
+        if direction in ("high", "low"):
+            direction = "out"
+        self.direction = direction
 
     def get_value(self):
         """ Get GPIO value.
@@ -80,10 +107,8 @@ class QGpio:
         Returns "0" for low level and "1" for high level.
 
         """
-        fd = open('%s/value' % self.sysfs, 'r')
-        retval = fd.read()
-        fd.close()
-        return int(retval)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        return int(os.read(self.fd, 8))
 
     def set_value(self, value):
         """ Set GPIO value.
@@ -92,10 +117,10 @@ class QGpio:
             - value: Set zero for low level and nonzero for high level.
 
         """
-        self.set_direction("out")
-        fd = open('%s/value' % self.sysfs, 'w')
-        fd.write(str(value))
-        fd.close()
+        if self.direction != "out":
+            self.set_direction("out")
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.write(self.fd, str(value))
 
     def get_active_low(self):
         """ Get active_low value.
@@ -152,6 +177,404 @@ class QGpio:
             fd.write(edge)
             fd.close()
 
+    def wait_edge(self, timeout=None, edge=None):
+        """ Wait for an edge on the GPIO.
+
+        Returns the GPIO value after the edge, or None on timeout.
+
+        Keyword arguments:
+            - timeout: Maximum time to wait, in seconds. None waits forever.
+            - edge: Optional edge to be set before waiting, "rising",
+                    "falling" or "both", otherwise uses the current one.
+
+        """
+        if edge is not None:
+            self.set_edge(edge)
+        monitor = QGpioEdgeMonitor()
+        try:
+            monitor.add(self)
+            event = monitor.wait(timeout)
+        finally:
+            monitor.close()
+        if event is None:
+            return None
+        return event.value
+
+# from linux/gpio.h (GPIO character device ABI v1)
+# struct gpiohandle_request {
+#    __u32 lineoffsets[GPIOHANDLES_MAX];
+#    __u32 flags;
+#    __u8 default_values[GPIOHANDLES_MAX];
+#    char consumer_label[32];
+#    __u32 lines;
+#    int fd;
+# };
+GPIOHANDLES_MAX = 64
+GPIOHANDLE_REQUEST_INPUT = 1 << 0
+GPIOHANDLE_REQUEST_OUTPUT = 1 << 1
+GPIOHANDLE_REQUEST = "=%dII%dB32sIi" % (GPIOHANDLES_MAX, GPIOHANDLES_MAX)
+GPIOHANDLE_DATA = "=%dB" % GPIOHANDLES_MAX
+GPIO_GET_LINEHANDLE_IOCTL = 0xC16CB403
+GPIOHANDLE_GET_LINE_VALUES_IOCTL = 0xC040B408
+GPIOHANDLE_SET_LINE_VALUES_IOCTL = 0xC040B409
+
+class QGpioChip:
+    """ GPIO character device interface (/dev/gpiochipN).
+
+    Lines are requested through ioctls on the chip and driven through a line
+    handle, the values of all lines of a handle are read or written with a
+    single ioctl.
+
+    See: Documentation/ABI/testing/gpio-cdev from kernel sources
+
+    """
+    def __init__(self, chip):
+        """ Open a GPIO chip
+
+        Keyword arguments:
+            - chip: GPIO chip number or device path, e.g. 0 or /dev/gpiochip0
+
+        """
+        if isinstance(chip, int):
+            chip = "/dev/gpiochip%d" % chip
+        self.chip = chip
+        self.fd = os.open(chip, os.O_RDWR)
+
+    def __del__(self):
+        if getattr(self, 'fd', None) is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def request(self, offsets, direction="in", values=None, label="igep_qa"):
+        """ Request a set of lines of the chip.
+
+        Returns a QGpioLines handle
+
+        Keyword arguments:
+            - offsets: Line number, or list of line numbers, within the chip.
+            - direction: "in" for input and "out" for output.
+            - values: Optional list of initial values for outputs.
+            - label: Consumer label shown by the kernel for the lines.
+
+        """
+        return QGpioLines(self, offsets, direction, values, label)
+
+class QGpioLines:
+    """ A handle to one or more lines requested from a QGpioChip.
+
+    A handle of one line can be used in place of a QGpio.
+
+    """
+    def __init__(self, chip, offsets, direction="in", values=None, label="igep_qa"):
+        if isinstance(offsets, int):
+            offsets = [offsets]
+        self.chip = chip
+        self.offsets = list(offsets)
+        self.label = label
+        self.direction = None
+        self.fd = None
+        self._request(direction, values)
+
+    def __del__(self):
+        self.close()
+
+    def _request(self, direction, values=None):
+        """ (Re)request the lines, the ABI v1 only sets direction on request.
+
+        """
+        self.close()
+        count = len(self.offsets)
+        if direction == "out":
+            flags = GPIOHANDLE_REQUEST_OUTPUT
+        else:
+            flags = GPIOHANDLE_REQUEST_INPUT
+        values = list(values or [])
+        req = struct.pack(GPIOHANDLE_REQUEST,
+                          *(self.offsets + [0] * (GPIOHANDLES_MAX - count) +
+                            [flags] +
+                            values + [0] * (GPIOHANDLES_MAX - len(values)) +
+                            [self.label, count, -1]))
+        req = fcntl.ioctl(self.chip.fd, GPIO_GET_LINEHANDLE_IOCTL, req)
+        self.fd = struct.unpack(GPIOHANDLE_REQUEST, req)[-1]
+        self.direction = direction
+
+    def close(self):
+        """ Release the lines.
+
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def get_direction(self):
+        """ Get lines direction.
+
+        Returns "in\n" for input and "out\n" for output, as QGpio does.
+
+        """
+        return "%s\n" % self.direction
+
+    def set_direction(self, direction):
+        """ Set lines direction.
+
+        Keyword arguments:
+            - direction: "in" for input and "out" for output.
+
+        """
+        if direction != self.direction:
+            self._request(direction)
+
+    def get_values(self):
+        """ Get the values of all lines with a single ioctl.
+
+        Returns a list of 0 for low level and 1 for high level.
+
+        """
+        data = struct.pack(GPIOHANDLE_DATA, *([0] * GPIOHANDLES_MAX))
+        data = fcntl.ioctl(self.fd, GPIOHANDLE_GET_LINE_VALUES_IOCTL, data)
+        return list(struct.unpack(GPIOHANDLE_DATA, data)[:len(self.offsets)])
+
+    def set_values(self, values):
+        """ Set the values of all lines with a single ioctl.
+
+        Keyword arguments:
+            - values: List of zero for low level and nonzero for high level.
+
+        """
+        if self.direction != "out":
+            self._request("out", [int(bool(v)) for v in values])
+            return
+        values = [int(bool(v)) for v in values]
+        data = struct.pack(GPIOHANDLE_DATA,
+                           *(values + [0] * (GPIOHANDLES_MAX - len(values))))
+        fcntl.ioctl(self.fd, GPIOHANDLE_SET_LINE_VALUES_IOCTL, data)
+
+    def get_value(self):
+        """ Get the value of the first line.
+
+        """
+        return self.get_values()[0]
+
+    def set_value(self, value):
+        """ Set the value of all lines.
+
+        """
+        self.set_values([int(value)] * len(self.offsets))
+
+def read_values(gpios):
+    """ Read the value of several GPIOs in one batch.
+
+    Returns a list with the values, a QGpioLines handle contributes the
+    values of all its lines (read with a single ioctl).
+
+    Keyword arguments:
+        - gpios: List of QGpio or QGpioLines.
+
+    """
+    values = [ ]
+    for gpio in gpios:
+        if isinstance(gpio, QGpioLines):
+            values.extend(gpio.get_values())
+        else:
+            values.append(gpio.get_value())
+    return values
+
+def wait_values(gpios, expected=None, timeout=2, settle=0.01, interval=0.001):
+    """ Poll several GPIOs until their values are stable.
+
+    The values are stable when they have not changed for 'settle' seconds
+    and, if given, are equal to the expected ones. The polling gives up when
+    the deadline is reached.
+
+    Returns the last values read.
+
+    Keyword arguments:
+        - gpios: List of QGpio or QGpioLines.
+        - expected: Optional list of expected values.
+        - timeout: Maximum time to wait, in seconds.
+        - settle: Time the values must be kept, in seconds (e.g. relay bounce)
+        - interval: Time between two reads, in seconds.
+
+    """
+    now = monotonic()
+    deadline = now + timeout
+    last = read_values(gpios)
+    since = now
+    while True:
+        now = monotonic()
+        if now - since >= settle and (expected is None or last == expected):
+            return last
+        if now >= deadline:
+            return last
+        time.sleep(interval)
+        values = read_values(gpios)
+        if values != last:
+            last = values
+            since = monotonic()
+
+QGpioEvent = collections.namedtuple("QGpioEvent", "gpio value timestamp")
+
+class QGpioEdgeMonitor:
+    """ Wait for edges on several GPIOs through a single epoll loop.
+
+    Every edge is returned as a QGpioEvent(gpio, value, timestamp), where
+    timestamp is the common.monotonic() time when the edge was noticed.
+
+    The monitor can also run in a background thread (see start()), so a test
+    can go on with other checks and collect the edges later, e.g. while the
+    operator presses a button.
+
+    .. warning::
+
+        While a monitor is running in background do not read the monitored
+        QGpio from other threads, both share its value file descriptor.
+
+    """
+    def __init__(self):
+        self.epoll = select.epoll()
+        self.gpios = { }
+        self.events = Queue.Queue()
+        self.thread = None
+        self.running = False
+
+    def __del__(self):
+        self.close()
+
+    def add(self, gpio, edge=None):
+        """ Add a GPIO to the monitor.
+
+        Keyword arguments:
+            - gpio: The QGpio to be monitored.
+            - edge: Optional edge to be set, "rising", "falling" or "both".
+
+        """
+        if edge is not None:
+            gpio.set_edge(edge)
+        # read the value to clear a pending notification
+        gpio.get_value()
+        self.gpios[gpio.fd] = gpio
+        self.epoll.register(gpio.fd, select.EPOLLPRI | select.EPOLLERR)
+
+    def remove(self, gpio):
+        """ Remove a GPIO from the monitor.
+
+        """
+        self.epoll.unregister(gpio.fd)
+        del self.gpios[gpio.fd]
+
+    def close(self):
+        """ Stop the monitor and release the epoll instance.
+
+        """
+        self.stop()
+        if not self.epoll.closed:
+            self.epoll.close()
+
+    def poll(self, timeout=None):
+        """ Wait for edges.
+
+        Returns the list of QGpioEvent, empty on timeout.
+
+        Keyword arguments:
+            - timeout: Maximum time to wait, in seconds. None waits forever.
+
+        """
+        if timeout is None:
+            timeout = -1
+        try:
+            ready = self.epoll.poll(timeout)
+        except IOError as e:
+            if e.errno != errno.EINTR:
+                raise
+            return [ ]
+        now = monotonic()
+        return [QGpioEvent(self.gpios[fd], self.gpios[fd].get_value(), now)
+                for fd, mask in ready if fd in self.gpios]
+
+    def wait(self, timeout=None):
+        """ Wait for the first edge in any of the GPIOs.
+
+        Returns a QGpioEvent, or None on timeout.
+
+        Keyword arguments:
+            - timeout: Maximum time to wait, in seconds. None waits forever.
+
+        """
+        if timeout is not None:
+            deadline = monotonic() + timeout
+        while True:
+            if timeout is not None:
+                timeout = max(0, deadline - monotonic())
+            events = self.poll(timeout)
+            if events:
+                return events[0]
+            if timeout is not None and monotonic() >= deadline:
+                return None
+
+    def collect(self, duration, count=None):
+        """ Collect the edges of all GPIOs during some time.
+
+        Returns the list of QGpioEvent in the order they were noticed.
+
+        Keyword arguments:
+            - duration: Time to collect edges, in seconds.
+            - count: Optional number of edges after which to stop earlier.
+
+        """
+        deadline = monotonic() + duration
+        events = [ ]
+        while count is None or len(events) < count:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            events.extend(self.poll(remaining))
+        return events
+
+    def start(self):
+        """ Start collecting edges in a background thread.
+
+        The edges are queued and can be retrieved with get().
+
+        """
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            for event in self.poll(0.1):
+                self.events.put(event)
+
+    def stop(self):
+        """ Stop the background thread, the queued edges are kept.
+
+        """
+        if self.thread is None:
+            return
+        self.running = False
+        self.thread.join()
+        self.thread = None
+
+    def get(self, timeout=None):
+        """ Get the next edge collected in background.
+
+        Returns a QGpioEvent, or None on timeout.
+
+        Keyword arguments:
+            - timeout: Maximum time to wait, in seconds. None waits forever.
+
+        """
+        if timeout is None:
+            # a blocking get without timeout can not be interrupted
+            timeout = 365 * 24 * 3600
+        try:
+            return self.events.get(True, timeout)
+        except Queue.Empty:
+            return None
+
 # -----------------------------------------------------------------------------
 # Test Cases for class TGPIO
 # -----------------------------------------------------------------------------
@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+
+"""
+This provides access to the I2C buses through the /dev/i2c-N devices.
+
+The SMBus transactions are done with ioctls from the test process, every
+bus is opened once and shared, see get_bus().
+
+See: Documentation/i2c/dev-interface from kernel sources
+
+"""
+
+import ctypes
+import errno
+import fcntl
+import os
+import threading
+
+from collections import namedtuple
+
+from igep_qa.helpers.common import monotonic
+
+# from linux/i2c-dev.h and linux/i2c.h
+I2C_SLAVE = 0x0703
+I2C_SLAVE_FORCE = 0x0706
+I2C_RDWR = 0x0707
+I2C_SMBUS = 0x0720
+I2C_M_RD = 0x0001
+I2C_SMBUS_READ = 1
+I2C_SMBUS_WRITE = 0
+I2C_SMBUS_QUICK = 0
+I2C_SMBUS_BYTE = 1
+I2C_SMBUS_BYTE_DATA = 2
+I2C_SMBUS_WORD_DATA = 3
+I2C_SMBUS_BLOCK_MAX = 32
+
+class _SMBusData(ctypes.Union):
+    # union i2c_smbus_data
+    _fields_ = [("byte", ctypes.c_uint8),
+                ("word", ctypes.c_uint16),
+                ("block", ctypes.c_uint8 * (I2C_SMBUS_BLOCK_MAX + 2))]
+
+class _SMBusIoctlData(ctypes.Structure):
+    # struct i2c_smbus_ioctl_data
+    _fields_ = [("read_write", ctypes.c_uint8),
+                ("command", ctypes.c_uint8),
+                ("size", ctypes.c_uint32),
+                ("data", ctypes.POINTER(_SMBusData))]
+
+class _I2CMsg(ctypes.Structure):
+    # struct i2c_msg
+    _fields_ = [("addr", ctypes.c_uint16),
+                ("flags", ctypes.c_uint16),
+                ("len", ctypes.c_uint16),
+                ("buf", ctypes.POINTER(ctypes.c_uint8))]
+
+class _I2CRdwrIoctlData(ctypes.Structure):
+    # struct i2c_rdwr_ioctl_data
+    _fields_ = [("msgs", ctypes.POINTER(_I2CMsg)),
+                ("nmsgs", ctypes.c_uint32)]
+
+def to_int(value):
+    """ Returns an address, register or value given as a number or a string,
+    e.g. '0x48'
+
+    """
+    if isinstance(value, basestring):
+        return int(value, 0)
+    return int(value)
+
+class QI2CResult(namedtuple("QI2CResult", "bus address register value "
+                            "expected duration error")):
+    """ Result of an I2C probe.
+
+    Attributes:
+        - bus: The I2C bus number.
+        - address: The device address.
+        - register: The register read, None for a byte read without
+                    register.
+        - value: The value read, None on error.
+        - expected: The expected value, None if any value is good.
+        - duration: Time of the transaction, in seconds.
+        - error: The error message, None on success.
+
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return (self.error is None and
+                (self.expected is None or self.value == self.expected))
+
+    def __str__(self):
+        where = "bus %d address 0x%02x" % (self.bus, self.address)
+        if self.register is not None:
+            where += " register 0x%02x" % self.register
+        if self.error is not None:
+            return "%s: %s" % (where, self.error)
+        retval = "%s: 0x%02x" % (where, self.value)
+        if self.expected is not None and self.value != self.expected:
+            retval += ", expected 0x%02x" % self.expected
+        return retval + " (%.2f ms)" % (self.duration * 1000)
+
+class QI2CBus:
+    """ An I2C bus, /dev/i2c-N
+
+    The device address is selected with I2C_SLAVE_FORCE, as 'i2cget -f',
+    so devices bound to a kernel driver can be accessed too, but scan()
+    skips them as i2cdetect does.
+
+    Keyword arguments:
+        - bus: The I2C bus number.
+
+    """
+    def __init__(self, bus):
+        self.bus = to_int(bus)
+        self.fd = os.open("/dev/i2c-%d" % self.bus, os.O_RDWR)
+        # the address selected and whether it was forced
+        self.address = None
+        self.lock = threading.Lock()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if getattr(self, "fd", None) is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _select(self, address, force):
+        # I2C_SLAVE fails with EBUSY if a kernel driver owns the address
+        if (address, force) != self.address:
+            self.address = None
+            fcntl.ioctl(self.fd, I2C_SLAVE_FORCE if force else I2C_SLAVE,
+                        address)
+            self.address = (address, force)
+
+    def _smbus(self, address, read_write, command, size, value=None,
+               force=True):
+        address = to_int(address)
+        with self.lock:
+            self._select(address, force)
+            data = _SMBusData()
+            if size == I2C_SMBUS_WORD_DATA and value is not None:
+                data.word = value
+            elif value is not None:
+                data.byte = value
+            args = _SMBusIoctlData(read_write, command, size,
+                                   ctypes.pointer(data))
+            fcntl.ioctl(self.fd, I2C_SMBUS, args)
+        if size == I2C_SMBUS_WORD_DATA:
+            return data.word
+        return data.byte
+
+    def transfer(self, address, data="", read=0):
+        """ Write some bytes and then read some bytes in one combined
+        transaction (I2C_RDWR), e.g. set the offset of an EEPROM and read
+        a block.
+
+        Returns the bytes read, raises IOError on failure.
+
+        Keyword arguments:
+            - address: The device address.
+            - data: The bytes to be written, a string.
+            - read: The number of bytes to be read.
+
+        """
+        address = to_int(address)
+        buffers, messages = [ ], [ ]
+        if data or not read:
+            wbuf = (ctypes.c_uint8 * max(1, len(data)))(*map(ord, data))
+            buffers.append(wbuf)
+            messages.append(_I2CMsg(address, 0, len(data),
+                                    ctypes.cast(wbuf, ctypes.POINTER(ctypes.c_uint8))))
+        if read:
+            rbuf = (ctypes.c_uint8 * read)()
+            buffers.append(rbuf)
+            messages.append(_I2CMsg(address, I2C_M_RD, read,
+                                    ctypes.cast(rbuf, ctypes.POINTER(ctypes.c_uint8))))
+        msgs = (_I2CMsg * len(messages))(*messages)
+        args = _I2CRdwrIoctlData(msgs, len(messages))
+        with self.lock:
+            fcntl.ioctl(self.fd, I2C_RDWR, args)
+        if read:
+            return ctypes.string_at(rbuf, read)
+        return ""
+
+    def write_quick(self, address):
+        """ SMBus quick write, only the address is sent.
+
+        """
+        self._smbus(address, I2C_SMBUS_WRITE, 0, I2C_SMBUS_QUICK)
+
+    def read_byte(self, address):
+        """ SMBus receive byte, reads a byte without register.
+
+        """
+        return self._smbus(address, I2C_SMBUS_READ, 0, I2C_SMBUS_BYTE)
+
+    def read_byte_data(self, address, register):
+        """ SMBus read byte, reads a register.
+
+        """
+        return self._smbus(address, I2C_SMBUS_READ, to_int(register),
+                           I2C_SMBUS_BYTE_DATA)
+
+    def write_byte_data(self, address, register, value):
+        """ SMBus write byte, writes a register.
+
+        """
+        self._smbus(address, I2C_SMBUS_WRITE, to_int(register),
+                    I2C_SMBUS_BYTE_DATA, to_int(value))
+
+    def read_word_data(self, address, register):
+        """ SMBus read word, reads a 16-bit register.
+
+        """
+        return self._smbus(address, I2C_SMBUS_READ, to_int(register),
+                           I2C_SMBUS_WORD_DATA)
+
+    def probe(self, address, register=None, expected=None, force=True):
+        """ Read a register, or a byte without register, of a device.
+
+        Returns a QI2CResult, the errors are not raised.
+
+        Keyword arguments:
+            - address: The device address.
+            - register: Optional register.
+            - expected: Optional expected value.
+            - force: Read the device even if a kernel driver owns it,
+                     otherwise the error is EBUSY and nothing is sent.
+
+        """
+        address = to_int(address)
+        if register is not None and register != '':
+            register = to_int(register)
+        else:
+            register = None
+        if expected is not None:
+            expected = to_int(expected)
+        value = error = None
+        start = monotonic()
+        try:
+            if register is None:
+                value = self._smbus(address, I2C_SMBUS_READ, 0,
+                                    I2C_SMBUS_BYTE, force=force)
+            else:
+                value = self._smbus(address, I2C_SMBUS_READ, register,
+                                    I2C_SMBUS_BYTE_DATA, force=force)
+        except IOError as e:
+            error = os.strerror(e.errno) if e.errno else str(e)
+        return QI2CResult(self.bus, address, register, value, expected,
+                          monotonic() - start, error)
+
+    def scan(self, first=0x03, last=0x77):
+        """ Probe every address of the bus with a byte read, as
+        'i2cdetect -r'. The addresses owned by a kernel driver are not
+        read, their error is EBUSY ('UU' in bus_map()).
+
+        Returns a dictionary of address to QI2CResult.
+
+        """
+        return dict((address, self.probe(address, force=False))
+                    for address in range(first, last + 1))
+
+def bus_map(results):
+    """ Returns the results of scan() as a table like i2cdetect.
+
+    """
+    lines = ["     " + " ".join("%2x" % i for i in range(16))]
+    for row in range(0, 0x80, 0x10):
+        cells = [ ]
+        for address in range(row, row + 0x10):
+            result = results.get(address)
+            if result is None:
+                cells.append("  ")
+            elif result.error is None:
+                cells.append("%02x" % address)
+            elif result.error == os.strerror(errno.EBUSY):
+                cells.append("UU")
+            else:
+                cells.append("--")
+        lines.append("%02x: %s" % (row, " ".join(cells)))
+    return "\n".join(lines)
+
+_buses = { }
+_buses_lock = threading.Lock()
+
+def get_bus(bus):
+    """ Returns the shared QI2CBus of a bus number, opened the first time.
+
+    """
+    bus = to_int(bus)
+    with _buses_lock:
+        if bus not in _buses:
+            _buses[bus] = QI2CBus(bus)
+        return _buses[bus]
+
+def probe_all(devices):
+    """ Probe a list of devices, every bus is opened once.
+
+    Returns the list of QI2CResult in the same order.
+
+    Keyword arguments:
+        - devices: List of (bus, address, register, expected) tuples, the
+                   register and the expected value can be None.
+
+    """
+    results = [ ]
+    for bus, address, register, expected in devices:
+        try:
+            handle = get_bus(bus)
+        except OSError as e:
+            results.append(QI2CResult(to_int(bus), to_int(address), None, None,
+                                      None, 0.0, e.strerror))
+            continue
+        results.append(handle.probe(address, register, expected))
+    return results
+
+# -----------------------------------------------------------------------------
+# Test Cases for the I2C helpers
+# -----------------------------------------------------------------------------
+import unittest
+
+class TestClassQI2CBus(unittest.TestCase):
+    """ Unittest for class QI2CBus
+
+    """
+    def test_struct(self):
+        # struct i2c_smbus_ioctl_data is 16 bytes with 64-bit pointers
+        size = ctypes.sizeof(_SMBusIoctlData)
+        self.failUnless(size == 8 + ctypes.sizeof(ctypes.c_void_p),
+            "Error: Unexpected size %d" % size)
+
+    def test_bus_map(self):
+        results = {0x48: QI2CResult(0, 0x48, None, 0, None, 0.001, None),
+                   0x4b: QI2CResult(0, 0x4b, None, None, None, 0.001,
+                                    os.strerror(errno.EBUSY)),
+                   0x50: QI2CResult(0, 0x50, None, None, None, 0.001,
+                                    os.strerror(errno.ENXIO))}
+        lines = bus_map(results).splitlines()
+        cell = lambda a: lines[1 + a // 16][4 + 3 * (a % 16):6 + 3 * (a % 16)]
+        self.failUnless(lines[5].startswith("40:") and cell(0x48) == "48" and
+                        cell(0x4b) == "UU" and cell(0x50) == "--" and
+                        cell(0x51) == "  ",
+            "Error: Unexpected map %s" % lines)
+
+    def test_scan(self):
+        class QFakeBus(QI2CBus):
+            # no device node, 0x4b is owned by a driver
+            def __init__(self):
+                self.bus = 0
+                self.fd = -1
+                self.address = None
+                self.lock = threading.Lock()
+                self.calls = [ ]
+            def close(self):
+                pass
+        def ioctl(fd, request, arg):
+            bus.calls.append((request, bus.address))
+            if request == I2C_SLAVE and arg == 0x4b:
+                raise IOError(errno.EBUSY, os.strerror(errno.EBUSY))
+        bus = QFakeBus()
+        saved = fcntl.ioctl
+        fcntl.ioctl = ioctl
+        try:
+            results = bus.scan(0x4a, 0x4c)
+            reads = [a for r, a in bus.calls if r == I2C_SMBUS]
+            self.failUnless(I2C_SLAVE_FORCE not in [r for r, a in bus.calls],
+                "Error: Address forced by scan %s" % bus.calls)
+            self.failUnless(reads == [(0x4a, False), (0x4c, False)],
+                "Error: Unexpected reads %s" % reads)
+            self.failUnless(results[0x4a].ok and
+                            results[0x4b].error == os.strerror(errno.EBUSY),
+                "Error: Unexpected results %s" % results)
+            result = bus.probe(0x4b)
+            self.failUnless(result.ok and bus.address == (0x4b, True),
+                "Error: Unexpected probe %s" % str(result))
+        finally:
+            fcntl.ioctl = saved
+
+    def test_missing_bus(self):
+        result = probe_all([(99, '0x50', None, None)])[0]
+        self.failUnless(not result.ok and result.address == 0x50,
+            "Error: Unexpected result %s" % str(result))
+
+if __name__ == '__main__':
+    unittest.main()
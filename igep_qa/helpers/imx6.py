@@ -5,8 +5,9 @@ This provides various i.MX6/IGEP related helper functions.
 
 """
 
-from igep_qa.helpers.common import QMmap, QCpuinfo
-import commands
+from igep_qa.helpers.board import get_board
+from igep_qa.helpers.common import QMmap
+from igep_qa.helpers.mixer import apply_profile
 
 def imx6_get_unique_id():
     """ Single die identifier for i.MX6 processors
@@ -25,11 +26,12 @@ def cpu_is_imx6():
     """ Returns True if machine is i.MX6, otherwise returns False
 
     """
-    cpu = QCpuinfo()
-    if cpu["Hardware"] == "Freescale i.MX6 Quad/DualLite (Device Tree)":
-        return True
-    # otherwise
-    return False
+    return get_board().soc == "imx6"
+
+# Mixer settings to playback/capture via headset, see QMixer
+IGEP0046_HEADSET = [
+    ("sset", "PCM,0", "127"),
+]
 
 def igep0046_set_headset_amixer_settings(headset):
     """ Set amixer settings to playback/capture via headset,
@@ -37,5 +39,7 @@ def igep0046_set_headset_amixer_settings(headset):
     Make sure that the following amixer settings are done for the corresponding
     card (check the card no. by running the command cat /proc/asound/cards).
 
+    Returns the list of settings that could not be set, empty on success.
+
     """
-    commands.getoutput("amixer -c %s sset 'PCM' 127" % headset)
+    return apply_profile(headset, "igep0046-headset", IGEP0046_HEADSET)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+"""
+This provides a helper to set up the ALSA mixer of a sound card.
+
+A profile, a list of mixer settings, is applied in a single 'amixer -s'
+session and read back to verify it. The last profile applied to every card
+is remembered, so applying it again does nothing.
+
+"""
+
+import hashlib
+import os
+import re
+
+from igep_qa.helpers.command import run
+
+# The last profile applied to every card, /tmp is empty after a reboot
+STAMP = "/tmp/igep_qa-mixer-card%s"
+
+class QMixer:
+    """ ALSA mixer of a sound card.
+
+    A profile is a list of (command, control, value) settings, where command
+    is "cset" for a control set by name (see 'amixer contents') or "sset"
+    for a simple mixer control (see 'amixer scontents'). E.g.
+
+    .. code-block:: python
+
+        [("cset", "Headset Playback Volume", "12"),
+         ("sset", "Analog Left,0", "Headset Mic")]
+
+    Keyword arguments:
+        - card: The sound card number.
+
+    """
+    def __init__(self, card):
+        self.card = str(card)
+        self.stamp = STAMP % self.card
+
+    def _quote(self, value):
+        return "'%s'" % value if " " in value else value
+
+    def _line(self, setting):
+        command, control, value = setting
+        if command == "cset":
+            return "cset name='%s' %s" % (control, self._quote(value))
+        name, _, index = control.rpartition(",")
+        if not name or not index.isdigit():
+            name, index = control, "0"
+        return "sset '%s',%s %s" % (name, index, self._quote(value))
+
+    def _digest(self, name, profile):
+        lines = "\n".join(self._line(s) for s in profile)
+        return "%s %s" % (name, hashlib.md5(lines).hexdigest())
+
+    def is_applied(self, name, profile):
+        """ Returns True if the profile is the last one applied to the card.
+
+        """
+        try:
+            fd = open(self.stamp, "r")
+            retval = fd.read().strip() == self._digest(name, profile)
+            fd.close()
+            return retval
+        except IOError:
+            return False
+
+    def contents(self):
+        """ Returns the controls of the card, indexed by name.
+
+        Every control is a dictionary with its 'type', the list of 'values'
+        and the 'items' of enumerated controls.
+
+        """
+        controls = { }
+        control = None
+        output = run(["amixer", "-c", self.card, "contents"], 10).output
+        for line in output.splitlines():
+            line = line.strip()
+            m = re.match(r"numid=\d+,iface=\w+,name='(.*)'", line)
+            if m:
+                control = {'type': '', 'values': [ ], 'items': { }}
+                controls[m.group(1)] = control
+                continue
+            if control is None:
+                continue
+            m = re.match(r"; type=(\w+)", line)
+            if m:
+                control['type'] = m.group(1)
+            m = re.match(r"; Item #(\d+) '(.*)'", line)
+            if m:
+                control['items'][m.group(2)] = m.group(1)
+            if line.startswith(": values="):
+                control['values'] = line[len(": values="):].split(",")
+        return controls
+
+    def scontents(self):
+        """ Returns the lines of every simple mixer control, indexed by
+        'name,index'.
+
+        """
+        controls = { }
+        lines = None
+        output = run(["amixer", "-c", self.card, "scontents"], 10).output
+        for line in output.splitlines():
+            m = re.match(r"Simple mixer control '(.*)',(\d+)", line)
+            if m:
+                lines = [ ]
+                controls["%s,%s" % m.groups()] = lines
+            elif lines is not None:
+                lines.append(line.strip())
+        return controls
+
+    def _check_cset(self, control, value):
+        if control is None:
+            return False
+        if control['type'] == "BOOLEAN":
+            value = {"1": "on", "0": "off"}.get(value, value)
+        elif control['type'] == "ENUMERATED":
+            value = control['items'].get(value, value)
+        return bool(control['values']) and all(v == value for v in control['values'])
+
+    def _check_sset(self, lines, value):
+        if lines is None:
+            return False
+        if value.isdigit():
+            found = re.findall(r"(?:Playback|Capture) (-?\d+) \[", " ".join(lines))
+            return bool(found) and all(v == value for v in found)
+        if value in ("on", "off", "mute", "unmute", "cap", "nocap"):
+            value = {"mute": "off", "unmute": "on", "cap": "on",
+                     "nocap": "off"}.get(value, value)
+            found = re.findall(r"\[(on|off)\]", " ".join(lines))
+            return bool(found) and all(v == value for v in found)
+        found = re.findall(r"Item\d+: '(.*?)'", " ".join(lines))
+        if found:
+            return all(v == value for v in found)
+        # e.g. percentages or dB, can't be compared with the raw values
+        return True
+
+    def verify(self, profile):
+        """ Read back the mixer and returns the settings of the profile
+        that are not set.
+
+        """
+        retval = [ ]
+        contents = scontents = None
+        for setting in profile:
+            command, control, value = setting
+            if command == "cset":
+                if contents is None:
+                    contents = self.contents()
+                if not self._check_cset(contents.get(control), value):
+                    retval.append(setting)
+            else:
+                if scontents is None:
+                    scontents = self.scontents()
+                if "," not in control:
+                    control += ",0"
+                if not self._check_sset(scontents.get(control), value):
+                    retval.append(setting)
+        return retval
+
+    def apply(self, name, profile, verify=True, force=False):
+        """ Apply a profile to the card.
+
+        Returns the list of settings that could not be set, empty on
+        success. Nothing is done if the profile was already applied.
+
+        Keyword arguments:
+            - name: The name of the profile.
+            - profile: The list of (command, control, value) settings.
+            - verify: Read back the mixer to verify the profile.
+            - force: Apply the profile even if it was already applied.
+
+        """
+        if not force and self.is_applied(name, profile):
+            return [ ]
+        if os.path.exists(self.stamp):
+            os.remove(self.stamp)
+        script = "".join(self._line(s) + "\n" for s in profile)
+        result = run(["amixer", "-c", self.card, "-s"], 30, stdin=script)
+        if verify:
+            retval = self.verify(profile)
+        elif not result.ok:
+            retval = list(profile)
+        else:
+            retval = [ ]
+        if not retval:
+            fd = open(self.stamp, "w")
+            fd.write(self._digest(name, profile) + "\n")
+            fd.close()
+        return retval
+
+def apply_profile(card, name, profile, verify=True, force=False):
+    """ Apply a mixer profile to a sound card, see QMixer.apply
+
+    """
+    return QMixer(card).apply(name, profile, verify, force)
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QMixer
+# -----------------------------------------------------------------------------
+import unittest
+
+class TestClassQMixer(unittest.TestCase):
+    """ Unittest for class QMixer
+
+    """
+    CONTENTS = {
+        'DL1 PDM Switch': {'type': 'BOOLEAN', 'values': ['on'], 'items': { }},
+        'SDT DL Volume': {'type': 'INTEGER', 'values': ['120', '120'], 'items': { }},
+        'MUX_UL00': {'type': 'ENUMERATED', 'values': ['1'],
+                     'items': {'None': '0', 'AMic0': '1'}},
+    }
+
+    SCONTENTS = {
+        'PCM,0': ["Capabilities: pvolume", "Limits: Playback 0 - 127",
+                  "Front Left: Playback 127 [100%] [0.00dB]",
+                  "Front Right: Playback 127 [100%] [0.00dB]"],
+        'Analog Left,0': ["Capabilities: enum", "Items: 'Off' 'Headset Mic'",
+                          "Item0: 'Headset Mic'"],
+    }
+
+    def setUp(self):
+        self.mixer = QMixer(0)
+        self.mixer.contents = lambda: self.CONTENTS
+        self.mixer.scontents = lambda: self.SCONTENTS
+
+    def test_lines(self):
+        retval = self.mixer._line(("sset", "Analog Left,0", "Headset Mic"))
+        self.failUnless(retval == "sset 'Analog Left',0 'Headset Mic'",
+            "Error: Unexpected line %s" % retval)
+        retval = self.mixer._line(("cset", "DL1 PDM Switch", "1"))
+        self.failUnless(retval == "cset name='DL1 PDM Switch' 1",
+            "Error: Unexpected line %s" % retval)
+
+    def test_verify(self):
+        profile = [("cset", "DL1 PDM Switch", "1"),
+                   ("cset", "SDT DL Volume", "120"),
+                   ("cset", "MUX_UL00", "AMic0"),
+                   ("sset", "PCM", "127"),
+                   ("sset", "Analog Left,0", "Headset Mic")]
+        retval = self.mixer.verify(profile)
+        self.failUnless(retval == [], "Error: Unexpected mismatches %s" % retval)
+        profile = [("cset", "SDT DL Volume", "100"), ("sset", "PCM", "0"),
+                   ("cset", "Missing", "1")]
+        retval = self.mixer.verify(profile)
+        self.failUnless(retval == profile, "Error: Unexpected mismatches %s" % retval)
+
+if __name__ == '__main__':
+    unittest.main()
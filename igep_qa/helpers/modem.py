@@ -5,10 +5,20 @@ This provides helper functions for Modem chips.
 
 """
 
-import serial
 import time
 
-from igep_qa.helpers.gpiolib import QGpio
+from igep_qa.helpers.atsession import QATSession
+from igep_qa.helpers.common import monotonic
+from igep_qa.helpers.gpiolib import QGpio, QGpioEdgeMonitor
+
+# Minimum times from the GE865 Hardware User Guide, in seconds
+ON_PULSE = 1.0
+OFF_PULSE = 2.0
+RESET_PULSE = 0.2
+# Time off before turning the modem on again
+OFF_GUARD = 1.5
+# Timeout of every AT readiness probe
+PROBE = 0.2
 
 class QModemTelit:
     """ ModemTelit (GE865)
@@ -33,62 +43,122 @@ class QModemTelit:
         self.on = QGpio(on)
         self.reset = QGpio(reset)
         self.pwrmon = QGpio(pwrmon)
-        self.port = serial.Serial(port, timeout=1)
+        # the GE865 detects the baud rate of the AT commands
+        self.session = QATSession(port, 9600, timeout=5)
+        # Measured power sequencing latencies, in seconds
+        self.latencies = { }
+        # Time the modem was turned off, None if unknown
+        self.off = None
 
     def __del__(self):
-        self.port.close()
-
-    def turn_on(self):
+        self.session.close()
+
+    def _wait_pwrmon(self, value, timeout):
+        # Wait for PWRMON to reach the value, woken up by its edges. The
+        # value is also checked every 50 ms in case the GPIO has no edge
+        # interrupt. Returns the time spent or None on timeout.
+        start = monotonic()
+        deadline = start + timeout
+        monitor = QGpioEdgeMonitor()
+        try:
+            monitor.add(self.pwrmon, "both")
+            while self.pwrmon.get_value() != value:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return None
+                monitor.wait(min(0.05, remaining))
+        finally:
+            monitor.close()
+        return monotonic() - start
+
+    def _wait_ready(self, timeout):
+        # Probe with AT until the modem answers. Returns the time spent or
+        # None on timeout.
+        start = monotonic()
+        deadline = start + timeout
+        while monotonic() < deadline:
+            retval = self.command("AT", min(PROBE, max(0, deadline - monotonic())))
+            if retval.ok:
+                return monotonic() - start
+            if retval.result is not None:
+                # answered with an error, don't flood the modem
+                time.sleep(PROBE)
+        return None
+
+    def _pulse(self, gpio, seconds):
+        gpio.set_value(1)
+        time.sleep(seconds)
+        gpio.set_value(0)
+
+    def turn_on(self, timeout=10):
         """ Turning ON the GE865 by tying pulse pin ON#
 
-        Return 1 if fail and the modem is OFF, 0 on success
+        Return 1 if fail and the modem is OFF or does not answer, 0 on
+        success
 
         To turn on the GE865 the pad ON# must be tied low for at least 1 second
-        and then released.
+        and then released. The modem is on when PWRMON goes high and ready
+        when it answers the AT command, the latencies are stored in
+        self.latencies ('on' and 'ready').
+
+        Keyword arguments:
+            - timeout: Maximum time to wait for each of PWRMON and the AT
+                       answer, in seconds.
 
         """
-        retval = 0
         if self.pwrmon.get_value() == 0:
+            # the modem needs some time off before turning it on again
+            if self.off is not None:
+                remaining = OFF_GUARD - (monotonic() - self.off)
+                if remaining > 0:
+                    time.sleep(remaining)
             # modem is OFF, power ON impulse
-            self.on.set_value(1)
-            time.sleep(1)
-            self.on.set_value(0)
-            time.sleep(2)
-            if self.pwrmon.get_value() == 0:
+            self._pulse(self.on, ON_PULSE)
+            latency = self._wait_pwrmon(1, timeout)
+            if latency is None:
                 # fail, the modem is OFF
-                retval = 1
-        time.sleep(1)
+                return 1
+            self.latencies['on'] = latency
+        self.off = None
+        latency = self._wait_ready(timeout)
+        if latency is None:
+            # fail, the modem does not answer
+            return 1
+        self.latencies['ready'] = latency
         # success, the modem is ON
-        return retval
+        return 0
 
-    def turn_off(self):
+    def turn_off(self, timeout=15):
         """ Turning OFF the GE865 by tying pulse pin ON
 
         Returns 1 if fail and the modem is ON, 0 on success
 
         To turn OFF the GE865 the pad ON must be tied low for at least 2
-        seconds and then released.
+        seconds and then released. The modem is off when PWRMON goes low,
+        the latency is stored in self.latencies ('off').
+
+        Keyword arguments:
+            - timeout: Maximum time to wait for PWRMON, in seconds.
 
         """
-        retval = 0
         if self.pwrmon.get_value() == 1:
             # modem is ON, power OFF impulse
-            self.on.set_value(1)
-            time.sleep(2)
-            self.on.set_value(0)
-            time.sleep(15)
-            if self.pwrmon.get_value() == 1:
+            self._pulse(self.on, OFF_PULSE)
+            latency = self._wait_pwrmon(0, timeout)
+            if latency is None:
                 # fail, the modem is ON
-                retval = 1
-        time.sleep(1.5)
+                return 1
+            self.latencies['off'] = latency
+            self.off = monotonic()
         # success, the modem is OFF
-        return retval
+        return 0
 
-    def restart(self):
+    def restart(self, timeout=10):
         """ Resetting/restarting the GE865
 
         To unconditionally reboot the GE865, the pad RESET must be tied low for
-        at least 200 milliseconds and then released.
+        at least 200 milliseconds and then released. The latency until the
+        modem answers the AT command is stored in self.latencies ('restart').
 
         .. warning::
 
@@ -98,34 +168,42 @@ class QModemTelit:
             to be done in the rare case that the device gets stacked waiting
             for some network or SIM responses.
 
+        Keyword arguments:
+            - timeout: Maximum time to wait for the AT answer, in seconds.
+
         """
-        retval = 0
-        self.reset.set_value(1)
-        time.sleep(0.2)
-        self.reset.set_value(0)
+        self._pulse(self.reset, RESET_PULSE)
         if self.pwrmon.get_value() == 0:
             # fail, the modem is OFF
-            retval = 1
-        time.sleep(2)
-        return retval
-
-    def command(self, command):
+            return 1
+        latency = self._wait_ready(timeout)
+        if latency is None:
+            return 1
+        self.latencies['restart'] = latency
+        return 0
+
+    def command(self, command, timeout=None):
         """ Send AT command to the GE865
 
-        Returns the command response
+        Returns the command response, a QATResponse, as soon as the final
+        result code is received.
 
         Keyword arguments:
 
-            - command: AT command to be send.
+            - command: AT command to be send, without terminator.
+            - timeout: Maximum time to wait for the response.
 
         """
-        # Before send any command make sure that the input buffer is empty,
-        # otherwise we can return a dirty string.
-        if self.port.inWaiting():
-            # Flush input buffer, discarding all it's contents.
-            self.port.flushInput()
-        self.port.write(command)
-        return self.port.read(255)
+        return self.session.command(command, timeout)
+
+    def script(self, commands, timeout=None, stop_on_error=True):
+        """ Send several AT commands to the GE865
+
+        Returns the list of responses, see QATSession.script
+
+        """
+        return self.session.script(commands, timeout,
+                                   stop_on_error=stop_on_error)
 
     def at(self):
         """ Send AT command
@@ -133,28 +211,26 @@ class QModemTelit:
         Returns 0 on success, otherwise returns the command output.
 
         """
-        expected = "AT\r\r\nOK\r\n"
-        retval = self.command("AT\r")
-        if retval == expected:
+        retval = self.command("AT")
+        if retval.ok:
             return 0
         else:
-            return retval
+            return retval.raw
 
     def at_cpin(self, cpin):
         """ Send AT+CPIN = <cpin> command
 
-        Returns 1 if fail, 0 on success
+        Returns 0 on success, otherwise returns the command output.
 
         Keyword arguments:
             - cpin: SIM card pin number.
 
         """
-        expected = "at+cpin=%s\r\r\nOK\r\n" % cpin
-        retval = self.command("at+cpin=%s\r" % cpin)
-        if retval == expected:
+        retval = self.command("at+cpin=%s" % cpin)
+        if retval.ok:
             return 0
         else:
-            return retval
+            return retval.raw
 
 # Test Cases for class TModemTelit
 import unittest
@@ -189,15 +265,15 @@ class TestClassQModemTelit(unittest.TestCase):
         self.modem.turn_on()
         # AT command: AT
         retval = self.modem.at()
-        self.failUnless(retval == 0, "Error: Expected '%s' and received '%s' "
-                        % (repr("AT\r\r\nOK\r\n"), repr(retval)))
+        self.failUnless(retval == 0, "Error: Expected 'OK' and received '%s' "
+                        % repr(retval))
 
     def test_command_at_cpin(self):
         self.modem.turn_on()
         # AT command: Enter pin
         retval = self.modem.at_cpin(5555)
-        self.failUnless(retval == 0, "Error: Expected '%s' and received '%s' "
-                        % (repr("at+cpin=5555\r\r\nOK\r\n"), repr(retval)))
+        self.failUnless(retval == 0, "Error: Expected 'OK' and received '%s' "
+                        % repr(retval))
 
 if __name__ == '__main__':
     unittest.main()
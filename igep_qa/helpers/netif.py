@@ -0,0 +1,508 @@
+#!/usr/bin/env python
+
+"""
+This provides the configuration of the network interfaces over rtnetlink,
+as 'ifconfig <interface> <address>', and waits for the link with the link
+events of the kernel instead of a fixed delay.
+
+The tests that use an interface acquire and release it from the shared
+QNetManager, see get_manager(), an interface is configured once and kept up
+while it is idle, so the next test using it does not configure it again.
+
+See: rtnetlink(7)
+
+"""
+
+import atexit
+import errno
+import fcntl
+import os
+import select
+import socket
+import struct
+import threading
+
+from igep_qa.helpers.common import monotonic
+
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 1
+
+# from linux/netlink.h and linux/rtnetlink.h
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x001
+NLM_F_MULTI = 0x002
+NLM_F_ACK = 0x004
+NLM_F_ROOT = 0x100
+NLM_F_MATCH = 0x200
+NLM_F_DUMP = NLM_F_ROOT | NLM_F_MATCH
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+IFLA_OPERSTATE = 16
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+SIOCGIFINDEX = 0x8933
+
+# RFC 2863 operational status of IFLA_OPERSTATE
+IF_OPER_UNKNOWN = 0
+IF_OPER_DOWN = 2
+IF_OPER_UP = 6
+
+NLMSGHDR = struct.Struct("=IHHII")
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTATTR = struct.Struct("=HH")
+
+def _align(length):
+    return (length + 3) & ~3
+
+def pack_attrs(attrs):
+    """ Returns the rtattr of a list of (type, data) tuples.
+
+    """
+    data = ""
+    for kind, value in attrs:
+        attr = RTATTR.pack(RTATTR.size + len(value), kind) + value
+        data += attr.ljust(_align(len(attr)), "\0")
+    return data
+
+def parse_attrs(data):
+    """ Returns a dictionary of type to data of the rtattr in data.
+
+    """
+    attrs = { }
+    while len(data) >= RTATTR.size:
+        length, kind = RTATTR.unpack(data[:RTATTR.size])
+        if length < RTATTR.size:
+            break
+        attrs[kind] = data[RTATTR.size:length]
+        data = data[_align(length):]
+    return attrs
+
+def parse_address(address):
+    """ Returns (address, prefix length) of an IPv4 address, e.g.
+    '192.168.5.1/24'. Without prefix length, the one of the address class is
+    used as ifconfig does (/8 for class A, /16 for B and /24 for C).
+
+    """
+    if "/" in address:
+        address, prefix = address.split("/", 1)
+        return address, int(prefix)
+    first = ord(socket.inet_aton(address)[0])
+    if first < 128:
+        return address, 8
+    elif first < 192:
+        return address, 16
+    return address, 24
+
+def _broadcast(address, prefix):
+    value = struct.unpack("!I", socket.inet_aton(address))[0]
+    value |= (1 << (32 - prefix)) - 1
+    return socket.inet_ntoa(struct.pack("!I", value & 0xffffffff))
+
+def ifindex(ifname):
+    """ Returns the index of a network interface, raises IOError if it does
+    not exist.
+
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        data = fcntl.ioctl(sock.fileno(), SIOCGIFINDEX,
+                           struct.pack("16si12x", ifname[:15], 0))
+    finally:
+        sock.close()
+    return struct.unpack("16si12x", data)[1]
+
+class QRtnetlink:
+    """ A rtnetlink socket.
+
+    Keyword arguments:
+        - groups: The multicast groups to listen to, e.g. RTMGRP_LINK.
+
+    """
+    def __init__(self, groups=0):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  NETLINK_ROUTE)
+        self.sock.bind((0, groups))
+        self.seq = 0
+
+    def close(self):
+        self.sock.close()
+
+    def messages(self, timeout=None):
+        """ Returns the list of (type, flags, seq, payload) of the next
+        datagram, empty on timeout.
+
+        """
+        if not select.select([self.sock], [ ], [ ], timeout)[0]:
+            return [ ]
+        data = self.sock.recv(65536)
+        messages = [ ]
+        while len(data) >= NLMSGHDR.size:
+            length, kind, flags, seq, pid = NLMSGHDR.unpack(data[:NLMSGHDR.size])
+            if length < NLMSGHDR.size:
+                break
+            messages.append((kind, flags, seq, data[NLMSGHDR.size:length]))
+            data = data[_align(length):]
+        return messages
+
+    def request(self, kind, payload, flags=0):
+        """ Send a request and return the payloads of the replies, waits for
+        the acknowledge, or for the end of a dump.
+
+        Raises OSError with the error of the kernel.
+
+        """
+        self.seq += 1
+        flags |= NLM_F_REQUEST | NLM_F_ACK
+        self.sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(payload), kind, flags,
+                                     self.seq, 0) + payload)
+        replies = [ ]
+        while True:
+            messages = self.messages(5)
+            if not messages:
+                raise OSError(errno.ETIMEDOUT, os.strerror(errno.ETIMEDOUT))
+            for rkind, rflags, seq, data in messages:
+                if seq != self.seq:
+                    # e.g. an event of a group
+                    continue
+                if rkind == NLMSG_ERROR:
+                    error = -struct.unpack("=i", data[:4])[0]
+                    if error:
+                        raise OSError(error, os.strerror(error))
+                    return replies
+                if rkind == NLMSG_DONE:
+                    return replies
+                replies.append((rkind, data))
+                if not rflags & NLM_F_MULTI and not flags & NLM_F_DUMP:
+                    return replies
+
+def _addresses():
+    # Returns the (index, address, prefix length, label) of every IPv4
+    # address of the system
+    nl = QRtnetlink()
+    try:
+        replies = nl.request(RTM_GETADDR,
+                             IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0),
+                             NLM_F_DUMP)
+    finally:
+        nl.close()
+    addresses = [ ]
+    for kind, data in replies:
+        family, prefix, flags, scope, index = IFADDRMSG.unpack(data[:IFADDRMSG.size])
+        if kind != RTM_NEWADDR:
+            continue
+        attrs = parse_attrs(data[IFADDRMSG.size:])
+        local = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+        if local is not None:
+            label = attrs.get(IFA_LABEL, "").rstrip("\0")
+            addresses.append((index, socket.inet_ntoa(local), prefix, label))
+    return addresses
+
+def address_interfaces(address):
+    """ Returns the names of the interfaces with an IPv4 address, e.g.
+    ['eth0'] for 192.168.5.1
+
+    """
+    address = parse_address(address)[0]
+    # the label of an alias is e.g. eth0:1
+    return sorted(set(label.split(":")[0] for index, local, prefix, label
+                      in _addresses() if local == address))
+
+class QNetInterface:
+    """ A network interface, e.g. eth0
+
+    Keyword arguments:
+        - ifname: The interface name.
+
+    """
+    def __init__(self, ifname):
+        self.name = ifname
+        self.index = ifindex(ifname)
+
+    def _link(self, nl):
+        kind, data = nl.request(RTM_GETLINK,
+                                IFINFOMSG.pack(socket.AF_UNSPEC, 0, self.index,
+                                               0, 0))[0]
+        return self._parse_link(data)
+
+    def _parse_link(self, data):
+        family, kind, index, flags, change = IFINFOMSG.unpack(data[:IFINFOMSG.size])
+        attrs = parse_attrs(data[IFINFOMSG.size:])
+        operstate = ord(attrs.get(IFLA_OPERSTATE, chr(IF_OPER_UNKNOWN)))
+        return index, flags, operstate
+
+    def link(self):
+        """ Returns the (flags, operstate) of the interface.
+
+        """
+        nl = QRtnetlink()
+        try:
+            return self._link(nl)[1:]
+        finally:
+            nl.close()
+
+    def running(self):
+        """ Returns True if the interface is up and has carrier.
+
+        """
+        flags, operstate = self.link()
+        return self._running(flags, operstate)
+
+    def _running(self, flags, operstate):
+        # the operstate of the interfaces without link detection (e.g. lo)
+        # is unknown
+        return (flags & IFF_UP and flags & IFF_LOWER_UP and
+                operstate in (IF_OPER_UP, IF_OPER_UNKNOWN))
+
+    def set_up(self, up=True):
+        """ Set the interface up or down, as 'ifconfig <interface> up'
+
+        """
+        nl = QRtnetlink()
+        try:
+            nl.request(RTM_NEWLINK,
+                       IFINFOMSG.pack(socket.AF_UNSPEC, 0, self.index,
+                                      IFF_UP if up else 0, IFF_UP))
+        finally:
+            nl.close()
+
+    def addresses(self):
+        """ Returns the list of IPv4 (address, prefix length) of the
+        interface.
+
+        """
+        return [(local, prefix) for index, local, prefix, label
+                in _addresses() if index == self.index]
+
+    def _address(self, kind, address, prefix, flags=0):
+        attrs = [(IFA_LOCAL, socket.inet_aton(address)),
+                 (IFA_ADDRESS, socket.inet_aton(address))]
+        if kind == RTM_NEWADDR and prefix < 31:
+            attrs.append((IFA_BROADCAST,
+                          socket.inet_aton(_broadcast(address, prefix))))
+        nl = QRtnetlink()
+        try:
+            nl.request(kind, IFADDRMSG.pack(socket.AF_INET, prefix, 0, 0,
+                                            self.index) + pack_attrs(attrs),
+                       flags)
+        finally:
+            nl.close()
+
+    def set_address(self, address):
+        """ Set the IPv4 address of the interface, replacing the others, as
+        'ifconfig <interface> <address>'
+
+        Keyword arguments:
+            - address: The address, with an optional prefix length, e.g.
+                       192.168.5.1 or 192.168.5.1/24
+
+        """
+        address, prefix = parse_address(address)
+        current = self.addresses()
+        for other, length in current:
+            if (other, length) != (address, prefix):
+                self._address(RTM_DELADDR, other, length)
+        if (address, prefix) not in current:
+            self._address(RTM_NEWADDR, address, prefix,
+                          NLM_F_CREATE | NLM_F_REPLACE)
+
+    def del_address(self, address):
+        """ Remove an IPv4 address of the interface, and its routes, as
+        'ip addr del'
+
+        """
+        address = parse_address(address)[0]
+        for other, length in self.addresses():
+            if other == address:
+                self._address(RTM_DELADDR, other, length)
+
+    def wait_running(self, timeout):
+        """ Wait until the interface is up and has carrier, with the link
+        events of the kernel.
+
+        Returns True if it is running, False on timeout.
+
+        """
+        deadline = monotonic() + timeout
+        # listen to the events before reading the state, so none is lost
+        events = QRtnetlink(RTMGRP_LINK)
+        try:
+            index, flags, operstate = self._link(events)
+            while not self._running(flags, operstate):
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return False
+                for kind, mflags, seq, data in events.messages(remaining):
+                    if kind == RTM_NEWLINK:
+                        link = self._parse_link(data)
+                        if link[0] == self.index:
+                            index, flags, operstate = link
+            return True
+        finally:
+            events.close()
+
+class QNetManager:
+    """ Configure the network interfaces shared by the tests and the runners.
+
+    An interface acquired with an address is configured and set up once,
+    the next users of the same address find it running. A released
+    interface is kept up until another interface needs its address, then
+    the address is removed from it, or until exit (see down()). Only the
+    interfaces configured here are set down.
+
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # QNetInterface, address and users of every interface configured
+        self.interfaces = { }
+
+    def acquire(self, ifname, address, timeout=5):
+        """ Configure an interface with an address, if it is not yet, and
+        wait for the link.
+
+        Returns True if the link is up, False on timeout. Raises IOError or
+        OSError if the interface can't be configured, EADDRINUSE if another
+        interface is in use with the same address.
+
+        Keyword arguments:
+            - ifname: The interface name, e.g. eth0
+            - address: The IPv4 address, see QNetInterface.set_address()
+            - timeout: Seconds to wait for the link.
+
+        """
+        with self.lock:
+            entry = self.interfaces.get(ifname)
+            if entry is None or entry["address"] != address:
+                # an address is only configured in one interface, e.g. the
+                # same address is tested in eth0 and eth1, otherwise the
+                # other interface would answer for it
+                local = parse_address(address)
+                others = set(address_interfaces(local[0]))
+                others.update(name for name, other in self.interfaces.items()
+                              if parse_address(other["address"])[0] == local[0])
+                others.discard(ifname)
+                for name in sorted(others):
+                    other = self.interfaces.get(name)
+                    if other is not None and other["users"]:
+                        raise IOError(errno.EADDRINUSE, "%s is in use in %s"
+                                      % (address, name))
+                for name in sorted(others):
+                    QNetInterface(name).del_address(local[0])
+                    if name in self.interfaces:
+                        self._down(name)
+                interface = QNetInterface(ifname)
+                preset = (local in interface.addresses() and
+                          interface.link()[0] & IFF_UP)
+                if not preset:
+                    interface.set_address(address)
+                    interface.set_up()
+                users = entry["users"] if entry else 0
+                entry = {"interface": interface, "address": address,
+                         "users": users, "owned": not preset}
+                self.interfaces[ifname] = entry
+            entry["users"] += 1
+            interface = entry["interface"]
+        try:
+            return interface.wait_running(timeout)
+        except:
+            # the caller won't release it
+            self.release(ifname)
+            raise
+
+    def release(self, ifname):
+        """ Release an interface acquired, it is kept up.
+
+        """
+        with self.lock:
+            entry = self.interfaces.get(ifname)
+            if entry is not None and entry["users"]:
+                entry["users"] -= 1
+
+    def _down(self, ifname):
+        entry = self.interfaces.pop(ifname)
+        if entry["owned"]:
+            entry["interface"].set_up(False)
+
+    def down(self):
+        """ Set down the idle interfaces configured here.
+
+        """
+        with self.lock:
+            for name, entry in self.interfaces.items():
+                if not entry["users"]:
+                    try:
+                        self._down(name)
+                    except (IOError, OSError):
+                        pass
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    """ Returns the shared QNetManager, the interfaces it configured are set
+    down at exit.
+
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = QNetManager()
+            atexit.register(_manager.down)
+        return _manager
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QNetManager
+# -----------------------------------------------------------------------------
+import unittest
+
+class TestClassQNetManager(unittest.TestCase):
+    """ Unittest for class QNetManager, on the loopback interface
+
+    """
+    def test_attrs(self):
+        data = pack_attrs([(IFA_LOCAL, socket.inet_aton("10.0.0.1")),
+                           (IFLA_OPERSTATE, chr(IF_OPER_UP))])
+        self.failUnless(len(data) == 16, "Error: Unexpected size %d" % len(data))
+        attrs = parse_attrs(data)
+        self.failUnless(attrs == {IFA_LOCAL: socket.inet_aton("10.0.0.1"),
+                                  IFLA_OPERSTATE: chr(IF_OPER_UP)},
+            "Error: Unexpected attributes %s" % repr(attrs))
+
+    def test_parse_address(self):
+        retval = [parse_address(a) for a in ("10.1.2.3", "172.16.0.1",
+                                             "192.168.5.1", "192.168.5.1/30")]
+        self.failUnless(retval == [("10.1.2.3", 8), ("172.16.0.1", 16),
+                                   ("192.168.5.1", 24), ("192.168.5.1", 30)],
+            "Error: Unexpected addresses %s" % retval)
+        self.failUnless(_broadcast("192.168.5.1", 24) == "192.168.5.255",
+            "Error: Unexpected broadcast %s" % _broadcast("192.168.5.1", 24))
+
+    def test_loopback(self):
+        lo = QNetInterface("lo")
+        self.failUnless(("127.0.0.1", 8) in lo.addresses() and lo.running(),
+            "Error: Unexpected lo %s %s" % (lo.addresses(), lo.link()))
+        # lo is up with the address, it is not configured again
+        manager = QNetManager()
+        self.failUnless(manager.acquire("lo", "127.0.0.1", 1),
+            "Error: lo not running")
+        self.failUnless(not manager.interfaces["lo"]["owned"],
+            "Error: lo configured")
+        manager.release("lo")
+        manager.down()
+        self.failUnless(lo.running(), "Error: lo set down")
+        self.assertRaises(IOError, QNetInterface, "nonexistent0")
+
+if __name__ == '__main__':
+    unittest.main()
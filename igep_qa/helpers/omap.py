@@ -5,7 +5,9 @@ This provides various OMAP/IGEP related helper functions.
 
 """
 
-from igep_qa.helpers.common import QMmap, QCpuinfo, QDeviceTree
+from igep_qa.helpers.board import get_board
+from igep_qa.helpers.common import QMmap
+from igep_qa.helpers.mixer import apply_profile
 import commands
 import time
 
@@ -13,7 +15,7 @@ def cpu_is_omap5():
     """ Returns True if machine is OMAP5, otherwise returns False
 
     """
-    return QDeviceTree().compatible("ti,omap5")
+    return get_board().soc == "omap5"
 
 def omap3_get_dieid():
     """ Single die identifier for OMAP processors
@@ -43,70 +45,57 @@ def machine_is_igep0020():
     """ Returns True if machine is igep0020, otherwise returns False
 
     """
-    cpu = QCpuinfo()
-    if cpu["Hardware"] == "IGEP0020 board":
-        return True
-    # otherwise
-    return False
+    return get_board().machine == "igep0020"
 
 def machine_is_igep0030():
     """ Returns True if machine is igep0030, otherwise returns False.
 
     """
-    cpu = QCpuinfo()
-    if cpu["Hardware"] == "IGEP0030 COM":
-        return True
-    # otherwise
-    return False
+    return get_board().machine == "igep0030"
 
 def machine_is_igep0032():
     """ Returns True if machine is igep0032, otherwise returns False
 
     """
-    cpu = QCpuinfo()
-    if cpu["Hardware"] == "IGEP0032 COM":
-        return True
-    # otherwise
-    return False
+    return get_board().machine == "igep0032"
 
 def buddy_is_igep0022():
     """ Returns True if buddy is igep0022, otherwise returns False.
 
     """
-    fd = open("/proc/cmdline", "r")
-    for opts in fd.readline().split(" "):
-        if "buddy=igep0022" in opts:
-            fd.close()
-            return True
-    # otherwise
-    fd.close()
-    return False
+    return get_board().buddy == "igep0022"
 
 def buddy_is_base0010():
     """ Returns True if buddy is base0010, otherwise returns False
 
     """
-    fd = open("/proc/cmdline", "r")
-    for opts in fd.readline().split(" "):
-        if "buddy=base0010" in opts:
-            fd.close()
-            return True
-    # otherwise
-    fd.close()
-    return False
+    return get_board().buddy == "base0010"
 
 def buddy_is_ilms0015():
     """ Returns True if buddy is ilms0015, otherwise returns False.
 
     """
-    fd = open("/proc/cmdline", "r")
-    for opts in fd.readline().split(" "):
-        if "buddy=ilms0015" in opts:
-            fd.close()
-            return True
-    # otherwise
-    fd.close()
-    return False
+    return get_board().buddy == "ilms0015"
+
+# Mixer settings to playback/capture via headset, see QMixer
+IGEP0050_HEADSET = [
+    ("cset", "Headset Left Playback", "1"),
+    ("cset", "Headset Right Playback", "1"),
+    ("cset", "Headset Playback Volume", "12"),
+    ("cset", "DL1 PDM Switch", "1"),
+    ("cset", "Sidetone Mixer Playback", "1"),
+    ("cset", "SDT DL Volume", "120"),
+    ("cset", "DL1 Mixer Multimedia", "1"),
+    ("cset", "DL1 Media Playback Volume", "110"),
+    ("cset", "Sidetone Mixer Capture", "1"),
+    ("sset", "Analog Left,0", "Headset Mic"),
+    ("sset", "Analog Right,0", "Headset Mic"),
+    ("sset", "AUDUL Media,0", "149"),
+    ("sset", "Capture,0", "4"),
+    ("sset", "MUX_UL00,0", "AMic0"),
+    ("sset", "MUX_UL01,0", "AMic1"),
+    ("sset", "AMIC UL,0", "120"),
+]
 
 def igep0050_set_headset_amixer_settings(headset):
     """ Set amixer settings to playback/capture via headset,
@@ -114,23 +103,10 @@ def igep0050_set_headset_amixer_settings(headset):
     Make sure that the following amixer settings are done for the corresponding
     card (check the card no. by running the command cat /proc/asound/cards).
 
+    Returns the list of settings that could not be set, empty on success.
+
     """
-    commands.getoutput("amixer cset -c %s name='Headset Left Playback' 1" % headset)
-    commands.getoutput("amixer cset -c %s name='Headset Right Playback' 1" % headset)
-    commands.getoutput("amixer cset -c %s name='Headset Playback Volume' 12" % headset)
-    commands.getoutput("amixer cset -c %s name='DL1 PDM Switch' 1" % headset)
-    commands.getoutput("amixer cset -c %s name='Sidetone Mixer Playback' 1" % headset)
-    commands.getoutput("amixer cset -c %s name='SDT DL Volume' 120" % headset)
-    commands.getoutput("amixer cset -c %s name='DL1 Mixer Multimedia' 1" % headset)
-    commands.getoutput("amixer cset -c %s name='DL1 Media Playback Volume' 110" % headset)
-    commands.getoutput("amixer cset -c %s name='Sidetone Mixer Capture' 1" % headset)
-    commands.getoutput("amixer sset -c %s 'Analog Left',0 'Headset Mic'" % headset)
-    commands.getoutput("amixer sset -c %s 'Analog Right',0 'Headset Mic'" % headset)
-    commands.getoutput("amixer sset -c %s 'AUDUL Media',0 149" % headset)
-    commands.getoutput("amixer sset -c %s 'Capture',0 4" % headset)
-    commands.getoutput("amixer sset -c %s MUX_UL00,0 AMic0" % headset)
-    commands.getoutput("amixer sset -c %s MUX_UL01,0 AMic1" % headset)
-    commands.getoutput("amixer sset -c %s 'AMIC UL',0 120" % headset)
+    return apply_profile(headset, "igep0050-headset", IGEP0050_HEADSET)
 
 def igep0050_power_up_bluetooth():
     """ Power Up bluetooth device.
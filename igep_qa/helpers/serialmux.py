@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+"""
+This provides a test engine for a serial port behind a muxer selected with
+GPIOs (e.g. ILMS0010).
+
+Every mux state is selected and the line is considered settled as soon as
+it is quiet, instead of sleeping a fixed time. The request/response
+exchanges are pipelined, several requests are in flight at the same time.
+
+"""
+
+import math
+import os
+import random
+import select
+
+from collections import namedtuple
+
+from igep_qa.helpers.common import monotonic
+from igep_qa.helpers.gpiolib import wait_values
+from igep_qa.helpers.serialport import QSerialPort
+
+class QMuxResult(namedtuple("QMuxResult", "state sent received errors lost "
+                            "settle latencies")):
+    """ Result of the exchanges through a mux state.
+
+    Attributes:
+        - state: The mux state, 0 for the first port.
+        - sent: Number of requests sent.
+        - received: Number of responses received.
+        - errors: Number of responses with a wrong value.
+        - lost: Number of responses not received before the timeout.
+        - settle: Time to select the state and settle the line, in seconds,
+                  None if the line did not settle.
+        - latencies: Time from every request sent to its response received,
+                     in seconds.
+
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return (self.settle is not None and self.sent == self.received and
+                not self.errors and not self.lost)
+
+    @property
+    def error_rate(self):
+        """ Returns the ratio of requests without a good response.
+
+        """
+        if not self.sent:
+            return 0.0
+        return float(self.errors + self.lost) / self.sent
+
+    def percentile(self, p):
+        """ Returns the p-th percentile of the latencies (nearest rank), in
+        seconds, or None if there are no latencies.
+
+        """
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        index = int(math.ceil(p / 100.0 * len(latencies))) - 1
+        return latencies[max(0, min(index, len(latencies) - 1))]
+
+    def __str__(self):
+        retval = ("port %d: %d/%d responses, %d errors, %d lost (%.2f%%)"
+                  % (self.state + 1, self.received, self.sent, self.errors,
+                     self.lost, self.error_rate * 100))
+        if self.settle is None:
+            retval += ", line not settled"
+        if self.latencies:
+            retval += (", latency p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, "
+                       "max %.1f ms" % tuple(self.percentile(p) * 1000
+                                             for p in (50, 95, 99, 100)))
+        return retval
+
+class QSerialMuxer:
+    """ A serial port behind a muxer selected with GPIOs.
+
+    The mux state is the binary value of the GPIOs, the first GPIO is the
+    least significant bit.
+
+    Keyword arguments:
+        - port: The serial device, e.g. /dev/ttyO1, or a QSerialPort.
+        - gpios: List of QGpio (or any object with set_value and
+                 get_value) selecting the mux state.
+        - baudrate: The baud rate.
+        - timeout: Maximum time to wait for a response, in seconds.
+        - settle_timeout: Maximum time to wait for the line to settle
+                          after switching, in seconds.
+
+    """
+    def __init__(self, port, gpios, baudrate=115200, timeout=1.0,
+                 settle_timeout=0.1):
+        if isinstance(port, QSerialPort):
+            self.serial = port
+        else:
+            self.serial = QSerialPort(port, baudrate)
+        self.gpios = gpios
+        self.states = 2 ** len(gpios)
+        self.timeout = timeout
+        self.settle_timeout = settle_timeout
+
+    def close(self):
+        self.serial.close()
+
+    def select(self, state):
+        """ Select a mux state and wait until the GPIOs read back the state
+        and the line is quiet.
+
+        Returns the time spent, in seconds, or None if the line did not
+        settle.
+
+        """
+        start = monotonic()
+        values = [(state >> i) & 1 for i in range(len(self.gpios))]
+        for gpio, value in zip(self.gpios, values):
+            gpio.set_value(value)
+        wait_values(self.gpios, values, timeout=self.settle_timeout, settle=0)
+        if self.serial.settle(timeout=self.settle_timeout) is None:
+            return None
+        return monotonic() - start
+
+    def exchange(self, requests, window=8):
+        """ Send the requests and read their responses, keeping up to
+        'window' requests in flight. The responses are expected in order.
+
+        Returns a tuple (received, errors, lost, latencies).
+
+        Keyword arguments:
+            - requests: List of (request, expected response) strings.
+            - window: Maximum number of requests without response.
+
+        """
+        fd = self.serial.fd
+        received = errors = lost = 0
+        latencies = [ ]
+        pending = [ ]  # (expected, time sent)
+        buf = ""
+        index = 0
+        while index < len(requests) or pending:
+            now = monotonic()
+            if pending and now - pending[0][1] > self.timeout:
+                # the head was lost, resynchronize discarding everything
+                lost += len(pending)
+                pending = [ ]
+                self.serial.settle(timeout=self.settle_timeout)
+                buf = ""
+                continue
+            if index < len(requests) and len(pending) < window:
+                request, expected = requests[index]
+                written = self.serial.write(request, self.timeout)
+                pending.append((expected, monotonic()))
+                index += 1
+                if written < len(request):
+                    continue
+            timeout = self.timeout - (monotonic() - pending[0][1])
+            if index < len(requests) and len(pending) < window:
+                timeout = 0
+            ready, _, _ = select.select([fd], [], [], max(0, timeout))
+            if ready:
+                try:
+                    buf += os.read(fd, 65536)
+                except OSError:
+                    pass
+            while pending and len(buf) >= len(pending[0][0]):
+                expected, sent = pending.pop(0)
+                response, buf = buf[:len(expected)], buf[len(expected):]
+                latencies.append(monotonic() - sent)
+                received += 1
+                if response != expected:
+                    errors += 1
+        return received, errors, lost, latencies
+
+    def sweep(self, request, response, count=1, window=8):
+        """ Exchange a request with every mux state.
+
+        Returns a list of QMuxResult, one per state.
+
+        """
+        results = [ ]
+        for state in range(self.states):
+            settle = self.select(state)
+            received, errors, lost, latencies = \
+                self.exchange([(request, response)] * count, window)
+            results.append(QMuxResult(state, count, received, errors, lost,
+                                      settle, latencies))
+        return results
+
+    def soak(self, frames=1000, size=16, window=8, seed=None):
+        """ Send randomized frames through every mux state, the other side
+        must echo them back.
+
+        Returns a list of QMuxResult, one per state.
+
+        Keyword arguments:
+            - frames: Number of frames per state.
+            - size: Maximum size of a frame, in bytes.
+            - window: Maximum number of frames without response.
+            - seed: Seed of the pseudo-random frames.
+
+        """
+        generator = random.Random(seed)
+        results = [ ]
+        for state in range(self.states):
+            requests = [ ]
+            for _ in range(frames):
+                frame = "".join(chr(generator.randint(0, 255))
+                                for _ in range(generator.randint(1, size)))
+                requests.append((frame, frame))
+            settle = self.select(state)
+            received, errors, lost, latencies = self.exchange(requests, window)
+            results.append(QMuxResult(state, frames, received, errors, lost,
+                                      settle, latencies))
+        return results
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QSerialMuxer
+# -----------------------------------------------------------------------------
+import pty
+import threading
+import unittest
+
+class QFakeGpio:
+    def __init__(self):
+        self.value = 0
+
+    def set_value(self, value):
+        self.value = value
+
+    def get_value(self):
+        return self.value
+
+class QFakeServer:
+    """ Serial server on a pty master, answers 'Are You Ken?' with
+    'Come Closer!' and echoes everything else. Only the ports in 'alive'
+    (by the fake GPIOs) answer.
+
+    """
+    def __init__(self, gpios, alive):
+        self.master, self.slave = pty.openpty()
+        self.path = os.ttyname(self.slave)
+        self.gpios = gpios
+        self.alive = alive
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        buf = ""
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.02)
+            if not ready:
+                continue
+            buf += os.read(self.master, 4096)
+            state = sum(g.value << i for i, g in enumerate(self.gpios))
+            if state not in self.alive:
+                buf = ""
+                continue
+            while buf.startswith("Are You Ken?"):
+                os.write(self.master, "Come Closer!")
+                buf = buf[12:]
+            if "Are You Ken?".startswith(buf):
+                continue
+            os.write(self.master, buf)
+            buf = ""
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+class TestClassQSerialMuxer(unittest.TestCase):
+    """ Unittest for class QSerialMuxer
+
+    """
+    def setUp(self):
+        self.gpios = [QFakeGpio(), QFakeGpio()]
+
+    def test_sweep(self):
+        server = QFakeServer(self.gpios, (0, 1, 3))
+        muxer = QSerialMuxer(server.path, self.gpios, timeout=0.2)
+        try:
+            results = muxer.sweep("Are You Ken?", "Come Closer!", count=5)
+        finally:
+            muxer.close()
+            server.close()
+        self.failUnless([r.ok for r in results] == [True, True, False, True],
+            "Error: Unexpected results %s" % [str(r) for r in results])
+        self.failUnless(results[2].lost == 5,
+            "Error: Unexpected result %s" % str(results[2]))
+
+    def test_soak(self):
+        server = QFakeServer(self.gpios, range(4))
+        muxer = QSerialMuxer(server.path, self.gpios)
+        try:
+            results = muxer.soak(frames=200, seed=1)
+        finally:
+            muxer.close()
+            server.close()
+        self.failUnless(all(r.ok for r in results),
+            "Error: Unexpected results %s" % [str(r) for r in results])
+        self.failUnless(all(r.percentile(99) < 0.5 for r in results),
+            "Error: Unexpected latencies %s" % [str(r) for r in results])
+
+    def test_percentile(self):
+        result = QMuxResult(0, 4, 4, 0, 0, 0.0, [0.4, 0.1, 0.3, 0.2])
+        self.failUnless(result.percentile(50) == 0.2 and
+                        result.percentile(100) == 0.4,
+            "Error: Unexpected percentiles")
+
+if __name__ == '__main__':
+    unittest.main()
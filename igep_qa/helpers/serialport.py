@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+
+"""
+This provides a raw serial port and a serial loopback test engine.
+
+The port is configured with termios and driven with select and deadlines,
+so it works on any tty, including a pty pair on a development machine.
+
+"""
+
+import binascii
+import errno
+import fcntl
+import os
+import random
+import re
+import select
+import struct
+import termios
+import threading
+
+from collections import namedtuple
+
+from igep_qa.helpers.common import monotonic
+
+# struct serial_icounter_struct: cts, dsr, rng, dcd, rx, tx, frame, overrun,
+# parity, brk, buf_overrun and 9 reserved ints
+TIOCGICOUNT = 0x545D
+ICOUNTER = "20i"
+ICOUNTER_FIELDS = ("cts", "dsr", "rng", "dcd", "rx", "tx", "frame", "overrun",
+                   "parity", "brk", "buf_overrun")
+# struct serial_struct: type, line, port, irq, flags, xmit_fifo_size,
+# custom_divisor, baud_base and more fields, 72 bytes on 64-bit
+TIOCGSERIAL = 0x541E
+SERIAL_STRUCT = "iiIiiiii"
+SERIAL_STRUCT_SIZE = 128
+# the termios B* speeds, plus the high rates of linux/termbits.h that some
+# builds of the termios module lack
+SPEEDS = {500000: 0o010005, 576000: 0o010006, 921600: 0o010007,
+          1000000: 0o010010, 1152000: 0o010011, 1500000: 0o010012,
+          2000000: 0o010013, 2500000: 0o010014, 3000000: 0o010015,
+          3500000: 0o010016, 4000000: 0o010017}
+SPEEDS.update((int(name[1:]), getattr(termios, name)) for name in dir(termios)
+              if re.match(r"B\d+$", name) and name != "B0")
+BAUDRATES = sorted(SPEEDS)
+# highest default rate of the loopback, the RS-232 transceivers of the boards
+# are not rated beyond it even if the UART is
+MAX_BAUDRATE = 3000000
+
+class QSerialPort:
+    """ A serial port in raw mode, 8N1 without flow control.
+
+    Keyword arguments:
+        - port: The serial device, e.g. /dev/ttymxc1, or an open file
+                descriptor.
+        - baudrate: The baud rate, any of BAUDRATES (e.g. 3000000)
+
+    """
+    def __init__(self, port, baudrate=115200):
+        if isinstance(port, int):
+            self.fd = port
+            self.name = "fd %d" % port
+            self._owner = False
+        else:
+            self.fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+            self.name = port
+            self._owner = True
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.configure(baudrate)
+
+    def configure(self, baudrate):
+        """ Set the baud rate and the raw mode, flushes the buffers.
+
+        """
+        speed = SPEEDS.get(baudrate)
+        if speed is None:
+            raise ValueError("Unsupported baud rate %d" % baudrate)
+        iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(self.fd)
+        iflag &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK |
+                   termios.ISTRIP | termios.INLCR | termios.IGNCR |
+                   termios.ICRNL | termios.IXON | termios.IXOFF | termios.IXANY)
+        oflag &= ~termios.OPOST
+        lflag &= ~(termios.ECHO | termios.ECHONL | termios.ICANON |
+                   termios.ISIG | termios.IEXTEN)
+        cflag &= ~(termios.CSIZE | termios.PARENB | termios.CSTOPB |
+                   getattr(termios, "CRTSCTS", 0))
+        cflag |= termios.CS8 | termios.CREAD | termios.CLOCAL
+        cc[termios.VMIN] = 0
+        cc[termios.VTIME] = 0
+        termios.tcsetattr(self.fd, termios.TCSANOW,
+                          [iflag, oflag, cflag, lflag, speed, speed, cc])
+        termios.tcflush(self.fd, termios.TCIOFLUSH)
+        self._buffer = ""
+        self.baudrate = baudrate
+
+    def counters(self):
+        """ Returns the error counters of the UART (TIOCGICOUNT) as a
+        dictionary, or None if the driver does not provide them (e.g. pty)
+
+        """
+        try:
+            data = fcntl.ioctl(self.fd, TIOCGICOUNT, "\0" * struct.calcsize(ICOUNTER))
+        except IOError:
+            return None
+        return dict(zip(ICOUNTER_FIELDS, struct.unpack(ICOUNTER, data)))
+
+    def max_baudrate(self):
+        """ Returns the highest of BAUDRATES the UART can generate, up to
+        its clock / 16 (baud_base of TIOCGSERIAL), or None if the driver
+        does not report it (e.g. pty)
+
+        """
+        try:
+            data = fcntl.ioctl(self.fd, TIOCGSERIAL, "\0" * SERIAL_STRUCT_SIZE)
+        except IOError:
+            return None
+        baud_base = struct.unpack(SERIAL_STRUCT,
+                                  data[:struct.calcsize(SERIAL_STRUCT)])[7]
+        rates = [rate for rate in BAUDRATES if rate <= baud_base]
+        return rates[-1] if rates else None
+
+    def flush(self):
+        """ Discard the received data not read yet.
+
+        """
+        self._buffer = ""
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+
+    def settle(self, quiet=None, timeout=0.1):
+        """ Wait until the line is quiet, discarding what is received (e.g.
+        glitches after switching a muxer).
+
+        Returns the number of bytes discarded, or None if the line did not
+        settle before the timeout.
+
+        Keyword arguments:
+            - quiet: Time without data, by default two characters at the
+                     baud rate (at least 2 ms).
+            - timeout: Maximum time to wait, in seconds.
+
+        """
+        if quiet is None:
+            quiet = max(0.002, 20.0 / self.baudrate)
+        deadline = monotonic() + timeout
+        discarded = len(self._buffer)
+        self._buffer = ""
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([self.fd], [], [], min(quiet, remaining))
+            if not ready:
+                if quiet <= remaining:
+                    return discarded
+                return None
+            try:
+                discarded += len(os.read(self.fd, 65536))
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def write(self, data, timeout=1):
+        """ Write all the data, returns the number of bytes written before
+        the timeout.
+
+        """
+        deadline = monotonic() + timeout
+        sent = 0
+        while sent < len(data):
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            _, ready, _ = select.select([], [self.fd], [], remaining)
+            if ready:
+                sent += os.write(self.fd, data[sent:sent + 4096])
+        return sent
+
+    def read(self, size, timeout=1, until=None):
+        """ Read up to size bytes, returns as soon as they are read, when
+        'until' is received or after the timeout. The data received after
+        'until' is kept for the next read.
+
+        """
+        deadline = monotonic() + timeout
+        data, self._buffer = self._buffer, ""
+        while True:
+            if until is not None and until in data:
+                end = data.index(until) + len(until)
+                data, self._buffer = data[:end], data[end:]
+                break
+            if len(data) >= size:
+                data, self._buffer = data[:size], data[size:]
+                break
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if ready:
+                try:
+                    chunk = os.read(self.fd, 65536)
+                except OSError as e:
+                    if e.errno == errno.EAGAIN:
+                        continue
+                    raise
+                if not chunk:
+                    break
+                data += chunk
+        return data
+
+    def readline(self, timeout=1, eol="\n"):
+        """ Read a line, returns it with the end of line or an empty string
+        after the timeout. A partial line is kept for the next read.
+
+        """
+        data = self.read(65536, max(0, timeout), until=eol)
+        if not data.endswith(eol):
+            self._buffer = data + self._buffer
+            return ""
+        return data
+
+    def close(self):
+        if self._owner and self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+
+    def __del__(self):
+        self.close()
+
+class QSerialResult(namedtuple("QSerialResult", "port baudrate sent received "
+                               "errors frame overrun parity duration")):
+    """ Result of a serial loopback.
+
+    Attributes:
+        - port: The serial device.
+        - baudrate: The baud rate.
+        - sent: Number of bytes sent.
+        - received: Number of bytes received.
+        - errors: Number of bytes received with a wrong value.
+        - frame, overrun, parity: Errors counted by the UART, None if the
+                                  driver does not count them.
+        - duration: Time from the first byte sent to the last received, in
+                    seconds.
+
+    """
+    __slots__ = ()
+
+    @property
+    def missing(self):
+        return self.sent - self.received
+
+    @property
+    def throughput(self):
+        """ Returns the bytes per second received.
+
+        """
+        return self.received / self.duration if self.duration else 0.0
+
+    @property
+    def efficiency(self):
+        """ Returns the throughput relative to the baud rate, 8N1 has 10
+        bits per byte.
+
+        """
+        return self.throughput * 10 / self.baudrate
+
+    @property
+    def ok(self):
+        return (self.sent == self.received and not self.errors and
+                not self.frame and not self.overrun and not self.parity)
+
+    def __str__(self):
+        return ("%s at %d baud: %d/%d bytes, %d errors, %d missing, "
+                "frame %s, overrun %s, parity %s, %.0f bytes/s (%d%%)"
+                % (self.port, self.baudrate, self.received, self.sent,
+                   self.errors, self.missing, self.frame, self.overrun,
+                   self.parity, self.throughput, self.efficiency * 100))
+
+def loopback(port, baudrate=115200, size=None, seed=None, timeout=None):
+    """ Stream a pseudo-random block through a TX-RX loopback and read it
+    back at the same time.
+
+    Returns a QSerialResult.
+
+    Keyword arguments:
+        - port: The serial device or a QSerialPort.
+        - baudrate: The baud rate, if None the highest of the port (see
+                    QSerialPort.max_baudrate) up to MAX_BAUDRATE, or 115200
+                    if unknown.
+        - size: Number of bytes sent, by default half a second of data.
+        - seed: Seed of the pseudo-random data.
+        - timeout: Maximum time, by default twice the time needed to send
+                   the data at the baud rate plus one second.
+
+    """
+    if isinstance(port, QSerialPort):
+        serial = port
+    else:
+        serial = QSerialPort(port)
+    if baudrate is None:
+        baudrate = min(serial.max_baudrate() or 115200, MAX_BAUDRATE)
+    serial.configure(baudrate)
+    if size is None:
+        size = max(256, baudrate // 20)
+    if timeout is None:
+        timeout = size * 10.0 / baudrate * 2 + 1
+    if seed is None:
+        data = os.urandom(size)
+    elif size:
+        # all the bytes at once, a call per byte is slow on the boards
+        bits = random.Random(seed).getrandbits(8 * size)
+        data = binascii.unhexlify("%0*x" % (2 * size, bits))
+    else:
+        data = ""
+    before = serial.counters()
+    received = [ ]
+    count = sent = 0
+    start = monotonic()
+    deadline = start + timeout
+    try:
+        while count < size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            wlist = [serial.fd] if sent < size else [ ]
+            rlist, wlist, _ = select.select([serial.fd], wlist, [], remaining)
+            if wlist:
+                sent += os.write(serial.fd, data[sent:sent + 4096])
+            if rlist:
+                try:
+                    chunk = os.read(serial.fd, 65536)
+                except OSError as e:
+                    if e.errno == errno.EAGAIN:
+                        continue
+                    raise
+                received.append(chunk)
+                count += len(chunk)
+        duration = monotonic() - start
+        after = serial.counters()
+    finally:
+        if serial is not port:
+            serial.close()
+    received = "".join(received)[:size]
+    errors = sum(1 for a, b in zip(received, data) if a != b)
+    if before is None or after is None:
+        frame = overrun = parity = None
+    else:
+        frame = after["frame"] - before["frame"]
+        overrun = ((after["overrun"] - before["overrun"]) +
+                   (after["buf_overrun"] - before["buf_overrun"]))
+        parity = after["parity"] - before["parity"]
+    return QSerialResult(getattr(serial, "name", port), baudrate, size,
+                         len(received), errors, frame, overrun, parity,
+                         duration)
+
+def loopback_many(ports, baudrate=115200, size=None, seed=None):
+    """ Run loopback() on several ports at the same time, see loopback().
+
+    Returns the list of QSerialResult in the same order as ports.
+
+    """
+    results = [None] * len(ports)
+
+    def worker(index, port):
+        try:
+            results[index] = loopback(port, baudrate, size, seed)
+        except (OSError, IOError, ValueError, termios.error) as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i, p))
+               for i, p in enumerate(ports)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+# -----------------------------------------------------------------------------
+# Test Cases for the serial loopback
+# -----------------------------------------------------------------------------
+import pty
+import unittest
+
+class QPtyLoopback:
+    """ A pty pair with the master echoing back everything, a loopback
+    plug for the slave. Optionally corrupts one byte of every 'corrupt'.
+
+    """
+    def __init__(self, corrupt=0):
+        self.master, self.slave = pty.openpty()
+        self.path = os.ttyname(self.slave)
+        self.corrupt = corrupt
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        count = 0
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            if self.corrupt:
+                data = "".join(chr(ord(c) ^ 1) if (count + i) % self.corrupt == 0
+                               else c for i, c in enumerate(data))
+            count += len(data)
+            os.write(self.master, data)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+class TestClassQSerialPort(unittest.TestCase):
+    """ Unittest for the serial loopback on a pty pair
+
+    """
+    def test_loopback(self):
+        plug = QPtyLoopback()
+        try:
+            result = loopback(plug.path, 115200, size=20000, seed=1)
+        finally:
+            plug.close()
+        self.failUnless(result.ok and result.received == 20000,
+            "Error: Unexpected result %s" % str(result))
+
+    def test_loopback_errors(self):
+        plug = QPtyLoopback(corrupt=100)
+        try:
+            result = loopback(plug.path, 115200, size=1000, seed=1)
+        finally:
+            plug.close()
+        self.failUnless(result.errors == 10 and not result.ok,
+            "Error: Unexpected result %s" % str(result))
+
+    def test_loopback_many(self):
+        plugs = [QPtyLoopback() for _ in range(3)]
+        try:
+            results = loopback_many([p.path for p in plugs], 115200, size=5000)
+        finally:
+            for plug in plugs:
+                plug.close()
+        self.failUnless(all(r.ok for r in results),
+            "Error: Unexpected results %s" % [str(r) for r in results])
+
+    def test_max_baudrate(self):
+        plug = QPtyLoopback()
+        port = QSerialPort(plug.path)
+        try:
+            retval = port.max_baudrate()
+            result = loopback(port, None, size=1000)
+        finally:
+            port.close()
+            plug.close()
+        # a pty has no UART clock
+        self.failUnless(retval is None and result.baudrate == 115200 and
+                        result.ok,
+            "Error: Unexpected result %s %s" % (retval, str(result)))
+
+    def test_no_loopback(self):
+        master, slave = pty.openpty()
+        try:
+            result = loopback(os.ttyname(slave), 115200, size=100, timeout=0.2)
+        finally:
+            os.close(master)
+            os.close(slave)
+        self.failUnless(result.received == 0 and result.missing == 100,
+            "Error: Unexpected result %s" % str(result))
+
+    def test_read_until(self):
+        plug = QPtyLoopback()
+        port = QSerialPort(plug.path)
+        try:
+            port.write("AT\r\nOK\r\nmore")
+            retval = port.read(100, timeout=1, until="OK\r\n")
+            retval += "|" + port.read(4, timeout=1)
+        finally:
+            port.close()
+            plug.close()
+        self.failUnless(retval == "AT\r\nOK\r\n|more",
+            "Error: Unexpected data %s" % repr(retval))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+"""
+This provides a throughput benchmark of the storage devices and the link
+speed negotiated by their port.
+
+The scratch file is accessed with O_DIRECT through page aligned buffers, so
+the page cache is bypassed and the results are the speed of the device and
+its link, not of the memory.
+
+"""
+
+import ctypes
+import errno
+import glob
+import mmap
+import os
+import random
+import stat
+
+from collections import namedtuple
+
+from igep_qa.helpers.common import monotonic
+
+O_DIRECT = getattr(os, "O_DIRECT", 0o40000)
+POSIX_FADV_DONTNEED = 4
+
+_libc = ctypes.CDLL("libc.so.6", use_errno=True)
+_libc.pread.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t,
+                        ctypes.c_long]
+_libc.pread.restype = ctypes.c_ssize_t
+_libc.pwrite.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t,
+                         ctypes.c_long]
+_libc.pwrite.restype = ctypes.c_ssize_t
+_libc.posix_fadvise.argtypes = [ctypes.c_int, ctypes.c_long, ctypes.c_long,
+                                ctypes.c_int]
+
+class QStorageResult(namedtuple("QStorageResult", "path mode size block "
+                                "count duration direct")):
+    """ Result of a storage benchmark.
+
+    Attributes:
+        - path: The scratch file or device node.
+        - mode: "read", "write", "randread" or "randwrite".
+        - size: Bytes transferred.
+        - block: Bytes of every request.
+        - count: Number of requests.
+        - duration: Time of the transfer, in seconds.
+        - direct: True if the page cache was bypassed with O_DIRECT.
+
+    """
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        """ Throughput in MB/s (10^6 bytes) """
+        return self.size / self.duration / 1e6 if self.duration else 0.0
+
+    @property
+    def iops(self):
+        """ Requests per second """
+        return self.count / self.duration if self.duration else 0.0
+
+    def __str__(self):
+        return ("%s %s: %.2f MB/s, %.0f IOPS (%d x %d bytes in %.2f s%s)"
+                % (self.path, self.mode, self.throughput, self.iops,
+                   self.count, self.block, self.duration,
+                   "" if self.direct else ", cached"))
+
+def _check(retval, expected):
+    if retval < 0:
+        e = ctypes.get_errno()
+        raise IOError(e, os.strerror(e))
+    if retval != expected:
+        raise IOError(errno.EIO, "Short transfer of %d bytes" % retval)
+
+class QStorageBench:
+    """ Sequential and random read/write benchmark.
+
+    Keyword arguments:
+        - path: A directory of the mounted medium, where a scratch file is
+                created, or a device node, that is only read.
+        - size: Bytes of the scratch file or read from the device, at
+                least one block and one random block, ValueError is raised
+                otherwise.
+        - block: Bytes of every sequential request.
+        - random_block: Bytes of every random request, a multiple of the
+                        logical block size of the device.
+        - random_count: Number of random requests.
+        - seed: Seed of the random offsets.
+
+    """
+    def __init__(self, path, size=16 * 1024 * 1024, block=1024 * 1024,
+                 random_block=4096, random_count=256, seed=0):
+        self.block = block
+        self.random_block = random_block
+        self.random_count = random_count
+        self.seed = seed
+        self.raw = stat.S_ISBLK(os.stat(path).st_mode)
+        if self.raw:
+            self.path = path
+        else:
+            self.path = os.path.join(path, ".igep_qa_storagebench")
+        self.fd = None
+        self.buffer = None
+        self.direct = True
+        self._open()
+        if self.raw:
+            size = min(size, os.lseek(self.fd, 0, os.SEEK_END))
+        # whole blocks only, the aligned buffer holds one sequential block
+        self.size = size - size % block
+        if self.size < max(block, random_block):
+            self.close()
+            raise ValueError("%d bytes are less than a block (%d bytes) "
+                             "and a random block (%d bytes)"
+                             % (size, block, random_block))
+        self.buffer = mmap.mmap(-1, max(block, random_block))
+        self.address = ctypes.addressof(ctypes.c_char.from_buffer(self.buffer))
+        # never write the same pattern twice, some media compress or dedup
+        self.buffer.write(os.urandom(len(self.buffer)))
+
+    def _open(self):
+        flags = os.O_RDONLY if self.raw else os.O_RDWR | os.O_CREAT
+        try:
+            self.fd = os.open(self.path, flags | O_DIRECT, 0o644)
+        except OSError as e:
+            # e.g. tmpfs does not support O_DIRECT
+            if e.errno != errno.EINVAL:
+                raise
+            self.fd = os.open(self.path, flags, 0o644)
+            self.direct = False
+
+    def close(self):
+        """ Close and remove the scratch file.
+
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            if not self.raw:
+                os.unlink(self.path)
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+    def _drop_cache(self):
+        if not self.direct:
+            os.fsync(self.fd)
+            _libc.posix_fadvise(self.fd, 0, 0, POSIX_FADV_DONTNEED)
+
+    def _offsets(self):
+        blocks = self.size // self.random_block
+        rand = random.Random(self.seed)
+        return [rand.randrange(blocks) * self.random_block
+                for i in range(self.random_count)]
+
+    def _run(self, mode, offsets, block, transfer):
+        self._drop_cache()
+        start = monotonic()
+        for offset in offsets:
+            _check(transfer(self.fd, self.address, block, offset), block)
+        if mode.endswith("write"):
+            os.fsync(self.fd)
+        duration = monotonic() - start
+        return QStorageResult(self.path, mode, block * len(offsets), block,
+                              len(offsets), duration, self.direct)
+
+    def write(self):
+        """ Sequential write of the scratch file, returns a QStorageResult.
+
+        """
+        if self.raw:
+            raise IOError(errno.EPERM, "Refusing to write a device node")
+        offsets = range(0, self.size, self.block)
+        return self._run("write", offsets, self.block, _libc.pwrite)
+
+    def read(self):
+        """ Sequential read, returns a QStorageResult.
+
+        """
+        offsets = range(0, self.size, self.block)
+        return self._run("read", offsets, self.block, _libc.pread)
+
+    def random_write(self):
+        """ Random writes of random_block bytes, returns a QStorageResult.
+
+        """
+        if self.raw:
+            raise IOError(errno.EPERM, "Refusing to write a device node")
+        return self._run("randwrite", self._offsets(), self.random_block,
+                         _libc.pwrite)
+
+    def random_read(self):
+        """ Random reads of random_block bytes, returns a QStorageResult.
+
+        """
+        return self._run("randread", self._offsets(), self.random_block,
+                         _libc.pread)
+
+    def run(self):
+        """ Run all the benchmarks, only the reads for a device node.
+
+        Returns a dictionary of mode to QStorageResult.
+
+        """
+        results = { }
+        if not self.raw:
+            # the reads need the file written first
+            results["write"] = self.write()
+        results["read"] = self.read()
+        if not self.raw:
+            results["randwrite"] = self.random_write()
+        results["randread"] = self.random_read()
+        return results
+
+def _parse_speed(value):
+    # Returns Mb/s of a sysfs speed, "480" for USB or "3.0 Gbps" for SATA
+    fields = value.split()
+    if not fields:
+        return None
+    try:
+        speed = float(fields[0])
+    except ValueError:
+        return None
+    if len(fields) > 1 and fields[1].lower().startswith("g"):
+        speed *= 1000
+    return speed
+
+def link_speed(devpath, sysfs="/sys"):
+    """ Returns the speed negotiated by the port of a device in Mb/s, e.g.
+    12 or 480 for USB, 1500 or 3000 for SATA, or None if unknown (e.g. SD).
+
+    Keyword arguments:
+        - devpath: The sysfs path of the block device, see QBlockDevice.
+        - sysfs: The sysfs mountpoint.
+
+    """
+    path = os.path.join(sysfs, devpath.lstrip("/"))
+    root = os.path.normpath(os.path.join(sysfs, "devices"))
+    while len(path) > len(root):
+        # the nearest USB device, for a hub port it is the device behind it
+        candidates = [os.path.join(path, "speed")]
+        # the ATA port, ataN/linkN/ata_link/linkN/sata_spd
+        candidates += glob.glob(os.path.join(path, "link*", "ata_link",
+                                             "link*", "sata_spd"))
+        for candidate in candidates:
+            try:
+                speed = _parse_speed(open(candidate).read())
+            except IOError:
+                continue
+            if speed is not None:
+                return speed
+        path = os.path.dirname(path)
+    return None
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QStorageBench
+# -----------------------------------------------------------------------------
+import shutil
+import tempfile
+import unittest
+
+class TestClassQStorageBench(unittest.TestCase):
+    """ Unittest for class QStorageBench
+
+    """
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_run(self):
+        bench = QStorageBench(self.root, size=1024 * 1024 + 100,
+                              block=64 * 1024, random_count=16)
+        results = bench.run()
+        bench.close()
+        self.failUnless(sorted(results) == ["randread", "randwrite", "read",
+                                            "write"],
+            "Error: Unexpected results %s" % sorted(results))
+        read = results["read"]
+        self.failUnless(read.size == 1024 * 1024 and read.count == 16 and
+                        read.throughput > 0,
+            "Error: Unexpected read %s" % str(read))
+        self.failUnless(results["randread"].count == 16 and
+                        results["randread"].block == 4096,
+            "Error: Unexpected random read %s" % str(results["randread"]))
+        self.failUnless(os.listdir(self.root) == [ ],
+            "Error: Scratch file not removed")
+        self.assertRaises(ValueError, QStorageBench, self.root, size=1000,
+                          block=4096)
+        self.failUnless(os.listdir(self.root) == [ ],
+            "Error: Scratch file not removed")
+
+    def test_link_speed(self):
+        usb = "devices/platform/ehci-omap.0/usb1/1-2/1-2.1"
+        ata = "devices/soc0/2200000.sata/ata1"
+        paths = {usb: "480\n", "devices/platform/ehci-omap.0/usb1/1-2": "480\n",
+                 ata + "/link1/ata_link/link1": "3.0 Gbps\n"}
+        for path, value in paths.items():
+            os.makedirs(os.path.join(self.root, path))
+            fd = open(os.path.join(self.root, path, "sata_spd" if "ata_link"
+                                   in path else "speed"), "w")
+            fd.write(value)
+            fd.close()
+        speed = link_speed("/" + usb + "/1-2.1:1.0/host0/block/sda", self.root)
+        self.failUnless(speed == 480, "Error: Unexpected USB speed %s" % speed)
+        speed = link_speed("/" + ata + "/host0/target0:0:0/block/sda", self.root)
+        self.failUnless(speed == 3000, "Error: Unexpected SATA speed %s" % speed)
+        speed = link_speed("/devices/platform/mmc0/block/mmcblk0", self.root)
+        self.failUnless(speed is None, "Error: Unexpected SD speed %s" % speed)
+
+if __name__ == '__main__':
+    unittest.main()
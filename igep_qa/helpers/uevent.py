@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+"""
+This provides a listener of the kernel uevents (NETLINK_KOBJECT_UEVENT) and
+of the mount table, to wait for a device until it appears instead of
+sleeping a fixed time.
+
+The block devices of the uevents update the shared QBlockIndex, see
+igep_qa.helpers.blockdev, and /proc/mounts is polled for changes, so a test
+waiting for a file in a port goes on as soon as the medium is mounted.
+
+"""
+
+import errno
+import os
+import select
+import socket
+import threading
+import time
+
+from collections import namedtuple
+
+from igep_qa.helpers.blockdev import get_index
+from igep_qa.helpers.common import monotonic
+
+NETLINK_KOBJECT_UEVENT = 15
+# multicast group of the events sent by the kernel, udev uses the group 2
+UEVENT_KERNEL_GROUP = 1
+# receive buffer of the uevent socket, a hub plugged in sends a burst of
+# events, SO_RCVBUFFORCE allows root to go beyond net.core.rmem_max
+RCVBUF = 1024 * 1024
+SO_RCVBUFFORCE = 33
+
+class QUevent(namedtuple("QUevent", "action devpath properties")):
+    """ A kernel uevent.
+
+    Attributes:
+        - action: e.g. "add", "remove" or "change".
+        - devpath: The sysfs path of the device.
+        - properties: Dictionary of the uevent variables, e.g. SUBSYSTEM,
+                      DEVNAME or DEVTYPE.
+
+    """
+    __slots__ = ()
+
+    @property
+    def subsystem(self):
+        return self.properties.get("SUBSYSTEM")
+
+def parse_uevent(data):
+    """ Returns the QUevent of a netlink message, or None if it is not a
+    kernel uevent (e.g. a message of udev).
+
+    The message is "action@devpath" followed by the variables, all of them
+    null terminated.
+
+    """
+    fields = data.split("\0")
+    if "@" not in fields[0]:
+        return None
+    action, devpath = fields[0].split("@", 1)
+    properties = dict(f.split("=", 1) for f in fields[1:] if "=" in f)
+    return QUevent(properties.get("ACTION", action),
+                   properties.get("DEVPATH", devpath), properties)
+
+class QUeventMonitor:
+    """ Listen to the uevents and the mount table in a thread.
+
+    Keyword arguments:
+        - index: The QBlockIndex updated by the events, the shared one by
+                 default.
+        - mounts: The mount table polled for changes.
+        - interval: Seconds between checks of the waiters when nothing
+                    happens, in case the events are not delivered (e.g.
+                    in a container).
+        - sock: The uevent socket, a NETLINK_KOBJECT_UEVENT socket bound to
+                the kernel events by default.
+
+    """
+    def __init__(self, index=None, mounts="/proc/mounts", interval=0.5,
+                 sock=None):
+        self.index = index if index is not None else get_index()
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.waiters = 0
+        if sock is None:
+            try:
+                sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                     NETLINK_KOBJECT_UEVENT)
+                sock.bind((0, UEVENT_KERNEL_GROUP))
+            except (socket.error, AttributeError):
+                # without events the waiters only poll
+                sock = None
+            if sock is not None:
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, RCVBUF)
+                except socket.error:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+        self.sock = sock
+        self.running = True
+        self.mounts = open(mounts, "r")
+        self.poller = select.poll()
+        if self.sock is not None:
+            self.poller.register(self.sock.fileno(), select.POLLIN)
+        # the mount table signals a change with POLLERR | POLLPRI
+        self.poller.register(self.mounts.fileno(), select.POLLERR | select.POLLPRI)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        """ Stop the listener and close its socket.
+
+        """
+        self.running = False
+        self.thread.join()
+        if self.sock is not None:
+            self.sock.close()
+        self.mounts.close()
+
+    def _notify(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def _receive(self):
+        try:
+            uevent = parse_uevent(self.sock.recv(8192))
+        except socket.error as e:
+            if e.errno == errno.ENOBUFS:
+                # events were dropped, read the devices again
+                self.index.refresh()
+            elif e.errno not in (errno.EINTR, errno.EAGAIN):
+                raise
+            return
+        if uevent is not None and uevent.subsystem == "block":
+            self.index.update(uevent.action, uevent.devpath)
+
+    def _run(self):
+        while self.running:
+            try:
+                self._poll()
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    self._recover()
+            except (socket.error, IOError, OSError):
+                self._recover()
+
+    def _recover(self):
+        # keep listening after an error, the events may be lost so read the
+        # devices again, the waiters check again every interval anyway
+        try:
+            self.index.refresh()
+        finally:
+            self._notify()
+        time.sleep(self.interval)
+
+    def _poll(self):
+        ready = self.poller.poll(self.interval * 1000)
+        for fd, event in ready:
+            if self.sock is not None and fd == self.sock.fileno():
+                self._receive()
+            else:
+                self.mounts.seek(0)
+                self.mounts.read()
+                self.index.refresh_mounts()
+        if ready:
+            self._notify()
+        elif self.waiters:
+            # nothing happened, check again anyway, without events the
+            # devices are read again too
+            if self.sock is None:
+                self.index.refresh()
+            else:
+                self.index.refresh_mounts()
+            self._notify()
+
+    def wait_for(self, predicate, timeout):
+        """ Wait until predicate() returns a true value, checked now and after
+        every event.
+
+        Returns the last value of predicate().
+
+        """
+        deadline = monotonic() + timeout
+        with self.condition:
+            self.waiters += 1
+            try:
+                while True:
+                    retval = predicate()
+                    remaining = deadline - monotonic()
+                    if retval or remaining <= 0:
+                        return retval
+                    self.condition.wait(min(remaining, self.interval))
+            finally:
+                self.waiters -= 1
+
+    def wait_file(self, port, filename, timeout):
+        """ Wait for a file in a mounted device below a sysfs port, see
+        QBlockIndex.find_file().
+
+        Returns the path of the file, or None on timeout.
+
+        """
+        return self.wait_for(lambda: self.index.find_file(port, filename),
+                             timeout)
+
+    def wait_devices(self, port, timeout):
+        """ Wait for a block device below a sysfs port.
+
+        Returns the list of QBlockDevice, empty on timeout.
+
+        """
+        return self.wait_for(lambda: self.index.find(port), timeout)
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+def get_monitor():
+    """ Returns the shared QUeventMonitor, started the first time.
+
+    Start it as soon as possible, e.g. when the test suite is built, so the
+    devices plugged before the tests run are indexed too.
+
+    """
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            index = get_index()
+            # the devices that appeared before the listener started
+            index.refresh()
+            _monitor = QUeventMonitor(index)
+        return _monitor
+
+# -----------------------------------------------------------------------------
+# Test Cases for class QUeventMonitor
+# -----------------------------------------------------------------------------
+import shutil
+import tempfile
+import unittest
+
+from igep_qa.helpers.blockdev import QBlockIndex
+
+class TestClassQUeventMonitor(unittest.TestCase):
+    """ Unittest for class QUeventMonitor
+
+    """
+    DEVPATH = "/devices/platform/ehci-omap.0/usb1/1-2/1-2.1/block/sda"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "sys/class/block"))
+        open(os.path.join(self.root, "mounts"), "w").close()
+        self.index = QBlockIndex(os.path.join(self.root, "sys"),
+                                 os.path.join(self.root, "mounts"))
+        self.kernel, sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.monitor = QUeventMonitor(self.index,
+                                      os.path.join(self.root, "mounts"),
+                                      0.05, sock)
+
+    def tearDown(self):
+        self.monitor.close()
+        shutil.rmtree(self.root)
+
+    def send(self, action, devpath, subsystem="block"):
+        self.kernel.send("%s@%s\0ACTION=%s\0DEVPATH=%s\0SUBSYSTEM=%s\0"
+                         % (action, devpath, action, devpath, subsystem))
+
+    def test_parse(self):
+        uevent = parse_uevent("add@/devices/x/sda\0ACTION=add\0"
+                              "DEVPATH=/devices/x/sda\0SUBSYSTEM=block\0"
+                              "DEVNAME=sda\0")
+        self.failUnless(uevent.action == "add" and uevent.subsystem == "block"
+                        and uevent.properties["DEVNAME"] == "sda",
+            "Error: Unexpected uevent %s" % repr(uevent))
+        self.failUnless(parse_uevent("libudev\0\xfe\xed") is None,
+            "Error: udev message parsed")
+
+    def test_wait_devices(self):
+        os.makedirs(os.path.join(self.root, "sys", self.DEVPATH.lstrip("/")))
+        threading.Timer(0.1, self.send, ("add", self.DEVPATH)).start()
+        start = monotonic()
+        retval = self.monitor.wait_devices("usb1/1-2/1-2.1", 5)
+        self.failUnless([d.name for d in retval] == ["sda"],
+            "Error: Unexpected devices %s" % retval)
+        self.failUnless(monotonic() - start < 1,
+            "Error: Event not awaited %.2f s" % (monotonic() - start))
+        self.send("remove", self.DEVPATH)
+        retval = self.monitor.wait_for(lambda: not self.index.find("usb1"), 5)
+        self.failUnless(retval, "Error: Device not removed")
+
+    def test_overflow(self):
+        class QOverflowSocket:
+            # the first receive fails as after a burst of events
+            def __init__(self, sock):
+                self.sock = sock
+                self.overflow = True
+            def fileno(self):
+                return self.sock.fileno()
+            def recv(self, size):
+                data = self.sock.recv(size)
+                if self.overflow:
+                    self.overflow = False
+                    raise socket.error(errno.ENOBUFS, os.strerror(errno.ENOBUFS))
+                return data
+            def close(self):
+                self.sock.close()
+        self.monitor.close()
+        self.kernel, sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.monitor = QUeventMonitor(self.index,
+                                      os.path.join(self.root, "mounts"),
+                                      0.05, QOverflowSocket(sock))
+        # the device appears in sysfs but its event is lost
+        path = os.path.join(self.root, "sys", self.DEVPATH.lstrip("/"))
+        os.makedirs(path)
+        os.symlink(path, os.path.join(self.root, "sys/class/block/sda"))
+        self.send("add", self.DEVPATH)
+        retval = self.monitor.wait_devices("usb1/1-2/1-2.1", 5)
+        self.failUnless([d.name for d in retval] == ["sda"],
+            "Error: Unexpected devices %s" % retval)
+        self.failUnless(self.monitor.thread.is_alive(), "Error: Listener died")
+        self.send("remove", self.DEVPATH)
+        retval = self.monitor.wait_for(lambda: not self.index.find("usb1"), 5)
+        self.failUnless(retval, "Error: Device not removed")
+
+    def test_without_events(self):
+        # the uevent socket can't be opened, e.g. in a container
+        def unavailable(*args):
+            raise socket.error(errno.EPROTONOSUPPORT,
+                               os.strerror(errno.EPROTONOSUPPORT))
+        self.monitor.close()
+        saved = socket.socket
+        socket.socket = unavailable
+        try:
+            self.monitor = QUeventMonitor(self.index,
+                                          os.path.join(self.root, "mounts"),
+                                          0.05)
+        finally:
+            socket.socket = saved
+        self.failUnless(self.monitor.sock is None, "Error: Uevent socket open")
+        def plug():
+            path = os.path.join(self.root, "sys", self.DEVPATH.lstrip("/"))
+            os.makedirs(path)
+            os.symlink(path, os.path.join(self.root, "sys/class/block/sda"))
+        threading.Timer(0.1, plug).start()
+        retval = self.monitor.wait_devices("usb1/1-2/1-2.1", 5)
+        self.failUnless([d.name for d in retval] == ["sda"],
+            "Error: Unexpected devices %s" % retval)
+
+    def test_wait_file(self):
+        self.index.update("add", self.DEVPATH)
+        media = os.path.join(self.root, "media")
+        os.makedirs(media)
+        open(os.path.join(media, "this_is_an_storage_device"), "w").close()
+        def mount():
+            fd = open(os.path.join(self.root, "mounts"), "w")
+            fd.write("/dev/sda %s vfat rw 0 0\n" % media)
+            fd.close()
+        threading.Timer(0.1, mount).start()
+        retval = self.monitor.wait_file("1-2.1", "this_is_an_storage_device", 5)
+        self.failUnless(retval == os.path.join(media, "this_is_an_storage_device"),
+            "Error: Unexpected file %s" % retval)
+        start = monotonic()
+        retval = self.monitor.wait_file("usb2", "this_is_an_storage_device", 0.2)
+        self.failUnless(retval is None and monotonic() - start >= 0.2,
+            "Error: Unexpected file %s" % retval)
+
+if __name__ == '__main__':
+    unittest.main()
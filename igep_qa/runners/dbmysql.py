@@ -6,25 +6,23 @@ Mysql DB Test Runner for unittest module
 """
 
 import ConfigParser
-import commands
+import atexit
+import struct
 import sys
 import unittest
-import time
 
 import mysql.connector
 from mysql.connector import errorcode
 
-from igep_qa.helpers.am33xx import cpu_is_am33xx
-from igep_qa.helpers.am33xx import am335x_get_mac_id0
 from igep_qa.helpers.am33xx import am335x_get_mac_id1
+from igep_qa.helpers.board import get_board
 from igep_qa.helpers.common import get_hwaddr
-from igep_qa.helpers.omap import cpu_is_omap5
-from igep_qa.helpers.omap import omap3_get_dieid, omap5_get_dieid
-from igep_qa.helpers.omap import machine_is_igep0020
-from igep_qa.helpers.omap import machine_is_igep0030
-from igep_qa.helpers.omap import machine_is_igep0032
-from igep_qa.helpers.imx6 import cpu_is_imx6
-from igep_qa.helpers.imx6 import imx6_get_unique_id
+from igep_qa.helpers.eeprom import (QBoardIdentity, QEeprom, read_identity,
+                                    write_identity)
+from igep_qa.helpers.netif import get_manager
+from igep_qa.runners.resultsink import MySQLSink, ResultSinkError
+from igep_qa.runners.resultspool import ResultSpool, SpoolSyncWorker
+from igep_qa.runners.timing import TimingResultMixin, get_timing
 
 PASS = '\033[32mPASS\033[0m\n'
 FAIL = '\033[31mFAIL\033[0m\n'
@@ -58,7 +56,41 @@ FANCYPASS = """-------------------------------------
 \033[32m#####################################\033[0m
 """
 
-def updatedb(tests):
+# Result sinks kept open during the whole run, indexed by server
+_sinks = { }
+
+def get_sink(cfg, testcase_columns=("name", "result"), retries=3):
+    """ Returns the MySQLSink for the server in cfg, reusing its connection.
+
+    """
+    key = (cfg['host'], cfg['database'], cfg['user'], tuple(testcase_columns),
+           cfg.get('connection_timeout'), retries)
+    if key not in _sinks:
+        _sinks[key] = MySQLSink(cfg, retries=retries,
+                                testcase_columns=testcase_columns)
+    return _sinks[key]
+
+# Results not uploaded yet are kept in this spool, see ResultSpool
+SPOOL = '/var/spool/igep_qa/results'
+# Seconds the process waits for the upload before exiting, the results not
+# uploaded are kept in the spool for the next run
+UPLOAD_WAIT = 5
+# Seconds to wait for the link of the network interface
+LINK_WAIT = 5
+# Seconds to wait for the link and for the server when the OF and serial
+# numbers are taken after the verdict, a single attempt
+RESOLVE_WAIT = 2
+
+def read_config():
+    """ Returns the connection arguments and the runner options from
+    /etc/testsuite.conf
+
+    The options are the IP address of the board ('ipaddr'), the spool path
+    ('spool'), the testcase columns ('testcase_columns') and the EEPROM
+    with the board identity ('eeprom', a dictionary with its bus, address,
+    size, page, program and revision, None if not set).
+
+    """
     # parse testsuite.conf configuration file
     config = ConfigParser.ConfigParser()
     # TODO : handle configuration file problems
@@ -70,103 +102,194 @@ def updatedb(tests):
     cfg['password'] = ''
     cfg['host'] = config.get('mysqld', 'host')
     cfg['database'] = config.get('mysqld', 'database')
+    cfg['connection_timeout'] = 5
     # TODO : disabled raise_on_warning because don't work on DUT
     # cfg['raise_on_warnings'] = config.get('mysqld', 'raise_on_warnings')
-    interface = 'eth0'
-    ipaddr = config.get('default', 'ipaddr')
+    options = { }
+    options['ipaddr'] = config.get('default', 'ipaddr')
+    if config.has_option('spool', 'path'):
+        options['spool'] = config.get('spool', 'path')
+    else:
+        options['spool'] = SPOOL
+    # the duration column is optional, older databases don't have it
+    if (config.has_option('timing', 'duration') and
+        config.getboolean('timing', 'duration')):
+        options['testcase_columns'] = ("name", "result", "duration")
+    else:
+        options['testcase_columns'] = ("name", "result")
+    if config.has_option('eeprom', 'bus'):
+        eeprom = {'bus': config.get('eeprom', 'bus'), 'address': '0x50',
+                  'size': 256, 'page': 8, 'program': False, 'revision': 0}
+        if config.has_option('eeprom', 'address'):
+            eeprom['address'] = config.get('eeprom', 'address')
+        for option in ('size', 'page', 'revision'):
+            if config.has_option('eeprom', option):
+                eeprom[option] = config.getint('eeprom', option)
+        if config.has_option('eeprom', 'program'):
+            eeprom['program'] = config.getboolean('eeprom', 'program')
+        options['eeprom'] = eeprom
+    else:
+        options['eeprom'] = None
+    return cfg, options
+
+def board_eeprom(options):
+    """ Returns the QEeprom with the board identity, or None if there is no
+    EEPROM configured.
 
-    # ensure connection to server
-    retval = commands.getstatusoutput("ifconfig %s %s" % (interface, ipaddr))
-    if retval[0] != 0:
-        return -1
+    """
+    eeprom = options['eeprom']
+    if eeprom is None:
+        return None
+    return QEeprom(eeprom['bus'], eeprom['address'], eeprom['size'],
+                   eeprom['page'])
 
-    # Use a small delay to be sure the interface is up
-    time.sleep(3)
+def board_identity(options):
+    """ Returns the QBoardIdentity stored in the EEPROM of the board, or
+    None if there is no EEPROM configured or no valid identity.
 
-    # connection to the database
+    """
     try:
-        cnx = mysql.connector.connect(**cfg)
-        cursor = cnx.cursor()
-
-        # query of from server
-        query = ("SELECT number FROM of ORDER BY id DESC LIMIT 1")
-        cursor.execute(query)
-        row = cursor.fetchone()
-        if row is None:
-            return -1
-        num = row[0]
-
-        # query sn from server
-        query = ("SELECT number FROM sn ORDER BY id DESC LIMIT 1")
-        cursor.execute(query)
-        row = cursor.fetchone()
-        if row is None:
-            return -1
-        snnum = row[0]
-
-        # insert
-        if machine_is_igep0020():
-            add_testsuite = ("INSERT INTO testsuite"
-                "(datetime, of, sn, dieid, mac) "
-                " VALUES (NOW(), %s, %s, %s, %s)")
-            data_testsuite = (num, snnum, omap3_get_dieid(), get_hwaddr("wlan0"))
-        elif machine_is_igep0030():
-            add_testsuite = ("INSERT INTO testsuite"
-                "(datetime, of, sn, dieid, mac) "
-                " VALUES (NOW(), %s, %s, %s, %s)")
-            data_testsuite = (num, snnum, omap3_get_dieid(), get_hwaddr("wlan0"))
-        elif machine_is_igep0032():
-            add_testsuite = ("INSERT INTO testsuite"
-                "(datetime, of, dieid, mac) "
-                " VALUES (NOW(), %s, %s, %s)")
-            data_testsuite = (num, omap3_get_dieid(), '')
-        elif cpu_is_am33xx():
-            add_testsuite = ("INSERT INTO testsuite"
-                "(datetime, of, sn, dieid, mac) "
-                " VALUES (NOW(), %s, %s, %s, %s)")
-            data_testsuite = (num, snnum, am335x_get_mac_id0(), am335x_get_mac_id1())
-        elif cpu_is_imx6():
-            add_testsuite = ("INSERT INTO testsuite"
-                "(datetime, of, sn, dieid, mac) "
-                " VALUES (NOW(), %s, %s, %s, %s)")
-            data_testsuite = (num, snnum, imx6_get_unique_id(), '')
-        elif cpu_is_omap5():
-            add_testsuite = ("INSERT INTO testsuite"
-                "(datetime, of, dieid, mac) "
-                " VALUES (NOW(), %s, %s, %s)")
-            data_testsuite = (num, omap5_get_dieid(), get_hwaddr("wlan0"))
-        else:
-            add_testsuite = ("INSERT INTO testsuite"
-                "(datetime, of) "
-                " VALUES (NOW(), %s)")
-            data_testsuite = (num)
-        cursor.execute(add_testsuite, data_testsuite)
-
-        # insert test cases
-        testsuite_id = cursor.lastrowid
-        for t in tests:
-            add_testcase = ("INSERT INTO testcase "
-                   "(name, result, testsuite_id) "
-                   "VALUES (%s, %s, %s)")
-            data_testcase = (t['name'], t['result'], testsuite_id)
-            # Insert new test
-            cursor.execute(add_testcase, data_testcase)
-        # Make sure data is committed to the database
-        cnx.commit()
-        # Close connections
-        cursor.close()
-        cnx.close()
-        return 0
-    # exception
-    except mysql.connector.Error as err:
+        eeprom = board_eeprom(options)
+        if eeprom is None:
+            return None
+        return read_identity(eeprom)
+    except (IOError, OSError, ValueError):
+        return None
+
+def program_identity(options, suite):
+    """ Write the OF and serial numbers of the testsuite columns in the
+    EEPROM of the board, if it is enabled in the [eeprom] section, so they
+    are taken from the board on the next runs.
+
+    Returns the QBoardIdentity written, or None if programming is disabled.
+    Raises IOError or OSError on failure, ValueError if a number does not
+    fit in the EEPROM.
+
+    """
+    if options['eeprom'] is None or not options['eeprom']['program']:
+        return None
+    numbers = dict(suite)
+    identity = QBoardIdentity(options['eeprom']['revision'],
+                              numbers.get('sn') or '', numbers.get('of') or '',
+                              '')
+    write_identity(board_eeprom(options), identity)
+    return identity
+
+def testsuite_columns(identity=None):
+    """ Returns the (column, value) list of the testsuite row of this board.
+
+    The 'of' and 'sn' numbers are taken from the board identity, if any,
+    otherwise they are None, see resolve_numbers().
+
+    Keyword arguments:
+        - identity: Optional QBoardIdentity of the board.
+
+    """
+    columns = _testsuite_columns()
+    if identity is None:
+        return columns
+    numbers = {'of': identity.of, 'sn': identity.serial}
+    # an empty number is still taken from the server
+    return [(c, numbers.get(c) or None) if v is None else (c, v)
+            for c, v in columns]
+
+def _testsuite_columns():
+    board = get_board()
+    if board.machine in ("igep0020", "igep0030"):
+        return [('of', None), ('sn', None), ('dieid', board.dieid),
+                ('mac', get_hwaddr("wlan0"))]
+    elif board.machine == "igep0032":
+        return [('of', None), ('dieid', board.dieid), ('mac', '')]
+    elif board.soc == "am33xx":
+        # the dieid of the AM335x is the MAC ID0
+        return [('of', None), ('sn', None), ('dieid', board.dieid),
+                ('mac', am335x_get_mac_id1())]
+    elif board.soc == "imx6":
+        return [('of', None), ('sn', None), ('dieid', board.dieid),
+                ('mac', '')]
+    elif board.soc == "omap5":
+        return [('of', None), ('dieid', board.dieid),
+                ('mac', get_hwaddr("wlan0"))]
+    return [('of', None)]
+
+def _on_network(options, wait, function, *args):
+    # Call function with the network up, waiting up to wait seconds for the
+    # link, the interface is still up if the tests used it, the sink retries
+    # the connection while it gets ready
+    interface = 'eth0'
+    try:
+        running = get_manager().acquire(interface, options['ipaddr'], wait)
+    except (IOError, OSError) as err:
+        raise ResultSinkError("Can't configure %s: %s" % (interface, err))
+    try:
+        if not running:
+            raise ResultSinkError("No link on %s" % interface)
+        return function(*args)
+    finally:
+        get_manager().release(interface)
+
+def resolve_numbers(cfg, options, suite, timeout=None):
+    """ Returns the testsuite columns with the 'of' and 'sn' numbers not
+    known by the board taken from the server now, see MySQLSink.resolve().
+
+    Raises ResultSinkError or mysql.connector.Error if the server can't
+    be reached.
+
+    Keyword arguments:
+        - timeout: Seconds to wait for the link and for the server, with a
+                   single attempt. By default the link is awaited LINK_WAIT
+                   seconds and the sink retries as on upload.
+
+    """
+    if not [c for c, v in suite if v is None and c in ("of", "sn")]:
+        return suite
+    if timeout is None:
+        sink = get_sink(cfg, options['testcase_columns'])
+        wait = LINK_WAIT
+    else:
+        cfg = dict(cfg, connection_timeout=max(1, int(timeout)))
+        sink = get_sink(cfg, options['testcase_columns'], retries=1)
+        wait = timeout
+    return _on_network(options, wait, sink.resolve, suite)
+
+def upload(record):
+    """ Store a record of the spool in the database, raising on failure.
+
+    The 'of' and 'sn' numbers of an 'unresolved' record, spooled while the
+    server was down, are stored empty (NULL), they are never the numbers
+    of the server on upload, that may belong to another board.
+
+    Keyword arguments:
+        - record: Dictionary with the 'suite' columns and the 'tests'.
+
+    """
+    cfg, options = read_config()
+    sink = get_sink(cfg, options['testcase_columns'])
+    # store the test suite and its test cases in one transaction
+    _on_network(options, LINK_WAIT, sink.store, record['suite'],
+                record['tests'])
+
+def print_error(err):
+    if isinstance(err, mysql.connector.Error):
         if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
             print("Something is wrong your username or password")
         elif err.errno == errorcode.ER_BAD_DB_ERROR:
             print("Database does not exists")
         else:
             print err
-        cursor.close()
-        cnx.close()
+    else:
+        print err
+
+def updatedb(tests):
+    try:
+        cfg, options = read_config()
+        suite = resolve_numbers(cfg, options,
+                                testsuite_columns(board_identity(options)))
+        upload({'suite': suite, 'tests': tests})
+        return 0
+    # exception
+    except (ResultSinkError, mysql.connector.Error) as err:
+        print_error(err)
         return -1
 
 class dbmysqlTestRunner:
@@ -183,6 +306,53 @@ class dbmysqlTestRunner:
         host = 127.0.0.1
         database = mydb
 
+    The results are first saved in a local spool and uploaded in background,
+    the results not uploaded (e.g. the server is down) are kept and uploaded
+    on the next run. The verdict is shown as soon as the tests finish, then
+    the OF and serial numbers are taken from the server with a single short
+    attempt before saving the results, if the server is down they are left
+    empty.
+    The spool path can be set in a [spool] section, by default it is
+    /var/spool/igep_qa/results
+
+    .. code-block:: ini
+
+        [spool]
+        path = /var/spool/igep_qa/results
+
+    The duration of every test case is stored in the 'duration' column of
+    the testcase table if it is enabled in a [timing] section.
+
+    .. code-block:: ini
+
+        [timing]
+        duration = yes
+
+    The OF and serial numbers are read from the board identity in the
+    EEPROM, see igep_qa.helpers.eeprom, if it is set in an [eeprom] section,
+    instead of taking the last ones of the database.
+
+    .. code-block:: ini
+
+        [eeprom]
+        bus = 2
+        address = 0x50
+
+    The size and page size of the EEPROM are 256 and 8 bytes (24C02) by
+    default, set them for other EEPROMs. With 'program' enabled, the numbers
+    taken from the server are written to a board without identity, with the
+    board 'revision' (0 by default).
+
+    .. code-block:: ini
+
+        [eeprom]
+        bus = 2
+        address = 0x50
+        size = 4096
+        page = 32
+        program = yes
+        revision = 1
+
     """
     def __init__(self, stream=sys.stderr, verbosity=0):
         self.stream = stream
@@ -202,24 +372,80 @@ class dbmysqlTestRunner:
     def run(self, test):
         """ Run the given test case or test suite.
 
+        The verdict is shown at once and the results are saved in the
+        local spool, the spool is uploaded to the database in background.
+
         """
         result = TextTestResult(self)
         test(result)
         result.testsRun
-        # update database
-        self.writeUpdate("Getting OF from server : ")
-        if not updatedb(self.tests):
-            self.writeUpdate(PASS)
-        else:
-            self.writeUpdate(FAIL)
+        # the verdict never waits for the network
+        self.writeUpdate(result.timingSummary())
         if (len(result.failures) + len(result.errors)):
             self.writeUpdate(FANCYFAIL)
         else:
             self.writeUpdate(FANCYPASS)
+        # save the results before the upload, they survive a server or
+        # network failure and are uploaded on the next run
+        cfg, options = read_config()
+        spool = ResultSpool(options['spool'])
+        identity = board_identity(options)
+        record = {'suite': testsuite_columns(identity), 'tests': self.tests}
+        # the numbers of this board are taken now, not on upload
+        self.writeUpdate("Getting OF from server : ")
+        try:
+            record['suite'] = resolve_numbers(cfg, options, record['suite'],
+                                              RESOLVE_WAIT)
+            self.writeUpdate(PASS)
+        except (ResultSinkError, mysql.connector.Error) as err:
+            self.writeUpdate(FAIL)
+            print_error(err)
+            record['unresolved'] = True
+        if identity is None and not record.get('unresolved'):
+            try:
+                if program_identity(options, record['suite']) is not None:
+                    self.writeUpdate("Programming EEPROM : " + PASS)
+            except (IOError, OSError, ValueError, struct.error) as err:
+                self.writeUpdate("Programming EEPROM : " + FAIL)
+                print err
+        self.writeUpdate("Saving results : ")
+        try:
+            spool.append([record])
+            self.writeUpdate(PASS)
+            spooled = True
+        except (IOError, OSError) as err:
+            self.writeUpdate(FAIL)
+            print err
+            spooled = False
+        if spooled:
+            # update database in background, the process waits a few
+            # seconds for the worker before exiting
+            worker = SpoolSyncWorker(spool, upload, callback=self.uploaded)
+            worker.start()
+            atexit.register(worker.join, UPLOAD_WAIT)
+        else:
+            # no spool, upload the results now
+            self.writeUpdate("Uploading results : ")
+            try:
+                upload(record)
+                self.writeUpdate(PASS)
+            except (ResultSinkError, mysql.connector.Error) as err:
+                self.writeUpdate(FAIL)
+                print_error(err)
 
         return result
 
-class TextTestResult(unittest.TestResult):
+    def uploaded(self, err, duration):
+        self.writeUpdate("Uploading results : ")
+        if err is None:
+            self.writeUpdate(PASS)
+            if self.verbosity:
+                self.writeUpdate("Upload time : %.2f s\n" % duration)
+        else:
+            self.writeUpdate(FAIL)
+            print_error(err)
+
+class TextTestResult(TimingResultMixin, unittest.TestResult):
     """ Report test result in a human-readable format.
 
     """
@@ -229,7 +455,7 @@ class TextTestResult(unittest.TestResult):
         self.result = ERROR
 
     def startTest(self, test):
-        unittest.TestResult.startTest(self, test)
+        super(TextTestResult, self).startTest(test)
         # display: print test short description
         self.runner.writeUpdate("%s : " % test.shortDescription())
 
@@ -246,11 +472,12 @@ class TextTestResult(unittest.TestResult):
         self.result = FAIL
 
     def stopTest(self, test):
-        unittest.TestResult.stopTest(self, test)
+        super(TextTestResult, self).stopTest(test)
         # display: print test result
         self.runner.writeUpdate(self.result)
         # db: add new test case to the test suite
         dbdata = { }
         dbdata['name'] = test.shortDescription()
         dbdata['result'] = self.result
+        dbdata['duration'] = round(get_timing(test).duration, 3)
         self.runner.addNewTestCase(dbdata)
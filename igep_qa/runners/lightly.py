@@ -8,6 +8,8 @@ Lightly Test Runner for unittest module
 import sys
 import unittest
 
+from igep_qa.runners.timing import TimingResultMixin
+
 class LightlyTestRunner:
     """ A Test Runner that show results in a string of characters.
 
@@ -19,6 +21,8 @@ class LightlyTestRunner:
     As example, a common output is:
         ....F....E...
 
+    With verbosity, a summary of the slowest test cases follows.
+
     """
     def __init__(self, stream=sys.stderr, verbosity=0):
         self.stream = stream
@@ -40,9 +44,11 @@ class LightlyTestRunner:
         result.updateResult(success, failure, error)
         test(result)
         result.testsRun
+        if self.verbosity:
+            self.writeUpdate("\n" + result.timingSummary())
         return result
 
-class LightlyTestResult(unittest.TestResult):
+class LightlyTestResult(TimingResultMixin, unittest.TestResult):
     def __init__(self, runner):
         unittest.TestResult.__init__(self)
         self.runner = runner
@@ -53,7 +59,7 @@ class LightlyTestResult(unittest.TestResult):
         self.resultError = error
 
     def startTest(self, test):
-        unittest.TestResult.startTest(self, test)
+        super(LightlyTestResult, self).startTest(test)
 
     def addSuccess(self, test):
         unittest.TestResult.addSuccess(self, test)
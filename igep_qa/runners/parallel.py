@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+Parallel Test Suite for unittest module
+
+"""
+
+import threading
+import unittest
+
+from igep_qa.runners.timing import start_timing, stop_timing
+
+class ParallelTestSuite(unittest.TestSuite):
+    """ A Test Suite that runs independent test cases at the same time.
+
+    Every test case can declare the hardware resources it holds in a
+    'resources' attribute, a list of names like 'eth0', '/dev/ttymxc1' or
+    'i2c-1'. Two test cases conflict when they share a resource and only
+    conflicting test cases are serialized, the rest run concurrently in a pool
+    of worker threads.
+
+    A test case without 'resources' attribute is exclusive, it waits until
+    all previous test cases have finished and no other test case runs with it.
+    Conflicting test cases always run in the order in which they were added,
+    so an exclusive test case keeps its place in the suite (e.g. the watchdog
+    test at the beginning or the button test at the end).
+
+    The results are reported to the runner when each test case finishes, so
+    it works with any runner (SimpleTestRunner, LightlyTestRunner,
+    dbmysqlTestRunner) without mixing up its output.
+
+    Keyword arguments:
+        - tests: Test cases to be added.
+        - jobs: Maximum number of test cases running at the same time.
+
+    .. warning::
+
+        Test cases run in threads of the same process, setUpClass and
+        setUpModule fixtures are not supported.
+
+    """
+    def __init__(self, tests=(), jobs=4):
+        unittest.TestSuite.__init__(self, tests)
+        self.jobs = jobs
+
+    def _flatten(self, suite):
+        for test in suite:
+            if isinstance(test, unittest.TestSuite):
+                for t in self._flatten(test):
+                    yield t
+            else:
+                yield test
+
+    def _conflict(self, a, b):
+        ra = getattr(a, 'resources', None)
+        rb = getattr(b, 'resources', None)
+        if ra is None or rb is None:
+            return True
+        return bool(set(ra) & set(rb))
+
+    def run(self, result):
+        pending = list(self._flatten(self))
+        running = []
+        finished = []
+        cond = threading.Condition()
+
+        def worker(test):
+            recorder = _RecordingResult()
+            try:
+                test(recorder)
+            finally:
+                cond.acquire()
+                # TestCase equality is by test name, look for this instance
+                del running[[id(t) for t in running].index(id(test))]
+                finished.append((test, recorder))
+                cond.notify()
+                cond.release()
+
+        cond.acquire()
+        try:
+            while pending or running or finished:
+                # report finished test cases, outside of the lock
+                done, finished[:] = finished[:], []
+                if done:
+                    cond.release()
+                    try:
+                        for test, recorder in done:
+                            recorder.replay(result)
+                    finally:
+                        cond.acquire()
+                    continue
+                if result.shouldStop:
+                    del pending[:]
+                started = False
+                if len(running) < self.jobs:
+                    for index, test in enumerate(pending):
+                        if any(self._conflict(test, t) for t in running):
+                            continue
+                        if any(self._conflict(test, t) for t in pending[:index]):
+                            continue
+                        del pending[index]
+                        running.append(test)
+                        thread = threading.Thread(target=worker, args=(test,))
+                        thread.daemon = True
+                        thread.start()
+                        started = True
+                        break
+                if not started and (running or pending):
+                    # use a timeout, otherwise Ctrl-C is not delivered
+                    cond.wait(1)
+        finally:
+            cond.release()
+        return result
+
+class _RecordingResult(unittest.TestResult):
+    """ Keep the outcome of a test case to report it later to the runner.
+
+    """
+    def __init__(self):
+        unittest.TestResult.__init__(self)
+        self.events = [ ]
+
+    def startTest(self, test):
+        unittest.TestResult.startTest(self, test)
+        # time the test case in the worker, the runner gets it on replay
+        start_timing(test, self)
+
+    def stopTest(self, test):
+        unittest.TestResult.stopTest(self, test)
+        stop_timing(test)
+
+    def addSuccess(self, test):
+        self.events.append(('addSuccess', (test, )))
+
+    def addError(self, test, err):
+        self.events.append(('addError', (test, err)))
+
+    def addFailure(self, test, err):
+        self.events.append(('addFailure', (test, err)))
+
+    def addSkip(self, test, reason):
+        self.events.append(('addSkip', (test, reason)))
+
+    def addExpectedFailure(self, test, err):
+        self.events.append(('addExpectedFailure', (test, err)))
+
+    def addUnexpectedSuccess(self, test):
+        self.events.append(('addUnexpectedSuccess', (test, )))
+
+    def replay(self, result):
+        """ Report the recorded outcome to result as if the test was run now.
+
+        """
+        if not self.events:
+            return
+        test = self.events[0][1][0]
+        result.startTest(test)
+        for event, args in self.events:
+            getattr(result, event)(*args)
+        result.stopTest(test)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+"""
+Result sinks to store the test results in a database
+
+A sink keeps its connection open between uploads and stores the test suite
+row and all its test case rows in a single transaction, retrying on
+transient errors (e.g. the server went away or the network is not ready).
+
+The MySQLSink is the one used in production. The SQLiteSink speaks the same
+SQL and can be used as a local stand-in of the MySQL server.
+
+"""
+
+import sqlite3
+import time
+
+try:
+    import mysql.connector
+except ImportError:
+    mysql = None
+
+class ResultSinkError(Exception):
+    """ Raised when the results can not be stored.
+
+    """
+    pass
+
+class ResultSink:
+    """ Base class of the result sinks.
+
+    Subclasses provide the database errors and which of them are transient,
+    the SQL uses the '%s' placeholders of the MySQL connector.
+
+    Keyword arguments:
+        - connect: Callable that returns a new connection to the database.
+        - retries: Number of attempts on transient errors.
+        - delay: Delay before the second attempt, in seconds. The delay is
+                 doubled on every attempt.
+        - testcase_columns: Columns of the testcase rows taken from the test
+                            case dictionaries, e.g. add 'duration' if the
+                            table has that column.
+
+    """
+    placeholder = "%s"
+    errors = (Exception, )
+
+    def __init__(self, connect, retries=3, delay=0.5,
+                 testcase_columns=("name", "result")):
+        self.connect = connect
+        self.retries = retries
+        self.delay = delay
+        self.testcase_columns = tuple(testcase_columns)
+        self.cnx = None
+
+    def is_connected(self):
+        """ Returns True if the connection can be reused.
+
+        """
+        return self.cnx is not None
+
+    def is_transient(self, err):
+        """ Returns True if the operation can be retried after err.
+
+        """
+        return False
+
+    def connection(self):
+        """ Returns the pooled connection, connecting if needed.
+
+        """
+        if not self.is_connected():
+            self.close()
+            self.cnx = self.connect()
+        return self.cnx
+
+    def close(self):
+        """ Close the pooled connection.
+
+        """
+        if self.cnx is not None:
+            try:
+                self.cnx.close()
+            except self.errors:
+                pass
+            self.cnx = None
+
+    def sql(self, query):
+        return query.replace("%s", self.placeholder)
+
+    def last_number(self, cursor, table):
+        """ Returns the last number of the table, e.g. of or sn.
+
+        """
+        cursor.execute("SELECT number FROM %s ORDER BY id DESC LIMIT 1" % table)
+        row = cursor.fetchone()
+        if row is None:
+            raise ResultSinkError("No %s number found in the database" % table)
+        return row[0]
+
+    def _resolve(self, suite):
+        cursor = self.connection().cursor()
+        try:
+            return [(c, self.last_number(cursor, c))
+                    if v is None and c in ("of", "sn") else (c, v)
+                    for c, v in suite]
+        finally:
+            cursor.close()
+
+    def resolve(self, suite):
+        """ Returns the testsuite row with the 'of' and 'sn' columns that
+        are None set to the last number of the table with the same name.
+
+        Resolve the numbers when the tests run, not when the results are
+        uploaded, a later upload would take the numbers of another board.
+
+        """
+        return self._retry(self._resolve, suite)
+
+    def _store(self, suite, tests):
+        cnx = self.connection()
+        cursor = cnx.cursor()
+        try:
+            columns = [c for c, v in suite]
+            values = [v for c, v in suite]
+            add_testsuite = ("INSERT INTO testsuite (datetime%s) VALUES (NOW()%s)"
+                             % ("".join(", %s" % c for c in columns),
+                                ", %s" * len(values)))
+            cursor.execute(self.sql(add_testsuite), tuple(values))
+            testsuite_id = cursor.lastrowid
+            add_testcase = ("INSERT INTO testcase (%s, testsuite_id) VALUES (%s%%s)"
+                            % (", ".join(self.testcase_columns),
+                               "%s, " * len(self.testcase_columns)))
+            cursor.executemany(self.sql(add_testcase),
+                [tuple(t.get(c) for c in self.testcase_columns) + (testsuite_id, )
+                 for t in tests])
+            # Make sure data is committed to the database
+            cnx.commit()
+            return testsuite_id
+        except:
+            try:
+                cnx.rollback()
+            except self.errors:
+                pass
+            raise
+        finally:
+            cursor.close()
+
+    def store(self, suite, tests):
+        """ Store a test suite and its test cases in one transaction.
+
+        Returns the id of the testsuite row.
+
+        Keyword arguments:
+            - suite: List of (column, value) of the testsuite row, the
+                     datetime column is always set by the database. A None
+                     value is stored as NULL, see resolve().
+            - tests: List of dictionaries with the 'name' and 'result' of
+                     every test case, and optionally its 'duration'.
+
+        """
+        return self._retry(self._store, suite, tests)
+
+    def _retry(self, function, *args):
+        delay = self.delay
+        for attempt in range(self.retries):
+            try:
+                return function(*args)
+            except self.errors as err:
+                if not self.is_transient(err) or attempt == self.retries - 1:
+                    raise
+                # drop the connection, the next attempt reconnects
+                self.close()
+                time.sleep(delay)
+                delay *= 2
+
+class MySQLSink(ResultSink):
+    """ Store the results in a MySQL database.
+
+    Keyword arguments:
+        - config: Dictionary of mysql.connector.connect arguments (user,
+                  password, host, database, ...)
+
+    """
+    # CR_CONNECTION_ERROR, CR_CONN_HOST_ERROR, CR_SERVER_GONE_ERROR,
+    # CR_SERVER_LOST, ER_LOCK_WAIT_TIMEOUT, ER_LOCK_DEADLOCK
+    TRANSIENT = (2002, 2003, 2006, 2013, 1205, 1213)
+
+    def __init__(self, config, retries=3, delay=0.5,
+                 testcase_columns=("name", "result")):
+        if mysql is None:
+            raise ResultSinkError("Can't find mysql.connector")
+        ResultSink.__init__(self, lambda: mysql.connector.connect(**config),
+                            retries, delay, testcase_columns)
+        self.config = config
+        self.errors = (mysql.connector.Error, )
+
+    def is_connected(self):
+        return self.cnx is not None and self.cnx.is_connected()
+
+    def is_transient(self, err):
+        return getattr(err, 'errno', None) in self.TRANSIENT
+
+class SQLiteSink(ResultSink):
+    """ Store the results in a SQLite database.
+
+    A local stand-in of the MySQL server, NOW() is provided as a SQL
+    function.
+
+    Keyword arguments:
+        - path: The database file, or ':memory:'.
+
+    """
+    placeholder = "?"
+    errors = (sqlite3.Error, )
+
+    def __init__(self, path, retries=3, delay=0.5,
+                 testcase_columns=("name", "result")):
+        ResultSink.__init__(self, self._connect, retries, delay,
+                            testcase_columns)
+        self.path = path
+
+    def _connect(self):
+        cnx = sqlite3.connect(self.path)
+        cnx.create_function("NOW", 0,
+                            lambda: time.strftime("%Y-%m-%d %H:%M:%S"))
+        return cnx
+
+    def is_transient(self, err):
+        return isinstance(err, sqlite3.OperationalError) and "locked" in str(err)
+
+    def create_tables(self):
+        """ Create the tables used by the test runners.
+
+        """
+        cnx = self.connection()
+        cnx.executescript("""
+            CREATE TABLE IF NOT EXISTS of (id INTEGER PRIMARY KEY, number TEXT);
+            CREATE TABLE IF NOT EXISTS sn (id INTEGER PRIMARY KEY, number TEXT);
+            CREATE TABLE IF NOT EXISTS testsuite (id INTEGER PRIMARY KEY,
+                datetime TEXT, of TEXT, sn TEXT, dieid TEXT, mac TEXT);
+            CREATE TABLE IF NOT EXISTS testcase (id INTEGER PRIMARY KEY,
+                name TEXT, result TEXT, duration REAL, testsuite_id INTEGER);
+            """)
+        cnx.commit()
+
+# -----------------------------------------------------------------------------
+# Test Cases for class SQLiteSink
+# -----------------------------------------------------------------------------
+import unittest
+
+class TestClassSQLiteSink(unittest.TestCase):
+    """ Unittest for class SQLiteSink
+
+    """
+    def setUp(self):
+        self.sink = SQLiteSink(":memory:")
+        self.sink.create_tables()
+        cnx = self.sink.connection()
+        cnx.execute("INSERT INTO of (number) VALUES ('OF-1')")
+        cnx.execute("INSERT INTO sn (number) VALUES ('SN-1')")
+        cnx.commit()
+
+    def test_store(self):
+        tests = [{'name': 'Test A', 'result': 'PASS'},
+                 {'name': 'Test B', 'result': 'FAIL'}]
+        suite = self.sink.resolve([('of', None), ('sn', None),
+                                   ('dieid', 'CAFE'), ('mac', '')])
+        # the numbers of later boards are not taken on upload
+        cnx = self.sink.connection()
+        cnx.execute("INSERT INTO of (number) VALUES ('OF-2')")
+        cnx.commit()
+        retval = self.sink.store(suite, tests)
+        cnx = self.sink.connection()
+        row = cnx.execute("SELECT of, sn, dieid FROM testsuite WHERE id = ?",
+                          (retval, )).fetchone()
+        self.failUnless(row == ('OF-1', 'SN-1', 'CAFE'),
+            "Error: Unexpected testsuite row %s" % repr(row))
+        rows = cnx.execute("SELECT name, result FROM testcase "
+                           "WHERE testsuite_id = ?", (retval, )).fetchall()
+        self.failUnless(rows == [('Test A', 'PASS'), ('Test B', 'FAIL')],
+            "Error: Unexpected testcase rows %s" % repr(rows))
+
+    def test_store_without_of(self):
+        cnx = self.sink.connection()
+        cnx.execute("DELETE FROM of")
+        cnx.commit()
+        self.assertRaises(ResultSinkError, self.sink.resolve, [('of', None)])
+        retval = self.sink.store([('of', None), ('dieid', 'CAFE')], [])
+        row = cnx.execute("SELECT of, dieid FROM testsuite WHERE id = ?",
+                          (retval, )).fetchone()
+        self.failUnless(row == (None, 'CAFE'),
+            "Error: Unexpected testsuite row %s" % repr(row))
+
+    def test_store_duration(self):
+        sink = SQLiteSink(":memory:",
+                          testcase_columns=("name", "result", "duration"))
+        sink.create_tables()
+        retval = sink.store([('dieid', 'CAFE')],
+                            [{'name': 'Test A', 'result': 'PASS', 'duration': 1.5}])
+        row = sink.connection().execute("SELECT name, duration FROM testcase "
+                                        "WHERE testsuite_id = ?", (retval, )).fetchone()
+        self.failUnless(row == ('Test A', 1.5),
+            "Error: Unexpected testcase row %s" % repr(row))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+"""
+Local spool of test results
+
+The results are first appended to a local spool file, so they are not lost
+when the database is slow or down, and a background worker drains the spool
+to the database.
+
+"""
+
+import errno
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+
+from igep_qa.helpers.common import monotonic
+
+class ResultSpool:
+    """ Append-only spool of test results.
+
+    Every record is stored as one line with the CRC32 of its JSON encoding,
+
+        <crc32> <json>\\n
+
+    and the file is fsynced once per append() call, whatever the number of
+    records. A torn line (power loss while writing) or a line with a wrong
+    CRC is skipped when reading, and a torn last line is removed by the next
+    append() before writing.
+
+    How far the spool has been drained is kept in a '<path>.offset' file,
+    rewritten atomically. Once everything has been drained the spool is
+    emptied. Records are delivered at least once: a power loss while
+    emptying the spool can deliver the last records twice, never lose them.
+
+    Keyword arguments:
+        - path: The spool file.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offset_path = path + ".offset"
+
+    def _open(self, flags):
+        fd = os.open(self.path, flags | os.O_CREAT, 0644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def append(self, records):
+        """ Append records to the spool and make them durable.
+
+        Keyword arguments:
+            - records: List of records, any JSON serializable objects.
+
+        """
+        data = "".join(self.encode(record) for record in records)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        created = not os.path.exists(self.path)
+        fd = self._open(os.O_RDWR | os.O_APPEND)
+        try:
+            self._truncate_torn(fd)
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if created:
+            # make the new directory entry durable too
+            dirfd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dirfd)
+            finally:
+                os.close(dirfd)
+
+    def _truncate_torn(self, fd):
+        # Remove a torn last line, the records appended after it would be
+        # glued to it and skipped for its wrong CRC
+        size = os.fstat(fd).st_size
+        if size == 0:
+            return
+        os.lseek(fd, size - 1, os.SEEK_SET)
+        if os.read(fd, 1) == "\n":
+            return
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            os.lseek(fd, start, os.SEEK_SET)
+            index = os.read(fd, end - start).rfind("\n")
+            if index >= 0:
+                os.ftruncate(fd, start + index + 1)
+                return
+            end = start
+        os.ftruncate(fd, 0)
+
+    def encode(self, record):
+        line = json.dumps(record, separators=(',', ':'), sort_keys=True)
+        return "%08x %s\n" % (zlib.crc32(line) & 0xffffffff, line)
+
+    def committed(self):
+        """ Returns the offset up to which the spool has been drained.
+
+        """
+        try:
+            fd = open(self.offset_path, "r")
+            retval = int(fd.read().strip() or 0)
+            fd.close()
+            return retval
+        except (IOError, ValueError):
+            return 0
+
+    def pending(self):
+        """ Returns the records not yet drained.
+
+        Returns a list of (offset, record), where offset is the position
+        after the record, to be passed to commit() once it is stored.
+
+        """
+        try:
+            fd = open(self.path, "r")
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return [ ]
+            raise
+        try:
+            offset = self.committed()
+            fd.seek(0, os.SEEK_END)
+            if offset > fd.tell():
+                # the spool was emptied but the offset could not be reset
+                offset = 0
+            fd.seek(offset)
+            retval = [ ]
+            for line in fd:
+                if not line.endswith("\n"):
+                    # torn write, the rest of the record was never written
+                    break
+                offset += len(line)
+                crc, _, data = line[:-1].partition(" ")
+                try:
+                    if int(crc, 16) != zlib.crc32(data) & 0xffffffff:
+                        continue
+                    retval.append((offset, json.loads(data)))
+                except ValueError:
+                    continue
+            return retval
+        finally:
+            fd.close()
+
+    def _write_offset(self, offset):
+        tmp = self.offset_path + ".tmp"
+        fd = open(tmp, "w")
+        fd.write("%d\n" % offset)
+        fd.flush()
+        os.fsync(fd.fileno())
+        fd.close()
+        os.rename(tmp, self.offset_path)
+
+    def commit(self, offset):
+        """ Mark the spool as drained up to offset.
+
+        Keyword arguments:
+            - offset: The offset returned by pending() for the last record
+                      stored.
+
+        """
+        fd = self._open(os.O_RDWR)
+        try:
+            if os.fstat(fd).st_size == offset:
+                # everything drained, empty the spool
+                self._write_offset(0)
+                os.ftruncate(fd, 0)
+                os.fsync(fd)
+            else:
+                self._write_offset(offset)
+        finally:
+            os.close(fd)
+
+    def drain(self, store):
+        """ Store the pending records, in order, and commit them.
+
+        Stops at the first record that can not be stored, the exception is
+        raised and the record is kept for the next drain.
+
+        Returns the number of records stored.
+
+        Keyword arguments:
+            - store: Callable that stores one record, raising on failure.
+
+        """
+        count = 0
+        for offset, record in self.pending():
+            store(record)
+            self.commit(offset)
+            count += 1
+        return count
+
+class SpoolSyncWorker(threading.Thread):
+    """ Drain a ResultSpool in background.
+
+    The worker retries every 'interval' seconds until the spool is empty or
+    'timeout' seconds have passed, then calls 'callback' with the last error
+    (None on success) and the time spent, in seconds. Records not stored are
+    kept in the spool for the next run.
+
+    The thread is a daemon, the process does not wait for it before exiting,
+    join() it with a timeout to give the upload a few seconds.
+
+    Keyword arguments:
+        - spool: The ResultSpool to be drained.
+        - store: Callable that stores one record, raising on failure.
+        - timeout: Maximum time to keep retrying, in seconds.
+        - interval: Time between two attempts, in seconds.
+        - callback: Optional callable called with the last error or None and
+                    the time spent.
+
+    """
+    def __init__(self, spool, store, timeout=120, interval=5, callback=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.spool = spool
+        self.store = store
+        self.timeout = timeout
+        self.interval = interval
+        self.callback = callback
+        self.error = None
+
+    def run(self):
+        start = monotonic()
+        deadline = start + self.timeout
+        while True:
+            try:
+                self.spool.drain(self.store)
+                self.error = None
+                break
+            except Exception as err:
+                self.error = err
+            if monotonic() + self.interval > deadline:
+                break
+            time.sleep(self.interval)
+        if self.callback is not None:
+            self.callback(self.error, monotonic() - start)
+
+# -----------------------------------------------------------------------------
+# Test Cases for class ResultSpool
+# -----------------------------------------------------------------------------
+import shutil
+import tempfile
+import unittest
+
+class TestClassResultSpool(unittest.TestCase):
+    """ Unittest for class ResultSpool
+
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = ResultSpool(os.path.join(self.directory, "spool", "results"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_and_drain(self):
+        self.spool.append([{'n': 1}, {'n': 2}])
+        self.spool.append([{'n': 3}])
+        stored = [ ]
+        retval = self.spool.drain(stored.append)
+        self.failUnless(retval == 3 and stored == [{'n': 1}, {'n': 2}, {'n': 3}],
+            "Error: Unexpected records %s" % repr(stored))
+        self.failUnless(self.spool.pending() == [ ], "Error: Spool not empty")
+        self.failUnless(os.path.getsize(self.spool.path) == 0,
+            "Error: Spool not emptied")
+
+    def test_drain_stops_on_error(self):
+        self.spool.append([{'n': 1}, {'n': 2}])
+        def store(record):
+            if record['n'] == 2:
+                raise IOError("server down")
+        self.assertRaises(IOError, self.spool.drain, store)
+        self.failUnless([r for o, r in self.spool.pending()] == [{'n': 2}],
+            "Error: Unexpected pending records")
+
+    def test_torn_and_corrupted_records(self):
+        self.spool.append([{'n': 1}])
+        fd = open(self.spool.path, "a")
+        fd.write("00000000 {\"n\":2}\n")
+        fd.write(self.spool.encode({'n': 3}))
+        fd.write(self.spool.encode({'n': 4})[:-3])
+        fd.close()
+        records = [r for o, r in self.spool.pending()]
+        self.failUnless(records == [{'n': 1}, {'n': 3}],
+            "Error: Unexpected records %s" % repr(records))
+
+    def test_append_after_torn_record(self):
+        self.spool.append([{'n': 1}])
+        fd = open(self.spool.path, "a")
+        fd.write(self.spool.encode({'n': 2})[:-3])
+        fd.close()
+        self.spool.append([{'n': 3}])
+        stored = [ ]
+        self.spool.drain(stored.append)
+        self.failUnless(stored == [{'n': 1}, {'n': 3}],
+            "Error: Unexpected records %s" % repr(stored))
+        self.failUnless(os.path.getsize(self.spool.path) == 0,
+            "Error: Spool not emptied")
+        # a spool with only a torn line
+        fd = open(self.spool.path, "a")
+        fd.write("x" * 5000)
+        fd.close()
+        self.spool.append([{'n': 4}])
+        records = [r for o, r in self.spool.pending()]
+        self.failUnless(records == [{'n': 4}],
+            "Error: Unexpected records %s" % repr(records))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,8 @@ Simple Test Runner for unittest module
 import sys
 import unittest
 
+from igep_qa.runners.timing import TimingResultMixin
+
 class SimpleTestRunner:
     """ A Test Runner that shows results in a simple human-readable format.  
 
@@ -15,6 +17,9 @@ class SimpleTestRunner:
         This is a test short description : PASS
         This is another test short description : FAIL
         ---------------------------------------------
+        Slowest tests:
+          This is another test short description : 2.10 s (setUp 0.00 s, test 2.10 s, tearDown 0.00 s)
+          This is a test short description : 0.52 s (setUp 0.00 s, test 0.52 s, tearDown 0.00 s)
 
     """
     def __init__(self, stream=sys.stderr, verbosity=0):
@@ -32,9 +37,10 @@ class SimpleTestRunner:
         test(result)
         result.testsRun
         self.writeUpdate("---------------------------------------------\n")
+        self.writeUpdate(result.timingSummary())
         return result
 
-class TextTestResult(unittest.TestResult):
+class TextTestResult(TimingResultMixin, unittest.TestResult):
     # Print in terminal with colors
     PASS = '\033[32mPASS\033[0m\n'
     FAIL = '\033[31mFAIL\033[0m\n'
@@ -45,7 +51,7 @@ class TextTestResult(unittest.TestResult):
         self.runner = runner
 
     def startTest(self, test):
-        unittest.TestResult.startTest(self, test)
+        super(TextTestResult, self).startTest(test)
         self.runner.writeUpdate("%s : " % test.shortDescription())
 
     def addSuccess(self, test):
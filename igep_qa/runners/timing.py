@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""
+Timing of test cases for the test runners
+
+"""
+
+import os
+
+from igep_qa.helpers.command import get_stats
+from igep_qa.helpers.common import monotonic
+
+PHASES = ("setUp", "test", "tearDown")
+
+class QTiming:
+    """ Timing of a test case.
+
+    All times are in seconds, measured with a monotonic clock.
+
+    Attributes:
+        - start: Start time of the test case.
+        - stop: Stop time of the test case, None while it is running.
+        - phases: Dictionary with the duration of the setUp, test and
+                  tearDown phases.
+        - children: CPU time (user + system) of the subprocesses waited for
+                    while the test case was running. The counter is per
+                    process, test cases running at the same time share it.
+        - commands: Number of commands run with igep_qa.helpers.command by
+                    the test case and the wall time spent waiting for them.
+
+    """
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.start = monotonic()
+        self.stop = None
+        self.phases = { }
+        self.children = 0.0
+        self.commands = (0, 0.0)
+        self._times = os.times()
+        self._commands = get_stats()
+        self._wrapped = [ ]
+
+    @property
+    def duration(self):
+        """ Returns the duration of the test case, up to now if running.
+
+        """
+        if self.stop is None:
+            return monotonic() - self.start
+        return self.stop - self.start
+
+    def finish(self):
+        self.stop = monotonic()
+        times = os.times()
+        self.children = ((times[2] - self._times[2]) +
+                         (times[3] - self._times[3]))
+        count, wall = get_stats()
+        self.commands = (count - self._commands[0], wall - self._commands[1])
+
+    def __str__(self):
+        phases = ["%s %.2f s" % (p, self.phases[p]) for p in PHASES
+                  if p in self.phases]
+        if self.commands[0]:
+            phases.append("%d command(s) %.2f s" % self.commands)
+        if self.children:
+            phases.append("subprocesses cpu %.2f s" % self.children)
+        return "%.2f s (%s)" % (self.duration, ", ".join(phases))
+
+def _wrap(timing, name, func):
+    def wrapper(*args, **kwargs):
+        start = monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timing.phases[name] = (timing.phases.get(name, 0.0) +
+                                   monotonic() - start)
+    return wrapper
+
+def start_timing(test, owner=None):
+    """ Start the timing of a test case, stored in its '_timing' attribute.
+
+    The setUp, test method and tearDown of the test case are wrapped to
+    measure every phase.
+
+    Keyword arguments:
+        - test: The test case.
+        - owner: The test result that runs the test case.
+
+    """
+    timing = QTiming(owner)
+    test._timing = timing
+    methods = (("setUp", "setUp"), ("test", getattr(test, "_testMethodName", None)),
+               ("tearDown", "tearDown"))
+    for phase, name in methods:
+        func = getattr(test, name, None) if name else None
+        if func is None:
+            continue
+        setattr(test, name, _wrap(timing, phase, func))
+        timing._wrapped.append(name)
+    return timing
+
+def stop_timing(test):
+    """ Stop the timing of a test case and restore its methods.
+
+    """
+    timing = getattr(test, "_timing", None)
+    if timing is None or timing.stop is not None:
+        return timing
+    timing.finish()
+    for name in timing._wrapped:
+        # remove the instance attribute, the method of the class is back
+        try:
+            delattr(test, name)
+        except AttributeError:
+            pass
+    return timing
+
+def get_timing(test):
+    """ Returns the QTiming of a test case or None if not timed.
+
+    """
+    return getattr(test, "_timing", None)
+
+class TimingResultMixin(object):
+    """ Record the timing of every test case run by a TestResult.
+
+    It must precede unittest.TestResult in the base classes. A test case
+    already timed by another result (e.g. a ParallelTestSuite worker) keeps
+    its timing when it is reported.
+
+    """
+    def startTest(self, test):
+        timing = getattr(test, "_timing", None)
+        if timing is None or timing.stop is None or timing.owner is self:
+            start_timing(test, self)
+        if not hasattr(self, "timings"):
+            self.timings = [ ]
+        self.timings.append(test)
+        super(TimingResultMixin, self).startTest(test)
+
+    def stopTest(self, test):
+        super(TimingResultMixin, self).stopTest(test)
+        stop_timing(test)
+
+    def slowest(self, count=5):
+        """ Returns the 'count' slowest test cases as (test, QTiming).
+
+        """
+        timings = [(t, get_timing(t)) for t in getattr(self, "timings", [])]
+        timings.sort(key=lambda t: t[1].duration, reverse=True)
+        return timings[:count]
+
+    def timingSummary(self, count=5):
+        """ Returns a human-readable summary of the slowest test cases.
+
+        """
+        lines = ["Slowest tests:\n"]
+        for test, timing in self.slowest(count):
+            lines.append("  %s : %s\n" % (test.shortDescription() or test.id(),
+                                          timing))
+        return "".join(lines)
@@ -4,6 +4,8 @@ import ConfigParser
 import commands
 import sys
 import unittest
+
+from igep_qa.helpers.netif import get_manager
 # Test Runners
 from igep_qa.runners.dbmysql import dbmysqlTestRunner
 # Test Cases
@@ -170,12 +172,20 @@ def testsuite_IGEP0020_RC80C01():
     f.close()
 
     # send result to the server
-    commands.getstatusoutput("ifconfig eth0 %s" % ipaddr)
-    commands.getstatusoutput("scp %s root@%s:/tmp" % (log_file, xserverip))
-    commands.getstatusoutput("ssh -y root@%s xterm -display :0 "
-                            "-fg white -bg black "
-                            "-e /usr/share/igep_qa/contrib/show-results.sh "
-                            % xserverip)
+    try:
+        get_manager().acquire("eth0", ipaddr)
+    except (IOError, OSError) as err:
+        # scp and ssh fail without network, as with ifconfig before
+        print "Can't configure eth0: %s" % err
+    else:
+        try:
+            commands.getstatusoutput("scp %s root@%s:/tmp" % (log_file, xserverip))
+            commands.getstatusoutput("ssh -y root@%s xterm -display :0 "
+                                    "-fg white -bg black "
+                                    "-e /usr/share/igep_qa/contrib/show-results.sh "
+                                    % xserverip)
+        finally:
+            get_manager().release("eth0")
     return retval
 
 # The main program just runs the test suite in verbose mode
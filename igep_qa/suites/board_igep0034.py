@@ -13,7 +13,7 @@ from igep_qa.tests.qbutton import TestButton
 from igep_qa.tests.qpower import TestPower
 from igep_qa.tests.qi2c import TestI2C
 from igep_qa.tests.qserial import TestSerial
-from igep_qa.tests.qstorage import TestBlockStorage
+from igep_qa.tests.qstorage import TestBlockStorage, TestStorageBenchmark
 from igep_qa.tests.qaudio import TestAudio
 from igep_qa.tests.qnetwork import TestNetwork
 from igep_qa.tests.qwifi import TestWiFi
@@ -148,13 +148,21 @@ def testsuite_IGEP0034():
     suite.addTest(TestSerial("test_serial_loopback", "/dev/ttyO5"))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb2/2-1/2-1.1',
         'Test USB HOST 2-1.1: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb2/2-1/2-1.1',
+        min_speed=480, testdescription='Test USB HOST 2-1.1: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb2/2-1/2-1.2',
         'Test USB HOST 2-1.2: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb2/2-1/2-1.2',
+        min_speed=480, testdescription='Test USB HOST 2-1.2: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb2/2-1/2-1.3',
         'Test USB HOST 2-1.3: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb2/2-1/2-1.3',
+        min_speed=480, testdescription='Test USB HOST 2-1.3: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestAudio('test_audio_loopback'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb1/1-1/1-1:1.0',
         'Test USB OTG 1-1:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb1/1-1/1-1:1.0',
+        min_speed=480, testdescription='Test USB OTG 1-1:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestWiFi("test_ap_with_wep_encryption",
                             config.get('wireless', 'serverip'),
                             config.get('wireless', 'essid'),
@@ -279,13 +287,21 @@ def testsuite_IGEP0034_LITE():
     suite.addTest(TestSerial("test_serial_loopback", "/dev/ttyO5"))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb2/2-1/2-1.1',
         'Test USB HOST 2-1.1: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb2/2-1/2-1.1',
+        min_speed=480, testdescription='Test USB HOST 2-1.1: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb2/2-1/2-1.2',
         'Test USB HOST 2-1.2: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb2/2-1/2-1.2',
+        min_speed=480, testdescription='Test USB HOST 2-1.2: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb2/2-1/2-1.3',
         'Test USB HOST 2-1.3: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb2/2-1/2-1.3',
+        min_speed=480, testdescription='Test USB HOST 2-1.3: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestAudio('test_audio_loopback'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb1/1-1/1-1:1.0',
         'Test USB OTG 1-1:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb1/1-1/1-1:1.0',
+        min_speed=480, testdescription='Test USB OTG 1-1:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestWiFi("test_ap_with_wep_encryption",
                             config.get('wireless', 'serverip'),
                             config.get('wireless', 'essid'),
@@ -6,6 +6,7 @@ import sys
 import unittest
 # Test Runners
 from igep_qa.runners import dbmysql
+from igep_qa.runners.parallel import ParallelTestSuite
 # Test Helpers
 from igep_qa.helpers import imx6
 # Test Cases
@@ -14,16 +15,17 @@ from igep_qa.tests.qpower import TestPower
 from igep_qa.tests.qserial import TestSerial
 from igep_qa.tests.qaudio import TestAudio
 from igep_qa.tests.qi2c import TestI2C
-from igep_qa.tests.qstorage import TestBlockStorage
+from igep_qa.tests.qstorage import TestBlockStorage, TestStorageBenchmark
 from igep_qa.tests.qwifi import TestWiFi
 from igep_qa.tests.qbutton import TestButton
 from igep_qa.tests.qflash import TestFlash
 from igep_qa.tests.qwatchdog import TestWatchdog
 
-# For every test suite we create an instance of TestSuite and add test case
-# instances. When all tests have been added, the suite can be passed to a test
-# runner, such as TextTestRunner. It will run the individual test cases in the
-# order in which they were added, aggregating the results.
+# For every test suite we create an instance of ParallelTestSuite and add test
+# case instances. When all tests have been added, the suite can be passed to a
+# test runner, such as TextTestRunner. Test cases that do not share hardware
+# resources run at the same time, the rest run in the order in which they were
+# added, aggregating the results.
 
 def testsuite_IGEP0046_QuadC2():
     """ A number of TestCases for the IGEP0046RC02(and RD) board.
@@ -105,18 +107,18 @@ def testsuite_IGEP0046_QuadC2():
     config = ConfigParser.ConfigParser()
     config.read('/etc/testsuite.conf')
     # create test suite
-    suite = unittest.TestSuite()
+    suite = ParallelTestSuite()
     suite.addTest(TestWatchdog("test_igep0046_watchdog", '', 1, '0x08', '0x1C'))
-    suite.addTest(TestNetwork("test_ping_host",
-                            config.get('default', 'ipaddr'),
-                            config.get('default', 'serverip'),
-                            'eth0'))
     suite.addTest(TestPower('test_max_current',
                             1,
                             config.get('default', 'ipaddr'),
                             config.get('default', 'serverip'),
                             9999,
                             'eth0'))
+    suite.addTest(TestNetwork("test_ping_host",
+                            config.get('default', 'ipaddr'),
+                            config.get('default', 'serverip'),
+                            'eth0'))
     suite.addTest(TestAudio('test_audio_workaround_loopback'))
     suite.addTest(TestSerial("test_serial_loopback", "/dev/ttymxc1"))
     suite.addTest(TestSerial("test_serial_loopback", "/dev/ttymxc3"))
@@ -128,14 +130,24 @@ def testsuite_IGEP0046_QuadC2():
         'Test EEPROM: Check for EEPROM in bus 2 at address 0x50'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.1:1.0',
         'Test USB HOST -1.1:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.1:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.1:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.2:1.0',
         'Test USB HOST -1.2:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.2:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.2:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.3:1.0',
         'Test USB HOST -1.3:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.3:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.3:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb1/1-1/1-1:1.0',
         'Test USB OTG 1-1:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb1/1-1/1-1:1.0',
+        min_speed=480, testdescription='Test USB OTG 1-1:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', '.sata/ata1',
         'Test SATA .sata/ata1: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '.sata/ata1',
+        min_speed=3000, testdescription='Test SATA .sata/ata1: Check the link speed is at least 3000 Mb/s'))
     suite.addTest(TestWiFi("test_ap_with_wep_encryption",
                             config.get('wireless', 'serverip'),
                             config.get('wireless', 'essid'),
@@ -227,18 +239,18 @@ def testsuite_IGEP0046_DualLiteD102():
     config = ConfigParser.ConfigParser()
     config.read('/etc/testsuite.conf')
     # create test suite
-    suite = unittest.TestSuite()
+    suite = ParallelTestSuite()
     suite.addTest(TestWatchdog("test_igep0046_watchdog", '', 1, '0x08', '0x1C'))
-    suite.addTest(TestNetwork("test_ping_host",
-                            config.get('default', 'ipaddr'),
-                            config.get('default', 'serverip'),
-                            'eth0'))
     suite.addTest(TestPower('test_max_current',
                             0.70,
                             config.get('default', 'ipaddr'),
                             config.get('default', 'serverip'),
                             9999,
                             'eth0'))
+    suite.addTest(TestNetwork("test_ping_host",
+                            config.get('default', 'ipaddr'),
+                            config.get('default', 'serverip'),
+                            'eth0'))
     suite.addTest(TestAudio('test_audio_workaround_loopback'))
     suite.addTest(TestSerial("test_serial_loopback", "/dev/ttymxc0"))
     suite.addTest(TestSerial("test_serial_loopback", "/dev/ttymxc1"))
@@ -251,12 +263,20 @@ def testsuite_IGEP0046_DualLiteD102():
         'Test EEPROM: Check for EEPROM in bus 2 at address 0x50'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.1:1.0',
         'Test USB HOST -1.1:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.1:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.1:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.2:1.0',
         'Test USB HOST -1.2:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.2:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.2:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.3:1.0',
         'Test USB HOST -1.3:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.3:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.3:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb1/1-1/1-1:1.0',
         'Test USB OTG 1-1:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb1/1-1/1-1:1.0',
+        min_speed=480, testdescription='Test USB OTG 1-1:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestFlash('test_firmware', '/run/media/mmcblk2p1',
         '/zImage',
         '',
@@ -344,18 +364,18 @@ def testsuite_IGEP0046_QuadD102():
     config = ConfigParser.ConfigParser()
     config.read('/etc/testsuite.conf')
     # create test suite
-    suite = unittest.TestSuite()
+    suite = ParallelTestSuite()
     suite.addTest(TestWatchdog("test_igep0046_watchdog", '', 1, '0x08', '0x1C'))
-    suite.addTest(TestNetwork("test_ping_host",
-                            config.get('default', 'ipaddr'),
-                            config.get('default', 'serverip'),
-                            'eth0'))
     suite.addTest(TestPower('test_max_current',
                             1,
                             config.get('default', 'ipaddr'),
                             config.get('default', 'serverip'),
                             9999,
                             'eth0'))
+    suite.addTest(TestNetwork("test_ping_host",
+                            config.get('default', 'ipaddr'),
+                            config.get('default', 'serverip'),
+                            'eth0'))
     suite.addTest(TestAudio('test_audio_workaround_loopback'))
     suite.addTest(TestSerial("test_serial_loopback", "/dev/ttymxc0"))
     suite.addTest(TestSerial("test_serial_loopback", "/dev/ttymxc1"))
@@ -368,14 +388,24 @@ def testsuite_IGEP0046_QuadD102():
         'Test EEPROM: Check for EEPROM in bus 2 at address 0x50'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.1:1.0',
         'Test USB HOST -1.1:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.1:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.1:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.2:1.0',
         'Test USB HOST -1.2:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.2:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.2:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', '-1.3:1.0',
         'Test USB HOST -1.3:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '-1.3:1.0',
+        min_speed=480, testdescription='Test USB HOST -1.3:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', 'usb1/1-1/1-1:1.0',
         'Test USB OTG 1-1:1.0: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', 'usb1/1-1/1-1:1.0',
+        min_speed=480, testdescription='Test USB OTG 1-1:1.0: Check the link speed is at least 480 Mb/s'))
     suite.addTest(TestBlockStorage('test_storage_device', '.sata/ata1',
         'Test SATA .sata/ata1: Check for this_is_an_storage_device file'))
+    suite.addTest(TestStorageBenchmark('test_storage_link_speed', '.sata/ata1',
+        min_speed=3000, testdescription='Test SATA .sata/ata1: Check the link speed is at least 3000 Mb/s'))
     suite.addTest(TestFlash('test_firmware', '/run/media/mmcblk2p1',
         '/zImage',
         '',
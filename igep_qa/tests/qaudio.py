@@ -6,9 +6,11 @@ Audio Test Cases modules for unittest
 """
 
 import os
-import commands
 import unittest
 
+from igep_qa.helpers import audioquality
+from igep_qa.helpers.audio import QAudioLoopback
+from igep_qa.helpers.command import run
 from igep_qa.helpers.common import is_in_path
 
 class TestAudio(unittest.TestCase):
@@ -19,18 +21,33 @@ class TestAudio(unittest.TestCase):
         - device : Select the PCM device by name. This parameter is passed to
                    aplay and arecord using the -D option.
         - testdescription: Optional test description to overwrite the default.
+        - channels: Number of channels of the quality test.
+        - limits: Optional limits of the quality test, a dictionary with some
+                  of the keys of igep_qa.helpers.audioquality.LIMITS
+                  (min_level, max_level, max_thdn, max_ripple, max_crosstalk)
 
     """
-    def __init__(self, testname, device='', testdescription=''):
+    def __init__(self, testname, device='', testdescription='', channels=2,
+                 limits=None):
         super(TestAudio, self).__init__(testname)
+        self.channels = channels
+        self.limits = limits
+        self.pcm = device
         self.device = device
         # if not empty, add the -D option
         if device:
             self.device = '-D%s' % device
+        self.device_args = [self.device] if self.device else [ ]
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = ['/dev/snd']
         # Overwrite test short description
         if testdescription:
             self._testMethodDoc = testdescription
 
+    def describe(self, digits):
+        return "(digits: %s)" % (", ".join("%s %.1f dB" % (d.digit, d.snr)
+                                           for d in digits) or "none")
+
     def test_audio_loopback(self):
         """ Test Audio : Loopback, sound sent to audio-out should return in audio-in
 
@@ -39,7 +56,6 @@ class TestAudio(unittest.TestCase):
         Prerequisite commands:
             - aplay
             - arecord
-            - multimon
 
         Prerequitsite files:
             - dtmf.wav (on contrib/dtmf.wav)
@@ -50,30 +66,26 @@ class TestAudio(unittest.TestCase):
         Description:
             - Connect the cable between Audio IN and Audio OUT connectors.
             - A sound with recorded DTMF tones is reproduced through Audio OUT
-              and is simultaneously recorded via Audio IN.
-            - Using demodulator multimon, it demodulates the recorded tune and
-              gets the DMTF digits.
+              and is simultaneously captured via Audio IN.
+            - A Goertzel DTMF detector demodulates the captured tune while it
+              arrives and gets the DMTF digits and their signal to noise
+              ratio, the test ends as soon as the expected digit is found.
 
         """
         # Ensure requirements are installed.
-        required = ["aplay", "arecord", "multimon"]
+        required = ["aplay", "arecord"]
         files = "/usr/igep_qa/contrib/dtmf.wav"
         for req in required:
             if not is_in_path(req):
                 raise Exception("Can't find %s" % req)
         if not os.path.isfile(files):
             raise Exception("Can't find %s" % files)
-        commands.getoutput("rm -f /tmp/recorded.wav")
-        commands.getoutput("aplay %s -t wav -v "
-                           "/usr/igep_qa/contrib/dtmf.wav & arecord %s "
-                           "-t wav -c 1 -r 8000 -f S16_LE -d 5 -v "
-                           "/tmp/recorded.wav" % (self.device, self.device))
-
-        retval = commands.getstatusoutput("multimon -t wav -a DTMF "
-                                          "/tmp/recorded.wav | grep 'DTMF: 5'")
+        # stops as soon as the digit is detected
+        digits = QAudioLoopback(self.pcm).detect_dtmf(files, "5")
 
-        self.failUnless(retval[0] == 0, "failed: No DTMF found in recorded "
-                        "file")
+        self.failUnless("5" in [d.digit for d in digits],
+                        "failed: No DTMF found in captured audio %s"
+                        % self.describe(digits))
 
     def test_audio_workaround_loopback(self):
         """ Test Audio WORKAROUND: Loopback, sound sent to audio-out should return in audio-in
@@ -83,7 +95,6 @@ class TestAudio(unittest.TestCase):
         Prerequisite commands:
             - aplay
             - arecord
-            - multimon
 
         Prerequitsite files:
             - dtmf.wav (on contrib/dtmf.wav)
@@ -98,15 +109,14 @@ class TestAudio(unittest.TestCase):
 
             - Connect the cable between Audio IN and Audio OUT connectors.
             - A sound with recorded DTMF tones is reproduced through Audio OUT
-              and is simultaneously recorded via Audio IN.
-            - Using demodulator multimon, it demodulates the recorded tune and
-              gets the DMTF digits.
+              and is simultaneously captured via Audio IN.
+            - A Goertzel DTMF detector demodulates the captured tune while it
+              arrives and gets the DMTF digits and their signal to noise
+              ratio, the test ends as soon as the expected digit is found.
 
         """
-        import subprocess
-
         # Ensure requirements are installed.
-        required = ["aplay", "arecord", "multimon"]
+        required = ["aplay", "arecord"]
         files = "/usr/igep_qa/contrib/dtmf.wav"
         for req in required:
             if not is_in_path(req):
@@ -114,23 +124,62 @@ class TestAudio(unittest.TestCase):
         if not os.path.isfile(files):
             raise Exception("Can't find %s" % files)
 
+        # aplay uses the default device, it is killed if it hangs
+        loopback = QAudioLoopback(self.pcm, play_device=False)
         for retry in range(3):
-            commands.getoutput("rm -f /tmp/recorded.wav")
-            fd = os.open("/tmp/foo.txt", os.O_RDWR|os.O_CREAT)
-            subprocess.Popen(["aplay", "-t", "wav", "-v", "/usr/igep_qa/contrib/dtmf.wav"],
-                           stdin=None, stdout=fd, stderr=fd)
-            commands.getoutput("arecord %s -t wav -c 1 -r 8000 -f S16_LE -d 5 -v "
-                           "/tmp/recorded.wav" % self.device)
-            commands.getoutput("killall aplay")
-            os.close(fd)
-
-            retval = commands.getstatusoutput("multimon -t wav -a DTMF "
-                                  "/tmp/recorded.wav | grep 'DTMF: 5'")
-            if retval[0] == 0:
+            digits = loopback.detect_dtmf(files, "5")
+            found = "5" in [d.digit for d in digits]
+            if found:
                 break
 
-        self.failUnless(retval[0] == 0, "failed: No DTMF found in recorded "
-                "file")
+        self.failUnless(found, "failed: No DTMF found in captured audio %s"
+                        % self.describe(digits))
+
+    def test_audio_quality(self):
+        """ Test Audio : Quality, level, THD+N, frequency response and crosstalk
+
+        Type: Performance
+
+        Prerequisite commands:
+            - aplay
+            - arecord
+
+        Prerequisite modules:
+            - numpy
+
+        Requirements:
+            - Audio Mini jack-Stereo loopback cable.
+
+        Description:
+            - Connect the cable between Audio IN and Audio OUT connectors.
+            - A generated stimulus, a 1 kHz tone on all channels and then a
+              multi-tone on every channel, is reproduced through Audio OUT
+              and is simultaneously captured via Audio IN.
+            - The capture is analysed with FFTs to get the level and THD+N
+              of the tone, the frequency response of the multi-tone and the
+              crosstalk between channels, and they are checked against the
+              limits.
+
+        """
+        # Ensure requirements are installed.
+        required = ["aplay", "arecord"]
+        for req in required:
+            if not is_in_path(req):
+                raise Exception("Can't find %s" % req)
+        if audioquality.numpy is None:
+            raise Exception("Can't find numpy")
+
+        stimulus = audioquality.QAudioStimulus(channels=self.channels)
+        chunks = [ ]
+        # the stimulus is played from a pipe, as the capture is read
+        QAudioLoopback(self.pcm, rate=stimulus.rate).stream(None,
+            chunks.append, duration=stimulus.duration + 1, grace=0.5,
+            channels=stimulus.channels, data=stimulus.wav())
+        capture = audioquality.samples_from_pcm("".join(chunks),
+                                                stimulus.channels)
+        result = audioquality.QAudioAnalysis(stimulus, capture)
+        failures = result.check(self.limits)
+        self.failIf(failures, "failed: %s (%s)" % ("; ".join(failures), result))
 
     def test_audio_playwav(self):
         """ Test Audio : Play a wav file
@@ -155,10 +204,9 @@ class TestAudio(unittest.TestCase):
                 raise Exception("Can't find %s" % req)
         if not os.path.isfile(files):
             raise Exception("Can't find %s" % files)
-        retval = commands.getstatusoutput("aplay %s -t wav "
-                                          "/usr/igep_qa/contrib/test.wav"
-                                           % self.device)
-        self.failUnless(retval[0] == 0, "failed: Playing test.wav.")
+        retval = run(["aplay"] + self.device_args + ["-t", "wav",
+                     "/usr/igep_qa/contrib/test.wav"], 60)
+        self.failUnless(retval.ok, "failed: Playing test.wav.")
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -5,11 +5,10 @@ Board Specific Test Cases modules for unittest
 
 """
 
-import serial
-import time
 import unittest
 
 from igep_qa.helpers import gpiolib
+from igep_qa.helpers.serialmux import QSerialMuxer
 
 class TestSerialMuxer(unittest.TestCase):
     """ Serial Muxer tests for ILMS0010 board.
@@ -17,36 +16,33 @@ class TestSerialMuxer(unittest.TestCase):
     Keyword arguments:
         - testname : The name of the test to be executed.
         - testdescription: Optional test description to overwrite the default.
+        - timeout: Maximum time to wait for a response, in seconds.
+        - frames: Number of frames per port of the soak test.
+        - max_error_rate: Maximum ratio of frames lost or wrong of the soak
+                          test.
 
     """
-    def __init__(self, testname, testdescription=''):
+    def __init__(self, testname, testdescription='', timeout=1, frames=1000,
+                 max_error_rate=0):
         super(TestSerialMuxer, self).__init__(testname)
-        self.timeout = 1
+        self.timeout = timeout
+        self.frames = frames
+        self.max_error_rate = max_error_rate
         self.gpio19 = gpiolib.QGpio(19)
         self.gpio22 = gpiolib.QGpio(22)
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = ['/dev/ttyO1', 'gpio19', 'gpio22']
         # Overwrite test description
         if testdescription:
             self._testMethodDoc = testdescription
 
     def setUp(self):
-        self.s = serial.Serial('/dev/ttyO1', 115200, timeout=self.timeout)
+        # gpio19 is the least significant bit of the port number
+        self.muxer = QSerialMuxer('/dev/ttyO1', [self.gpio19, self.gpio22],
+                                  115200, timeout=self.timeout)
 
     def tearDown(self):
-        self.s.close()
-
-    def fight(self, r):
-        if r == 0:
-            self.gpio19.set_value(0)
-            self.gpio22.set_value(0)
-        elif r == 1:
-            self.gpio19.set_value(1)
-            self.gpio22.set_value(0)
-        elif r == 2:
-            self.gpio19.set_value(0)
-            self.gpio22.set_value(1)
-        elif r == 3:
-            self.gpio19.set_value(1)
-            self.gpio22.set_value(1)
+        self.muxer.close()
 
     def test_serial_muxer(self):
         """ Test Serial Muxer : Request-response with other computer (Ryu VS Ken)
@@ -67,12 +63,32 @@ class TestSerialMuxer(unittest.TestCase):
             (in memory of Street Fighter)
 
         """
-        for port in range(4):
-            self.fight(port)
-            time.sleep(0.05)  # there might be a small delay
-            self.s.write('Are You Ken?')
-            retval = (self.s.read(12) == 'Come Closer!')
-            self.failUnless(retval, 'error: Failed talking with port %s.' % (port + 1))
+        results = self.muxer.sweep('Are You Ken?', 'Come Closer!')
+        failed = [str(r.state + 1) for r in results if not r.ok]
+        self.failIf(failed, 'error: Failed talking with port %s.'
+                    % ", ".join(failed))
+
+    def test_serial_muxer_soak(self):
+        """ Test Serial Muxer : Soak with randomized frames
+
+        Type: Functional
+
+        Requirements:
+             - The cross wired hardware of test_serial_muxer.
+             - The serial server echoes every frame received.
+
+        Description:
+            Every port is selected and thousands of randomized frames are
+            sent, several at the same time, and should be echoed back. The
+            error rate and the latency percentiles of the failing ports are
+            reported.
+
+        """
+        results = self.muxer.soak(self.frames)
+        failed = [str(r) for r in results
+                  if r.settle is None or r.error_rate > self.max_error_rate]
+        self.failIf(failed, 'error: Too many errors on %s.'
+                    % "; ".join(failed))
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -6,13 +6,23 @@ User button Test Cases modules for unittest
 """
 
 import unittest
-import os
-import select
-import commands
 import time
+from igep_qa.helpers.command import run
 from igep_qa.helpers.gpiolib import QGpio
 from igep_qa.helpers.imx6 import cpu_is_imx6
 
+def write_tty(tty, message):
+    """ Write a message to a terminal, like echo, returns True on success.
+
+    """
+    try:
+        fd = open(tty, "w")
+        fd.write(message)
+        fd.close()
+        return True
+    except IOError:
+        return False
+
 class TestButton(unittest.TestCase):
     """ Generic test for user button.
 
@@ -49,17 +59,16 @@ class TestButton(unittest.TestCase):
 
         def exit_commands():
             if cpu_is_imx6():
-                retval = commands.getstatusoutput("echo ' ' > /dev/tty0")
-                self.failUnless(retval[0] == 0, "failed: Can't execute 'echo'")
-                retval = commands.getstatusoutput("echo '\033[37mTest Button Fbtest : Test finished, result is \033' > /dev/tty0")
-                self.failUnless(retval[0] == 0, "failed: Can't execute 'echo'")
+                retval = write_tty("/dev/tty0", " \n")
+                self.failUnless(retval, "failed: Can't execute 'echo'")
+                retval = write_tty("/dev/tty0", "\033[37mTest Button Fbtest : Test finished, result is \033\n")
+                self.failUnless(retval, "failed: Can't execute 'echo'")
             else:
-                retval = commands.getstatusoutput("clear > /dev/tty0")
-                self.failUnless(retval[0] == 0, "failed: Can't execute 'clear > /dev/tty0'")
-                retval = commands.getstatusoutput("echo '\033[37mTest Button Fbtest : Read User button action and display fb-test pattern: \033' > /dev/tty0")
-                self.failUnless(retval[0] == 0, "failed: Can't execute 'echo'")
-
-            f.close();
+                retval = run(["clear"], 10)
+                self.failUnless(retval.ok and write_tty("/dev/tty0", retval.output),
+                                "failed: Can't execute 'clear > /dev/tty0'")
+                retval = write_tty("/dev/tty0", "\033[37mTest Button Fbtest : Read User button action and display fb-test pattern: \033\n")
+                self.failUnless(retval, "failed: Can't execute 'echo'")
 
             self._testMethodDoc = "Test Button Fbtest : Read User button action and display fb-test pattern"
 
@@ -73,36 +82,25 @@ class TestButton(unittest.TestCase):
         self.failUnless(retval == 'falling\n',
             "Error: Expected value 'falling' and readed %s" % retval)
 
-        f = open(os.path.join(self.gpio_in.sysfs, 'value'), 'r')
-
-        po = select.poll()
-        po.register(f, select.POLLPRI)
-
-        f.seek(0)
-        state_last = f.read()
-        events = po.poll(30000)
-        if not events:
+        if self.gpio_in.wait_edge(30) is None:
             exit_commands()
             self.fail("Error timeout, unable to get first button press")
 
         if cpu_is_imx6():
-            retval = commands.getstatusoutput("echo ' ' > /dev/tty0")
-            self.failUnless(retval[0] == 0, "failed: Can't execute 'echo'")
-            retval = commands.getstatusoutput("echo '\033[33mTest Button Fbtest : PLEASE, PRESS USER BUTTON (S1200) TO ACCEPT DISPLAY PATTERN OR WAIT 30 SECONDS. \033' > /dev/tty0")
-            self.failUnless(retval[0] == 0, "failed: Can't execute 'echo'")
+            retval = write_tty("/dev/tty0", " \n")
+            self.failUnless(retval, "failed: Can't execute 'echo'")
+            retval = write_tty("/dev/tty0", "\033[33mTest Button Fbtest : PLEASE, PRESS USER BUTTON (S1200) TO ACCEPT DISPLAY PATTERN OR WAIT 30 SECONDS. \033\n")
+            self.failUnless(retval, "failed: Can't execute 'echo'")
         else:
-            retval = commands.getstatusoutput("/usr/bin/fb-test")
-            self.failUnless(retval[0] == 0, "failed: Can't execute /usr/bin/fb-test")
+            retval = run(["/usr/bin/fb-test"], 30)
+            self.failUnless(retval.ok, "failed: Can't execute /usr/bin/fb-test")
 
         if cpu_is_imx6():
             time.sleep(1)
         else:
             time.sleep(2)
 
-        f.seek(0)
-        state_last = f.read()
-        events = po.poll(30000)
-        if not events:
+        if self.gpio_in.wait_edge(30) is None:
             exit_commands()
             self.fail("Error timeout, unable to get second button press")
 
@@ -122,10 +120,8 @@ class TestButton(unittest.TestCase):
         def exit_commands():
             self._testMethodDoc = "Test Button : Read User button action"
 
-            retval = commands.getstatusoutput("echo '\033[37mTest Button : Read User button action:  \033' > /dev/ttyO0")
-            self.failUnless(retval[0] == 0, "failed: Can't execute 'echo'")
-
-            f.close();
+            retval = write_tty("/dev/ttyO0", "\033[37mTest Button : Read User button action:  \033\n")
+            self.failUnless(retval, "failed: Can't execute 'echo'")
 
         self.gpio_in.set_direction("in")
         retval = self.gpio_in.get_direction()
@@ -137,15 +133,7 @@ class TestButton(unittest.TestCase):
         self.failUnless(retval == 'falling\n',
             "Error: Expected value 'falling' and readed %s" % retval)
 
-        f = open(os.path.join(self.gpio_in.sysfs, 'value'), 'r')
-
-        po = select.poll()
-        po.register(f, select.POLLPRI)
-
-        f.seek(0)
-        state_last = f.read()
-        events = po.poll(30000)
-        if not events:
+        if self.gpio_in.wait_edge(30) is None:
             exit_commands()
             self.fail("Error timeout, unable to get button press")
 
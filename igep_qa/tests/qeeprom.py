@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+EEPROM Test Cases modules for unittest
+
+"""
+
+import unittest
+
+from igep_qa.helpers.eeprom import QEeprom, read_identity, write_identity
+
+class TestEeprom(unittest.TestCase):
+    """ Generic Tests for I2C EEPROMs.
+
+    Keyword arguments:
+        - testname : The name of the test to be executed.
+        - i2cbus : The I2C bus number.
+        - address : The EEPROM I2C address (in hexadecimal)
+        - size : The size of the EEPROM, in bytes.
+        - page : The page size of the EEPROM, in bytes.
+        - identity : The QBoardIdentity to be programmed.
+        - testdescription: Optional test description to overwrite the default.
+
+    """
+
+    def __init__(self, testname, i2cbus, address='0x50', size=256, page=8,
+                 identity=None, testdescription=''):
+        super(TestEeprom, self).__init__(testname)
+        self.i2cbus = i2cbus
+        self.address = address
+        self.size = size
+        self.page = page
+        self.identity = identity
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = ['i2c-%s' % i2cbus]
+        # Overwrite test description
+        if testdescription:
+            self._testMethodDoc = testdescription
+
+    def setUp(self):
+        try:
+            self.eeprom = QEeprom(self.i2cbus, self.address, self.size,
+                                  self.page)
+        except OSError:
+            raise Exception("Can't find /dev/i2c-%s" % self.i2cbus)
+
+    def test_eeprom_read(self):
+        """ Test EEPROM : Read the whole EEPROM
+
+        Type: Functional
+
+        Description:
+            Reads all the EEPROM in block transfers.
+
+        """
+        try:
+            data = self.eeprom.read()
+        except IOError as e:
+            self.fail('failed: Cannot read EEPROM at I2C bus %s address %s: %s'
+                      % (self.i2cbus, self.address, e))
+        self.failUnless(len(data) == self.size,
+                        'failed: Read %d bytes, expected %d'
+                        % (len(data), self.size))
+
+    def test_eeprom_identity(self):
+        """ Test EEPROM : Check the board identity
+
+        Type: Functional
+
+        Description:
+            Reads the board identity (serial, OF, MAC and revision) and
+            validates its checksum. If an identity is given it has to be
+            the same.
+
+        """
+        try:
+            identity = read_identity(self.eeprom)
+        except (IOError, ValueError) as e:
+            self.fail('failed: No valid board identity: %s' % e)
+        if self.identity is not None:
+            self.failUnless(identity == self.identity,
+                            'failed: Board identity %s, expected %s'
+                            % (identity, self.identity))
+
+    def test_eeprom_program(self):
+        """ Test EEPROM : Program the board identity
+
+        Type: Functional
+
+        Description:
+            Writes the board identity, only the pages that change, and
+            verifies it.
+
+        """
+        if self.identity is None:
+            raise Exception("Can't find the board identity to be programmed")
+        try:
+            write_identity(self.eeprom, self.identity)
+            identity = read_identity(self.eeprom)
+        except (IOError, ValueError) as e:
+            self.fail('failed: Cannot program the board identity: %s' % e)
+        self.failUnless(identity == self.identity,
+                        'failed: Board identity %s, expected %s'
+                        % (identity, self.identity))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
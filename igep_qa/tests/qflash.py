@@ -5,10 +5,11 @@ Flash Test Cases modules for unittest
 
 """
 
-import commands
 import unittest
 import os
 
+from igep_qa.helpers.command import getstatusoutput
+
 class TestFlash(unittest.TestCase):
     """ Generic tests for flash devices.
 
@@ -26,6 +27,8 @@ class TestFlash(unittest.TestCase):
         self.file1 = file1
         self.file2 = file2
         self.file3 = file3
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = [dev_partition]
 
         # Overwrite test description
         if testdescription:
@@ -46,7 +49,7 @@ class TestFlash(unittest.TestCase):
             readed value is the same.
 
         """
-        retval = commands.getstatusoutput("nandtest " + self.dev_partition + " -k -l 0xE0000")
+        retval = getstatusoutput(["nandtest", self.dev_partition, "-k", "-l", "0xE0000"])
         self.failUnless(retval[0] == 0, "error: Failed writting nand")
 
     def test_ubifsfirmware(self):
@@ -61,10 +64,12 @@ class TestFlash(unittest.TestCase):
         """
         #  Mount UBIFS partition to mountdirectory
         mountdirectory = '/tmp/UBIFS'
-        retval = commands.getstatusoutput("ubiattach -p %s" % self.dev_partition)
+        retval = getstatusoutput(["ubiattach", "-p", self.dev_partition], 30)
         self.failUnless(retval[0] == 0, "error: Failed to attach UBIFS partition")
-        retval = commands.getstatusoutput("mkdir %s" % mountdirectory)
-        retval = commands.getstatusoutput("mount -t ubifs ubi0:filesystem %s" % mountdirectory)
+        if not os.path.isdir(mountdirectory):
+            os.mkdir(mountdirectory)
+        retval = getstatusoutput(["mount", "-t", "ubifs", "ubi0:filesystem",
+                                  mountdirectory], 30)
         self.failUnless(retval[0] == 0, "error: Failed to mount UBIFS partition")
         #  Test the readability of file1
         retval = os.access((mountdirectory + self.file1), os.R_OK)
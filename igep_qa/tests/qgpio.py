@@ -5,10 +5,9 @@ GPIO Test Cases modules for unittest
 
 """
 
-import time
 import unittest
 
-from igep_qa.helpers.gpiolib import QGpio
+from igep_qa.helpers.gpiolib import QGpio, wait_values
 
 class TestGpio(unittest.TestCase):
     """ Generic Tests for GPIOs.
@@ -23,6 +22,8 @@ class TestGpio(unittest.TestCase):
         super(TestGpio, self).__init__(testname)
         self.gpio_in = QGpio(gpio_in)
         self.gpio_out = QGpio(gpio_out)
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = ['gpio%s' % gpio_in, 'gpio%s' % gpio_out]
 
         # Overwrite test description
         if testdescription:
@@ -42,15 +43,129 @@ class TestGpio(unittest.TestCase):
 
         """
         self.gpio_out.set_value(1)
-        # a delay is required as the relay is slow
-        time.sleep(2)
-        retval = self.gpio_in.get_value()
+        # the relay is slow, wait up to 2 seconds until it settles
+        retval = wait_values([self.gpio_in], [1], timeout=2, settle=0.05)[0]
         self.failUnless(retval == 1, "failed: Expected value '1' and read '%s'" % retval)
         self.gpio_out.set_value(0)
-        # a delay is required as the relay is slow
-        time.sleep(2)
-        retval = self.gpio_in.get_value()
+        # the relay is slow, wait up to 2 seconds until it settles
+        retval = wait_values([self.gpio_in], [0], timeout=2, settle=0.05)[0]
         self.failUnless(retval == 0, "failed: Expected value '0' and read '%s'" % retval)
 
+class TestGpioMatrix(unittest.TestCase):
+    """ Loopback Tests for a matrix of GPIO pairs.
+
+    Keyword arguments:
+        - pairs: List of (gpio_out, gpio_in) GPIO numbers, every output is
+                 wired to its input.
+        - timeout: Maximum time to wait for the inputs on every step, in
+                   seconds.
+        - settle: Time the inputs must keep their value to be stable, in
+                  seconds.
+        - testdescription: Optional test description to overwrite the default.
+
+    """
+    def __init__(self, testname, pairs, timeout=0.5, settle=0.005, testdescription=''):
+        super(TestGpioMatrix, self).__init__(testname)
+        self.pairs = list(pairs)
+        self.outputs = [QGpio(out) for out, _ in self.pairs]
+        self.inputs = [QGpio(gpio_in) for _, gpio_in in self.pairs]
+        self.timeout = timeout
+        self.settle = settle
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = ['gpio%s' % gpio for pair in self.pairs for gpio in pair]
+
+        # Overwrite test description
+        if testdescription:
+            self._testMethodDoc = testdescription
+
+    def patterns(self):
+        """ Returns the list of output patterns to be driven.
+
+        All low, walking ones, all high and walking zeros.
+
+        """
+        n = len(self.pairs)
+        patterns = [[0] * n]
+        patterns += [[int(i == j) for j in range(n)] for i in range(n)]
+        patterns += [[1] * n]
+        patterns += [[int(i != j) for j in range(n)] for i in range(n)]
+        return patterns
+
+    def faults(self, steps):
+        """ Find the faults of every pair from the driven and read patterns.
+
+        Returns a dictionary, indexed by pair index, with the list of faults.
+
+        Keyword arguments:
+            - steps: List of (driven, read) patterns.
+
+        """
+        n = len(self.pairs)
+        faults = dict((i, []) for i in range(n))
+        stuck = { }
+        for j in range(n):
+            highs = [r[j] for d, r in steps if d[j] == 1]
+            lows = [r[j] for d, r in steps if d[j] == 0]
+            if not any(highs):
+                stuck[j] = 0
+                faults[j].append("stuck-at-0")
+            elif all(lows):
+                stuck[j] = 1
+                faults[j].append("stuck-at-1")
+        for driven, read in steps:
+            # with two pairs a walking one is a walking zero too, check both
+            # ways or the shorts pulling low would be missed
+            checks = [ ]
+            if driven.count(1) == 1:
+                # walking one, another input high is shorted with the driven pair
+                checks.append((driven.index(1), 1))
+            if driven.count(0) == 1:
+                # walking zero, another input low is shorted with the driven pair
+                checks.append((driven.index(0), 0))
+            for i, level in checks:
+                for j in range(n):
+                    if j == i or j in stuck or read[j] != level:
+                        continue
+                    short = "short with pair (out %s, in %s)" % self.pairs[i]
+                    if short not in faults[j]:
+                        faults[j].append(short)
+        for j in range(n):
+            if j in stuck or faults[j]:
+                continue
+            if any(r[j] != d[j] for d, r in steps):
+                faults[j].append("unstable")
+        return dict((i, f) for i, f in faults.items() if f)
+
+    def test_loopback_matrix(self):
+        """ Test GPIO Matrix: Test loopback of every GPIO pair
+
+        Type: Functional
+
+        Description:
+            This test suposes that there is a loopback between every output
+            and its input. The test drives a walking ones and a walking zeros
+            sequence in the outputs, after every step reads all the inputs
+            once they are stable and checks they follow the outputs. At the
+            end it reports the pairs stuck at low or high level and the pairs
+            shorted with each other.
+
+        """
+        for gpio in self.inputs:
+            gpio.set_direction("in")
+        steps = [ ]
+        current = [None] * len(self.pairs)
+        for pattern in self.patterns():
+            # only write the outputs that change
+            for i, value in enumerate(pattern):
+                if current[i] != value:
+                    self.outputs[i].set_value(value)
+            current = pattern
+            read = wait_values(self.inputs, pattern, self.timeout, self.settle)
+            steps.append((pattern, read))
+        faults = self.faults(steps)
+        self.failIf(faults, "failed: %s" % "; ".join(
+                    "pair (out %s, in %s): %s" % (self.pairs[i] + (", ".join(f), ))
+                    for i, f in sorted(faults.items())))
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
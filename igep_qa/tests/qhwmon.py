@@ -24,6 +24,8 @@ class TestHwmon(unittest.TestCase):
         self.sysfspath = sysfspath
         self.tmin = tmin
         self.tmax = tmax
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = [sysfspath]
         # Overwrite test description
         if testdescription:
             self._testMethodDoc = testdescription
@@ -5,9 +5,10 @@ I2C Test Cases modules for unittest
 
 """
 
-import commands
 import unittest
 
+from igep_qa.helpers.i2c import get_bus, probe_all
+
 class TestI2C(unittest.TestCase):
     """ Generic Tests for I2C interface.
 
@@ -18,9 +19,6 @@ class TestI2C(unittest.TestCase):
         - register : The device I2C register (in hexadecimal)
         - testdescription: Optional test description to overwrite the default.
 
-    Prerequisite commands:
-        - i2c-tools
-
     """
 
     def __init__(self, testname, i2cbus, address, register='', testdescription=''):
@@ -28,10 +26,19 @@ class TestI2C(unittest.TestCase):
         self.i2cbus = i2cbus
         self.address = address
         self.register = register
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = ['i2c-%s' % i2cbus]
         # Overwrite test description
         if testdescription:
             self._testMethodDoc = testdescription
 
+    def probe(self, register=None):
+        try:
+            bus = get_bus(self.i2cbus)
+        except OSError:
+            raise Exception("Can't find /dev/i2c-%s" % self.i2cbus)
+        return bus.probe(self.address, register)
+
     def test_i2cdetect(self):
         """ Test I2C : Check if device is at I2C bus at address.
 
@@ -41,9 +48,8 @@ class TestI2C(unittest.TestCase):
             Reads the <syspath>/name to check that devname is detected.
 
         """
-        retval = commands.getstatusoutput('i2cget -f -y %s %s'
-                                          % (self.i2cbus, self.address))
-        self.failUnless(retval[0] == 0,
+        retval = self.probe()
+        self.failUnless(retval.ok,
                         'failed: No device detected at I2C bus %s address %s'
                          % (self.i2cbus, self.address))
 
@@ -56,8 +62,40 @@ class TestI2C(unittest.TestCase):
             Reads a register to check I2C device.
 
         """
-        retval = commands.getstatusoutput('i2cget -f -y %s %s %s'
-                                          % (self.i2cbus, self.address, self.register))
-        self.failUnless(retval[0] == 0,
+        retval = self.probe(self.register)
+        self.failUnless(retval.ok,
                         'failed: Cannot read at I2C bus %s address and %s register %s'
-                         % (self.i2cbus, self.address, self.register))
\ No newline at end of file
+                         % (self.i2cbus, self.address, self.register))
+
+class TestI2CDevices(unittest.TestCase):
+    """ Probe a list of I2C devices in one pass.
+
+    Keyword arguments:
+        - testname : The name of the test to be executed.
+        - devices : List of (bus, address, register, expected) tuples, the
+                    register and the expected value can be None.
+        - testdescription: Optional test description to overwrite the default.
+
+    """
+
+    def __init__(self, testname, devices, testdescription=''):
+        super(TestI2CDevices, self).__init__(testname)
+        self.devices = devices
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = sorted(set('i2c-%s' % d[0] for d in devices))
+        # Overwrite test description
+        if testdescription:
+            self._testMethodDoc = testdescription
+
+    def test_i2c_devices(self):
+        """ Test I2C : Check all the devices at their I2C bus and address.
+
+        Type: Functional
+
+        Description:
+            Reads every device, or a register of it, and checks the value
+            read if there is an expected one.
+
+        """
+        failed = [str(r) for r in probe_all(self.devices) if not r.ok]
+        self.failIf(failed, 'failed: %s' % "; ".join(failed))
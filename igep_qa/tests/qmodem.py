@@ -24,6 +24,8 @@ class TestModem(unittest.TestCase):
     def __init__(self, testname, on, reset, pwrmon, port, testdescription=''):
         super(TestModem, self).__init__(testname)
         self.modem = QModemTelit(on, reset, pwrmon, port)
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = [port, 'gpio%s' % on, 'gpio%s' % reset, 'gpio%s' % pwrmon]
         # Overwrite test description
         if testdescription:
             self._testMethodDoc = testdescription
@@ -43,8 +45,28 @@ class TestModem(unittest.TestCase):
         # Now turn on the modem and send the cpin command
         self.modem.turn_on()
         retval = self.modem.at_cpin(5555)
-        self.failUnless(retval == 0, "failed: Expected '%s' and received '%s' "
-                        % (repr("at+cpin=5555\r\r\nOK\r\n"), repr(retval)))
+        self.failUnless(retval == 0, "failed: Expected 'OK' and received '%s' "
+                        % repr(retval))
+
+    def test_power_sequence(self):
+        """ Test Modem : Power off and on sequence
+
+        The modem is turned off and on again driven by the PWRMON edges and
+        the AT answers, the measured latencies are reported on failure.
+
+        """
+        retval = self.modem.turn_on()
+        self.failUnless(retval == 0, "failed: Can't turn on the modem")
+        retval = self.modem.turn_off()
+        self.failUnless(retval == 0, "failed: Can't turn off the modem, "
+                        "latencies %s" % self.latencies())
+        retval = self.modem.turn_on()
+        self.failUnless(retval == 0, "failed: Can't turn on the modem, "
+                        "latencies %s" % self.latencies())
+
+    def latencies(self):
+        return ", ".join("%s %.2f s" % (k, v) for k, v in
+                         sorted(self.modem.latencies.items()))
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -5,18 +5,20 @@ Network Test Cases modules for unittest
 
 """
 
-import commands
-import time
+import socket
 import unittest
 
 from igep_qa.helpers import common
+from igep_qa.helpers.netif import get_manager
+from igep_qa.helpers.netperf import PORT, ping, tcp_throughput, udp_throughput
 
 class TestNetwork(unittest.TestCase):
     """Generic tests for network interfaces.
 
     .. warning::
 
-        The interface is set up when the test start and set down when finishes.
+        The interface is set up when the test starts, and kept up for the
+        next tests using it, see igep_qa.helpers.netif
 
     Keyword arguments:
         - testname : The name of the test to be executed.
@@ -24,29 +26,32 @@ class TestNetwork(unittest.TestCase):
         - serverip : The remote IP address.
         - interface : The interface to be used, e.g. eth0, wlan0.
         - min_throughput : The minimum throughput required (in MBits)
-
-    Prerequisite commands:
-        - ifconfig
-        - iperf
-        - ping
+        - port : The port of the netperf server on the remote host, see
+                 igep_qa.helpers.netperf
+        - duration : Seconds of every throughput measure.
 
     """
-    def __init__(self, testname, ipaddr, serverip, interface, min_throughput=90):
+    def __init__(self, testname, ipaddr, serverip, interface, min_throughput=90,
+                 port=PORT, duration=5):
         super(TestNetwork, self).__init__(testname)
         self.ipaddr = ipaddr
         self.serverip = serverip
         self.interface = interface
         self.min_throughput = min_throughput
+        self.port = port
+        self.duration = duration
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = [interface]
 
     def setUp(self):
-        # Set up the interface
-        commands.getstatusoutput("ifconfig %s %s"
-                                "" % (self.interface, self.ipaddr))
-        # Use a small delay to be sure the interface is up
-        time.sleep(1)
+        # Set up the interface, if it is not yet, and wait for the link
+        if not get_manager().acquire(self.interface, self.ipaddr, 10):
+            # tearDown does not run when setUp fails
+            get_manager().release(self.interface)
+            self.fail("failed: No link on %s" % self.interface)
 
     def tearDown(self):
-        commands.getstatusoutput("ifconfig %s down" % self.interface)
+        get_manager().release(self.interface)
 
     def shortDescription(self):
         doc = self._testMethodDoc
@@ -62,11 +67,11 @@ class TestNetwork(unittest.TestCase):
             The test configures the 'interface' and then tries to send a echo 
             request ("ping") that is expected to be received back in an echo
             reply. For that, you must configure a remote host with proper IP
-            address. Finally the test downs the interface.
+            address.
 
         """
-        retval = commands.getstatusoutput("ping -c 3 %s" % self.serverip)
-        self.failUnless(retval[0] == 0, "failed: Pinging to %s" % self.serverip)
+        result = ping(self.serverip, count=3, timeout=3)
+        self.failUnless(result.ok, "failed: Pinging to %s" % str(result))
 
     def test_measure_throughput(self):
         """ Network : Measure the throughput and the quality of a network link.
@@ -74,19 +79,39 @@ class TestNetwork(unittest.TestCase):
         Type: Performance
 
         Description:
-            The test configures the interface and then uses 'iperf' to
+            The test configures the interface and then sends TCP data to
             measure the bandwidth. For that, you should configure a remote host
-            with proper address and start the iperf server ('iperf -s').
-            Then checks if the throughput is better than the specified. Finally
-            it downs the interface.
+            with proper address and start the netperf server
+            ('python -m igep_qa.helpers.netperf -s 0.0.0.0 5001').
+            Then checks if the throughput is better than the specified.
+
+        """
+        try:
+            result = tcp_throughput(self.serverip, self.port, self.duration)
+        except socket.error as e:
+            self.fail("failed: can't measure the throughput to %s: %s"
+                      % (self.serverip, e))
+        self.failIf(result.mbits < self.min_throughput,
+                    "failed: the throughput is less than %s Mbits: %s"
+                    % (self.min_throughput, str(result)))
+
+    def test_measure_udp_throughput(self):
+        """ Network : Measure the UDP throughput and the datagrams lost.
+
+        Type: Performance
+
+        Description:
+            The test configures the interface and then sends UDP datagrams,
+            as fast as the interface can, to the netperf server of the remote
+            host, see test_measure_throughput. Then checks if the throughput
+            received is better than the specified.
 
         """
-        retval, output = commands.getstatusoutput("iperf -x CMSV -c %s" % self.serverip)
-        self.failUnless(retval == 0, "Failed: iperf command returned non-zero value:\n%s" % output)
-        # Find the Mbits
-        start = output.find("MBytes")
-        self.failUnless(start > 0, "Failed: can't found MBytes string:\n%s" % output)
-        end = output.find("Mbits")
-        self.failUnless(end > 0, "Failed can't found Mbits string:\n%s" % output)
-        mbits = output[start + 8:end - 1]
-        self.failIf(float(mbits) < self.min_throughput, "Failed: the throughput is less than %s Mbits" % mbits)
+        try:
+            result = udp_throughput(self.serverip, self.port, self.duration)
+        except socket.error as e:
+            self.fail("failed: can't measure the throughput to %s: %s"
+                      % (self.serverip, e))
+        self.failIf(result.mbits < self.min_throughput,
+                    "failed: the throughput is less than %s Mbits: %s"
+                    % (self.min_throughput, str(result)))
@@ -5,13 +5,12 @@ Power Test Cases modules for unittest
 
 """
 
-import commands
 import socket
-import time
 import unittest
 
 from igep_qa.helpers import common
 from igep_qa.helpers import am33xx
+from igep_qa.helpers.netif import get_manager
 
 class TestPower(unittest.TestCase):
     """Generic tests for power interfaces.
@@ -24,9 +23,6 @@ class TestPower(unittest.TestCase):
         - port : The remote port to connect.
         - interface : The interface to be used, e.g. eth0, wlan0.
 
-    Prerequisite commands:
-        - ifconfig
-
     """
     def __init__(self, testname, max_current, ipaddr, serverip, port, interface):
         super(TestPower, self).__init__(testname)
@@ -35,16 +31,18 @@ class TestPower(unittest.TestCase):
         self.serverip = serverip
         self.port = port
         self.interface = interface
+        # No resources declared, see ParallelTestSuite: the test runs alone,
+        # otherwise the current drawn by other tests is also measured.
 
     def setUp(self):
-        # Set up the interface
-        commands.getstatusoutput("ifconfig %s %s"
-                                "" % (self.interface, self.ipaddr))
-        # Use a small delay to be sure the interface is up
-        time.sleep(1)
+        # Set up the interface, if it is not yet, and wait for the link
+        if not get_manager().acquire(self.interface, self.ipaddr, 10):
+            # tearDown does not run when setUp fails
+            get_manager().release(self.interface)
+            self.fail("failed: No link on %s" % self.interface)
 
     def tearDown(self):
-        commands.getstatusoutput("ifconfig %s down" % self.interface)
+        get_manager().release(self.interface)
 
     def test_max_current(self):
         """ Test Power : Check the maximum acceptable limit of current
@@ -54,8 +52,7 @@ class TestPower(unittest.TestCase):
         Description:
             The test configures the 'interface' and then tries to connect to
             server to request the current. Is expected that this value is
-            lower than the max_current parameter. Finally the test downs the
-            interface.
+            lower than the max_current parameter.
 
         """
         # Create a socket (SOCK_STREAM means a TCP socket)
@@ -5,22 +5,37 @@ Serial Test Cases modules for unittest
 
 """
 
-import time
 import serial
 import unittest
 
+from igep_qa.helpers.serialport import loopback, loopback_many
+
 class TestSerial(unittest.TestCase):
     """ Generic Tests for serial interface.
 
     Keyword arguments:
         - port: Serial device. E.g. /dev/ttyS0, /dev/ttyUSB0
+        - baudrate: The baud rate of the bulk loopback, by default the
+                    highest of the port up to 3000000 (see
+                    serialport.MAX_BAUDRATE), set it to the rate of the
+                    transceiver of the port.
+        - size: Number of bytes of the bulk loopback, by default half a
+                second of data.
+        - min_efficiency: Minimum throughput of the bulk loopback relative
+                          to the baud rate.
 
     """
-    def __init__(self, testname, port):
+    def __init__(self, testname, port, baudrate=None, size=None,
+                 min_efficiency=0.9):
         super(TestSerial, self).__init__(testname)
+        self.baudrate = baudrate
+        self.size = size
+        self.min_efficiency = min_efficiency
         self.port = serial.Serial(port, timeout=1)
         self.port.flushInput()
         self.port.flushOutput()
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = [port]
 
     def __del__(self):
         self.port.close()
@@ -44,13 +59,97 @@ class TestSerial(unittest.TestCase):
             - A range of numbers are sent for TX and should return to RX.
 
         """
-        for c in map(chr, range(32)):
-            self.port.write(c)
-            time.sleep(0.05)  # there might be a small delay
-            self.failUnless(self.port.inWaiting() == 1, "failed: Expected one "
-                            "character for inWainting()")
-            self.failUnless(self.port.read(1) == c, "failed: Expected a '%s' "
-                            "which was written before" % c)
+        data = "".join(map(chr, range(32)))
+        self.port.write(data)
+        # returns as soon as every character is back
+        retval = self.port.read(len(data))
+        self.failUnless(retval == data, "failed: Expected %s which was "
+                        "written before, got %s" % (repr(data), repr(retval)))
+        self.failUnless(self.port.inWaiting() == 0, "failed: Unexpected "
+                        "characters received")
+
+    def test_serial_bulk_loopback(self):
+        """ Test Serial : Bulk loopback at the highest baud rate
+
+        Type: Functional
+
+        Requirements:
+            A simple loopback hardware is required, shortcut these pin pairs:
+                TX  <-> RX (on a 9 pole DSUB are the pins 2-3)
+
+        Description:
+            - Connect the loopback hardware.
+            - A pseudo-random block is sent for TX and read back from RX at
+              the same time.
+            - No byte, framing, parity or overrun errors are allowed and the
+              throughput should be close to the baud rate.
+
+        """
+        self.port.close()
+        try:
+            result = loopback(self.port.portstr, self.baudrate, self.size)
+        finally:
+            self.port.open()
+        self.failUnless(result.ok, "failed: %s" % str(result))
+        self.failIf(result.efficiency < self.min_efficiency,
+                    "failed: Low throughput, %s" % str(result))
+
+class TestSerialPorts(unittest.TestCase):
+    """ Tests for several serial interfaces at the same time.
+
+    Keyword arguments:
+        - ports: List of serial devices. E.g. ['/dev/ttymxc1', '/dev/ttymxc3']
+        - baudrate: The baud rate of the bulk loopback, by default the
+                    highest of every port up to 3000000, see TestSerial.
+        - size: Number of bytes of the bulk loopback, by default half a
+                second of data.
+        - min_efficiency: Minimum throughput of the bulk loopback relative
+                          to the baud rate.
+
+    """
+    def __init__(self, testname, ports, baudrate=None, size=None,
+                 min_efficiency=0.9):
+        super(TestSerialPorts, self).__init__(testname)
+        self.ports = list(ports)
+        self.baudrate = baudrate
+        self.size = size
+        self.min_efficiency = min_efficiency
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = list(self.ports)
+
+    def shortDescription(self):
+        doc = self._testMethodDoc
+        doc = doc.replace("Test Serial", "Test Serial (%s)" % ", ".join(self.ports))
+        return doc and doc.split("\n")[0].strip() or None
+
+    def test_serial_bulk_loopback_many(self):
+        """ Test Serial : Bulk loopback of all the ports at the same time
+
+        Type: Functional
+
+        Requirements:
+            A simple loopback hardware is required on every port, shortcut
+            these pin pairs:
+                TX  <-> RX (on a 9 pole DSUB are the pins 2-3)
+
+        Description:
+            - Connect the loopback hardware.
+            - A pseudo-random block is sent for TX and read back from RX on
+              every port at the same time.
+            - No byte, framing, parity or overrun errors are allowed and the
+              throughput of every port should be close to its baud rate.
+
+        """
+        results = loopback_many(self.ports, self.baudrate, self.size)
+        failures = [ ]
+        for port, result in zip(self.ports, results):
+            if isinstance(result, Exception):
+                failures.append("%s: %s" % (port, result))
+            elif not result.ok:
+                failures.append(str(result))
+            elif result.efficiency < self.min_efficiency:
+                failures.append("Low throughput, %s" % str(result))
+        self.failIf(failures, "failed: %s" % "; ".join(failures))
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
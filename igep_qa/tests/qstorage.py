@@ -5,10 +5,13 @@ Block Storage Test Cases modules for unittest
 
 """
 
-import commands
 import os
 import unittest
 
+from igep_qa.helpers.blockdev import port_resource
+from igep_qa.helpers.storagebench import QStorageBench, link_speed
+from igep_qa.helpers.uevent import get_monitor
+
 class TestBlockStorage(unittest.TestCase):
     """ Generic Tests for Block Storage interfaces.
 
@@ -20,55 +23,125 @@ class TestBlockStorage(unittest.TestCase):
                       As example:
                          usb1/1-2/1-2.1
                       To check the sysfs device naming use the following command:
-                         udevadm info -q path -n /dev/<block device>
+                         readlink -f /sys/class/block/<block device>
         - testdescription: Optional test description to overwrite the default.
+        - timeout : Seconds to wait for the device to be plugged and mounted.
 
     """
-    def __init__(self, testname, sysfsname, testdescription=''):
+    def __init__(self, testname, sysfsname, testdescription='', timeout=10):
         super(TestBlockStorage, self).__init__(testname)
         self.sysfsname = sysfsname
         self.file = 'this_is_an_storage_device'
+        self.timeout = timeout
+        # listen to the uevents from now, while the previous tests run
+        get_monitor()
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = [port_resource(sysfsname)]
         # Overwrite test short description
         if testdescription:
             self._testMethodDoc = testdescription
 
+    def find_file(self):
+        # Returns the path of the file in a device of the port, or None if
+        # it does not appear before the timeout
+        return get_monitor().wait_file(self.sysfsname, self.file, self.timeout)
+
     def test_storage_device(self):
         """ Test Storage: Check for this_is_an_storage_device file
 
         Type: Functional
 
-        Prerequisite commands:
-            - udevadm
-
         Requirements:
             Use a Storage device with one FAT32 partition and create inside a
             file called this_is_an_storage_device exists.
 
-        Limitations:
-            This function only is able to detect 5 storage ports (from /dev/sda
-            to /dev/sde)
-
         Description:
             - Connect the storage to the port.
-            - Read if the file this_is_an_storage_device exists.
+            - Wait until the file this_is_an_storage_device exists.
 
         """
-        exists = False
-        for dev in [ '/dev/sda', '/dev/sdb', '/dev/sdc', '/dev/sdd', '/dev/sde' ]:
-            retval = commands.getstatusoutput('udevadm info -q path -n %s' % dev)
-            if self.sysfsname in retval[1]:
-                # find mountpoint
-                for mp in open('/proc/mounts', 'r'):
-                    # if device node is in mount point line
-                    if dev in mp:
-                        mntpoint = mp.split(' ')[1]
-                        # find file resides on mount point
-                        if os.path.isfile('%s/this_is_an_storage_device'
-                                               % mntpoint):
-                            exists = True
-                            break
-        self.assertTrue(exists, 'failed: file this_is_an_storage_device on '
+        self.assertTrue(self.find_file() is not None, 'failed: file this_is_an_storage_device on '
                         'port %s not found' % self.sysfsname)
 
+class TestStorageBenchmark(TestBlockStorage):
+    """ Throughput Tests for Block Storage interfaces.
+
+    Keyword arguments:
+        - testname : The name of the test to be executed.
+        - sysfsname : The sysfs device naming scheme, see TestBlockStorage.
+        - min_read : Minimum sequential read throughput, in MB/s.
+        - min_write : Minimum sequential write throughput, in MB/s.
+        - min_speed : Minimum link speed, in Mb/s, e.g. 480 for an USB high
+                      speed port or 3000 for a SATA II port.
+        - size : Bytes of the scratch file.
+        - testdescription: Optional test description to overwrite the default.
+
+    """
+    def __init__(self, testname, sysfsname, min_read=None, min_write=None,
+                 min_speed=None, size=16 * 1024 * 1024, testdescription=''):
+        super(TestStorageBenchmark, self).__init__(testname, sysfsname,
+                                                   testdescription)
+        self.min_read = min_read
+        self.min_write = min_write
+        self.min_speed = min_speed
+        self.size = size
+
+    def test_storage_link_speed(self):
+        """ Test Storage: Check the speed negotiated by the port
+
+        Type: Functional
+
+        Description:
+            - Connect the storage to the port.
+            - Read the link speed from sysfs (speed for USB, sata_spd for
+              SATA) and check it is at least the minimum of the port.
+
+        """
+        devices = get_monitor().wait_devices(self.sysfsname, self.timeout)
+        self.failUnless(devices, "failed: no storage device on port %s"
+                        % self.sysfsname)
+        speed = link_speed(devices[0].devpath)
+        self.failIf(speed is None, "failed: unknown link speed of port %s"
+                    % self.sysfsname)
+        self.failIf(self.min_speed is not None and speed < self.min_speed,
+                    "failed: link speed of port %s is %g Mb/s, expected at "
+                    "least %g Mb/s" % (self.sysfsname, speed, self.min_speed))
+
+    def test_storage_benchmark(self):
+        """ Test Storage: Sequential and random read/write throughput
+
+        Type: Performance
+
+        Requirements:
+            Use a Storage device with one FAT32 partition and create inside a
+            file called this_is_an_storage_device, with some free space for
+            a scratch file.
+
+        Description:
+            - Connect the storage to the port.
+            - Write and read a scratch file sequentially and randomly with
+              O_DIRECT, and check the sequential throughput is at least the
+              minimum of the port.
+
+        """
+        path = self.find_file()
+        self.failIf(path is None, "failed: file this_is_an_storage_device on "
+                    "port %s not found" % self.sysfsname)
+        bench = QStorageBench(os.path.dirname(path), self.size)
+        try:
+            results = bench.run()
+        finally:
+            bench.close()
+        report = "; ".join(str(results[mode]) for mode in
+                           ("read", "write", "randread", "randwrite"))
+        self.failIf(self.min_read is not None and
+                    results["read"].throughput < self.min_read,
+                    "failed: read throughput below %g MB/s: %s"
+                    % (self.min_read, report))
+        self.failIf(self.min_write is not None and
+                    results["write"].throughput < self.min_write,
+                    "failed: write throughput below %g MB/s: %s"
+                    % (self.min_write, report))
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
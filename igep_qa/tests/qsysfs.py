@@ -23,6 +23,8 @@ class TestSysfs(unittest.TestCase):
         super(TestSysfs, self).__init__(testname)
         self.sysfspath = sysfspath
         self.devname = devname
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = [sysfspath]
         # Overwrite test description
         if testdescription:
             self._testMethodDoc = testdescription
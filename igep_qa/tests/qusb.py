@@ -5,16 +5,35 @@ USB Test Cases modules for unittest
 
 """
 
-import commands
-import os
 import unittest
 
+from igep_qa.helpers.blockdev import port_resource
+from igep_qa.helpers.uevent import get_monitor
+
 class TestUSB(unittest.TestCase):
     """ Generic Tests for USB interface.
 
+    Keyword arguments:
+        - testname: The name of the test to be executed.
+        - timeout: Seconds to wait for the pendrive to be plugged and mounted.
+
     """
-    def __init__(self, testname):
+    # port of every test, a part of the sysfs path of the pendrive
+    PORTS = {'test_musb_omap': 'musb-omap', 'test_musb_hdrc': 'musb-hdrc',
+             'test_ehci_omap': 'ehci-omap'}
+
+    def __init__(self, testname, timeout=10):
         super(TestUSB, self).__init__(testname)
+        self.timeout = timeout
+        # listen to the uevents from now, while the previous tests run
+        get_monitor()
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = [port_resource(self.PORTS[testname])]
+
+    def find_file(self, port, filename):
+        # Returns the path of the file in a device of the port, or None if
+        # it does not appear before the timeout
+        return get_monitor().wait_file(port, filename, self.timeout)
 
     def test_musb_omap(self):
         """ Test USB OTG : Check for this_is_the_musb_omap_port file
@@ -30,20 +49,7 @@ class TestUSB(unittest.TestCase):
             - Read if the file this_is_the_musb_omap_port exists.
 
         """
-        exists = False
-        for dev in [ '/dev/sda1', '/dev/sdb1' ]:
-            retval = commands.getstatusoutput("udevadm info -q path -n %s" % dev)
-            if "musb-omap" in retval[1]:
-                # find mountpoint
-                for mp in open("/proc/mounts", "r"):
-                    # if device node is in mount point line
-                    if dev in mp:
-                        mntpoint = mp.split(" ")[1]
-                        # find file resides on mount point
-                        if os.path.isfile("%s/this_is_the_musb_omap_port"
-                                               % mntpoint):
-                            exists = True
-                            break
+        exists = self.find_file("musb-omap", "this_is_the_musb_omap_port") is not None
         self.assertTrue(exists, "failed: file this_is_the_musb_omap_port on "
                         "MUSB USB not found")
 
@@ -61,20 +67,7 @@ class TestUSB(unittest.TestCase):
             - Read if the file this_is_the_musb_omap_port exists.
 
         """
-        exists = False
-        for dev in [ '/dev/sda', '/dev/sdb' ]:
-            retval = commands.getstatusoutput("udevadm info -q path -n %s" % dev)
-            if "musb-hdrc" in retval[1]:
-                # find mountpoint
-                for mp in open("/proc/mounts", "r"):
-                    # if device node is in mount point line
-                    if dev in mp:
-                        mntpoint = mp.split(" ")[1]
-                        # find file resides on mount point
-                        if os.path.isfile("%s/this_is_the_musb_hdrc_port"
-                                               % mntpoint):
-                            exists = True
-                            break
+        exists = self.find_file("musb-hdrc", "this_is_the_musb_hdrc_port") is not None
         self.assertTrue(exists, "failed: file this_is_the_musb_hdrc_port on "
                         "MUSB USB not found")
 
@@ -83,9 +76,6 @@ class TestUSB(unittest.TestCase):
 
         Type: Functional
 
-        Prerequisite commands:
-            - udevadm
-
         Requirements:
             Use a USB pendrive with one FAT32 partition and create inside a
             file called this_is_the_ehci_omap_port.
@@ -95,20 +85,7 @@ class TestUSB(unittest.TestCase):
             - Read if the file this_is_the_ehci_port exists.
 
         """
-        exists = False
-        for dev in [ '/dev/sda1', '/dev/sdb1' ]:
-            retval = commands.getstatusoutput("udevadm info -q path -n %s" % dev)
-            if "ehci-omap" in retval[1]:
-                # find mountpoint
-                for mp in open("/proc/mounts", "r"):
-                    # if device node is in mount point line
-                    if dev in mp:
-                        mntpoint = mp.split(" ")[1]
-                        # find file resides on mount point
-                        if os.path.isfile("%s/this_is_the_ehci_omap_port"
-                                               % mntpoint):
-                            exists = True
-                            break
+        exists = self.find_file("ehci-omap", "this_is_the_ehci_omap_port") is not None
         self.assertTrue(exists, "failed: file this_is_the_ehci_omap_port on "
                         "EHCI USB not found")
 
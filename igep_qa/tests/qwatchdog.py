@@ -9,6 +9,8 @@ import commands
 import unittest
 import time
 
+from igep_qa.helpers.i2c import get_bus
+
 class TestWatchdog(unittest.TestCase):
     """ Generic Tests for Watchdog reboot.
 
@@ -20,9 +22,6 @@ class TestWatchdog(unittest.TestCase):
         - register : Optional device I2C register (in hexadecimal)
         - testdescription: Optional test description to overwrite the default.
 
-    Prerequisite commands:
-        - i2c-tools
-
     """
 
     def __init__(self, testname, device='', i2cbus='', address='', register='', testdescription=''):
@@ -54,11 +53,14 @@ class TestWatchdog(unittest.TestCase):
         """
 
         # Parse if IGEP0046 has rebooted before
-        retval = commands.getstatusoutput('i2cget -f -y %s %s %s'
-                                  % (self.i2cbus, self.address, self.register))
-        self.failUnless(retval[0] == 0, "failed: Can't execute 'i2cget'")
-
-        if not retval[1] == '0x89':
+        try:
+            bus = get_bus(self.i2cbus)
+            value = bus.read_byte_data(self.address, self.register)
+        except (OSError, IOError) as e:
+            self.fail("failed: Cannot read at I2C bus %s address %s register "
+                      "%s: %s" % (self.i2cbus, self.address, self.register, e))
+
+        if not value == 0x89:
             # Board need to be rebooted
             retval = commands.getstatusoutput("reset > /dev/tty0")
             self.failUnless(retval[0] == 0, "failed: Can't execute 'reset > /dev/tty0'")
@@ -67,11 +69,12 @@ class TestWatchdog(unittest.TestCase):
             retval = commands.getstatusoutput("echo '\033[37mTest IGEP0046 Watchdog : If board does not reboot after 20 seconds. Test IGEP0046 Watchdog : FAIL. \033' > /dev/tty0")
             self.failUnless(retval[0] == 0, "failed: Can't execute 'echo'")
             # Set magic number
-            retval = commands.getstatusoutput('i2cset -f -y %s %s %s 0x89'
-                                      % (self.i2cbus, self.address, self.register))
-            self.failUnless(retval[0] == 0,
-                        'failed: Cannot read at I2C bus %s address and %s register %s'
-                         % (self.i2cbus, self.address, self.register))
+            try:
+                bus.write_byte_data(self.address, self.register, 0x89)
+            except IOError as e:
+                self.fail('failed: Cannot write at I2C bus %s address %s '
+                          'register %s: %s' % (self.i2cbus, self.address,
+                                               self.register, e))
             # Reboot (enable watchdog)
             retval = commands.getstatusoutput('reboot')
             self.failUnless(retval[0] == 0,
@@ -5,9 +5,10 @@ Wifi Test Cases modules for unittest
 
 """
 
-import commands
 import unittest
 
+from igep_qa.helpers.command import getstatusoutput
+
 class TestWiFi(unittest.TestCase):
     """ Generic tests for wifi interfaces.
 
@@ -36,6 +37,8 @@ class TestWiFi(unittest.TestCase):
         self.essid = essid
         self.ipaddr = ipaddr
         self.password = password
+        # Hardware resources held by the test, see ParallelTestSuite
+        self.resources = ['wlan0']
 
     def test_ping_host(self):
         """  Test WiFi : Ping the IP address of a remote host
@@ -49,17 +52,17 @@ class TestWiFi(unittest.TestCase):
             configure a remote dhcp server.
 
         """
-        retval = commands.getstatusoutput("ip link set wlan0 down")
+        retval = getstatusoutput(["ip", "link", "set", "wlan0", "down"], 10)
         self.failUnless(retval[0] == 0, "failed: Can't down interface wlan0")
-        retval = commands.getstatusoutput("iwconfig wlan0 essid %s channel 1"
-                                          "" % self.essid)
+        retval = getstatusoutput(["iwconfig", "wlan0", "essid", self.essid,
+                                  "channel", "1"], 10)
         self.failUnless(retval[0] == 0, "failed: No wlan0 interface found.")
-        retval = commands.getstatusoutput("udhcpc -n -i wlan0")
+        retval = getstatusoutput(["udhcpc", "-n", "-i", "wlan0"], 30)
         self.failUnless(retval[0] == 0, "failed: Can't get ip address from "
                         "server")
-        retval = commands.getstatusoutput("ping -c 3 %s" % self.serverip)
+        retval = getstatusoutput(["ping", "-c", "3", self.serverip], 15)
         self.failUnless(retval[0] == 0, "failed: Pinging to %s" % self.serverip)
-        retval = commands.getstatusoutput("ifconfig wlan0 down")
+        retval = getstatusoutput(["ifconfig", "wlan0", "down"], 10)
         self.failUnless(retval[0] == 0, "failed: Can't down interface wlan0")
 
     def test_scan_for_essid(self):
@@ -72,14 +75,14 @@ class TestWiFi(unittest.TestCase):
             a WiFi ESSID, after that set down the 'interface'.
 
         """
-        retval = commands.getstatusoutput("ip link set wlan0 down")
+        retval = getstatusoutput(["ip", "link", "set", "wlan0", "down"], 10)
         self.failUnless(retval[0] == 0, "failed: Can't down interface wlan0")
-        retval = commands.getstatusoutput("ip link set wlan0 up")
+        retval = getstatusoutput(["ip", "link", "set", "wlan0", "up"], 10)
         self.failUnless(retval[0] == 0, "failed: No wlan0 interface found.")
-        retval = commands.getstatusoutput("iw dev wlan0 scan")
+        retval = getstatusoutput(["iw", "dev", "wlan0", "scan"], 30)
         self.failUnless(retval[0] == 0, "failed: Is not possible to scan.")
         self.failUnless(self.essid in retval[1], "failed: ESSID %s not found." % self.essid)
-        retval = commands.getstatusoutput("ip link set wlan0 down")
+        retval = getstatusoutput(["ip", "link", "set", "wlan0", "down"], 10)
         self.failUnless(retval[0] == 0, "failed: Can't down the interface.")
 
     def test_adhoc_with_wep_encryption(self):
@@ -102,19 +105,21 @@ class TestWiFi(unittest.TestCase):
             otherwise the test may fail.
 
         """
-        # retval = commands.getstatusoutput("ip link set wlan0 down")
+        # retval = getstatusoutput(["ip", "link", "set", "wlan0", "down"], 10)
         # self.failUnless(retval[0] == 0, "failed: Can't down interface wlan0")
-        retval = commands.getstatusoutput("ip link set wlan0 up")
+        retval = getstatusoutput(["ip", "link", "set", "wlan0", "up"], 10)
         self.failUnless(retval[0] == 0, "failed: No wlan0 interface found.")
-        retval = commands.getstatusoutput("iw wlan0 set type ibss")
+        retval = getstatusoutput(["iw", "wlan0", "set", "type", "ibss"], 10)
         self.failUnless(retval[0] == 0, "failed: %s" % retval[1])
-        commands.getstatusoutput("ifconfig wlan0 %s" % self.ipaddr)
+        getstatusoutput(["ifconfig", "wlan0", self.ipaddr], 10)
         # For now there are some fixed parameters like channel and key
-        retval = commands.getstatusoutput("iw wlan0 ibss join %s 2422 key d:0:a2PheIrWs23-f" % self.essid)
+        retval = getstatusoutput(["iw", "wlan0", "ibss", "join", self.essid, "2422",
+                                  "key", "d:0:a2PheIrWs23-f"], 10)
         self.failUnless(retval[0] == 0, "failed: %s" % retval[1])
-        retval = commands.getstatusoutput("ping -I wlan0 -c 5 -s 8096 %s" % self.serverip)
+        retval = getstatusoutput(["ping", "-I", "wlan0", "-c", "5", "-s", "8096",
+                                  self.serverip], 20)
         self.failUnless(retval[0] == 0, "failed: Pinging to %s" % self.serverip)
-        # retval = commands.getstatusoutput("ip link set wlan0 down")
+        # retval = getstatusoutput(["ip", "link", "set", "wlan0", "down"], 10)
         # self.failUnless(retval[0] == 0, "failed: Can't down interface wlan0")
 
     def test_ap_with_wep_encryption(self):
@@ -127,15 +132,17 @@ class TestWiFi(unittest.TestCase):
             then tries to send a echo request ("ping") that is expected to
             be received back in an echo reply.
         """
-        retval = commands.getstatusoutput("ifconfig wlan0 up")
+        retval = getstatusoutput(["ifconfig", "wlan0", "up"], 10)
         self.failUnless(retval[0] == 0, "failed: No wlan0 interface found.")
-        retval = commands.getstatusoutput("ifconfig wlan0 %s" % self.ipaddr)
+        retval = getstatusoutput(["ifconfig", "wlan0", self.ipaddr], 10)
         self.failUnless(retval[0] == 0, "failed: wlan0 interface cannot set ipaddr.")
-        retval = commands.getstatusoutput("iw wlan0 connect %s key 0:%s" % (self.essid, self.password))
+        retval = getstatusoutput(["iw", "wlan0", "connect", self.essid, "key",
+                                  "0:%s" % self.password], 10)
         self.failUnless(retval[0] == 0, "failed: wlan0 cannot connect to hotspot: %s." % self.essid)
-        retval = commands.getstatusoutput("ping -I wlan0 -c 5 -s 8096 %s" % self.serverip)
+        retval = getstatusoutput(["ping", "-I", "wlan0", "-c", "5", "-s", "8096",
+                                  self.serverip], 20)
         self.failUnless(retval[0] == 0, "failed: Pinging to %s" % self.serverip)
-        retval = commands.getstatusoutput("ifconfig wlan0 down")
+        retval = getstatusoutput(["ifconfig", "wlan0", "down"], 10)
         self.failUnless(retval[0] == 0, "failed: Can't down interface wlan0.")
 
 if __name__ == '__main__':
@@ -33,8 +33,9 @@ do_start() {
 	echo "Starting ${NAME} ..."
 	read CMDLINE < /proc/cmdline
 	echo "Running ${NAME} ..."
-	# TODO: remove sleep and use more elegant solution
-	sleep 5
+	# Wait for the devices found at boot, the tests wait for the devices
+	# they need (e.g. pendrives) as they appear, see igep_qa.helpers.uevent
+	udevadm settle --timeout=10
 	for x in ${CMDLINE}; do
 		case ${x} in
 			autotest=IGEP0020)
@@ -108,7 +109,7 @@ do_start() {
 				clear > /dev/tty0
 				# FIXME: Enable USB Host power to avoid "musb-hdrc musb-hdrc.2.auto: Babble" issue
 				echo enabled > /sys/devices/platform/regulators/regulators\:fixedregulator\@4/regulator/regulator.19/userspace-consumer\@1-usb_power/state
-				sleep 4
+				udevadm settle --timeout=10
 				read BOARDMODEL < /sys/firmware/devicetree/base/model
 				if [ "$BOARDMODEL" = "ISEE IGEP SMARC AM3354 Kit" ]; then
 					# fb-test is a dependency for IGEP0034 (FULL) test